@@ -2,17 +2,99 @@ import os
 import re
 import time
 import json
+import math
 import sqlite3
+import difflib
+import hashlib
+import contextvars
 import pandas as pd
-from dotenv import load_dotenv
-from openai import OpenAI
-from db_schema import get_db_connection
+from functools import lru_cache
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from db_schema import compact_sentiment_history, get_db_connection
+from movie_snapshot import rebuild_movie_snapshot
+from search_index import index_movie_summary
+from scene_extraction import split_scene_texts
+from script_normalizer import PAGE_BREAK, normalize_script
+from scene_ranker import select_segments
+from single_flight import run_single_flight
+from llm_client import (LLMError, chat, estimate_tokens, plan_input_budget, planning_model, route_model,
+                        set_call_context, reset_call_context)
 
-# 환경 변수 로드
-load_dotenv()
+# 서로 독립적인 분석 단계의 동시 실행 수
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", 4))
 
-# OpenAI 클라이언트 초기화
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# 긴 스크립트 요약 방식 (mapreduce: 장면 단위 전체 요약, sample: 핵심 장면만 요약)
+SUMMARY_MODE = os.getenv("AI_SUMMARY_MODE", "mapreduce")
+
+# 단계별 최대 출력 토큰
+SUMMARY_OUTPUT_TOKENS = 1500
+MAP_OUTPUT_TOKENS = 500
+REDUCE_OUTPUT_TOKENS = 800
+
+# 발췌 시 입력 예산을 최소 이 개수 이상의 구간으로 나눠 고름
+EXCERPT_MIN_SEGMENTS = 8
+
+# 내용 기반 청크 경계: 장면 해시를 이 값으로 나눈 나머지가 0이면 청크를 끊음
+# (앞쪽 장면이 수정돼도 뒤쪽 청크 경계가 그대로 유지됨)
+CHUNK_BOUNDARY_DIVISOR = 3
+
+# 청크에 이 개수보다 적은 장면이 모였을 때는 내용 기반 경계를 두지 않음
+# (토큰 추정 보정값이 바뀌어도 경계가 흔들리지 않도록 장면 수로 판단)
+CHUNK_MIN_SEGMENTS = 2
+
+# 청크 출처를 기록하는 분석 결과 종류
+SOURCE_ARTIFACTS = ("summary", "structured", "characters", "sentiment")
+
+# 분석 결과별로 요청에 실제로 넣은 입력 조각의 해시를 모으는 곳 (분석 함수가 설정, 설정하지 않으면 기록하지 않음)
+_analysis_sources = contextvars.ContextVar("analysis_sources", default=None)
+
+# 리듀스 단계에서 한 번에 통합할 부분 요약 수
+REDUCE_GROUP_SIZE = 6
+
+# 여러 영화를 일괄 분석할 때 동시에 분석할 영화 수
+AI_BATCH_CONCURRENCY = int(os.getenv("AI_BATCH_CONCURRENCY", 2))
+
+# 진행 이벤트에 쓰이는 분석 단계와 화면 표시 이름
+AI_STAGE_LABELS = {
+    "summary": "요약",
+    "structured": "구조화 데이터",
+    "characters": "등장인물 관계",
+    "character_tree": "관계도",
+    "sentiment": "감정 분석",
+    "save": "저장"
+}
+
+# 스크립트 하나의 맵 단계 입력 토큰 예산
+SCRIPT_TOKEN_BUDGET = int(os.getenv("AI_SCRIPT_TOKEN_BUDGET", 60000))
+
+# 예산을 넘으면 모든 청크를 같은 비율로 줄이고, 비율은 이 단위로 내림 (작은 수정으로 모든 청크 해시가 바뀌지 않도록)
+CONDENSE_RATIO_STEP = 0.05
+
+# 청크를 줄일 때 고르는 문장 단위
+SENTENCE_PATTERN = re.compile(r'(?<=[.!?…])\s+')
+
+# 분석 방식 (staged: 단계별 개별 호출, combined: 청크마다 요약/인물/관계/줄거리/주제/감정을 JSON 스키마 호출 한 번으로 요청)
+AI_ANALYSIS_MODE = os.getenv("AI_ANALYSIS_MODE", "staged")
+
+# 통합 분석 호출의 최대 출력 토큰
+COMBINED_OUTPUT_TOKENS = 1200
+
+# 분석 결과 순서와 같은 진행 이벤트 단계
+ANALYSIS_STAGES = ("summary", "structured", "characters", "character_tree", "sentiment")
+
+# 통합 분석 결과에서 남길 주제 수, 줄거리 요소 수, 감정 변화 구간 수와 관계도에 넣을 최대 인물 수
+COMBINED_MAX_THEMES = 5
+COMBINED_MAX_PLOT_POINTS = 12
+COMBINED_ARC_SEGMENTS = 5
+TREE_MAX_CHARACTERS = 10
+
+# 인물 이름 뒤에 붙는 호칭 (관계의 인물 이름을 등장인물과 맞출 때 떼어 냄)
+NAME_TITLES = ("씨", "님", "군", "양", "형", "누나", "언니", "오빠", "선배", "팀장", "반장", "형사", "사장", "대표",
+               "과장", "부장", "실장")
+
+# 이름이 별칭과 정확히 맞지 않을 때 같은 인물로 보는 최소 유사도 (difflib 비율)
+ALIAS_MATCH_CUTOFF = 0.8
 
 def clean_script_text(text):
     """스크립트 텍스트 정리"""
@@ -22,6 +104,12 @@ def clean_script_text(text):
     text = re.sub(r'\b\d+\s*/\s*\d+\b', '', text)
     return text.strip()
 
+def prepare_script_text(text):
+    """머리글/바닥글 등 레이아웃 잡음을 지운 스크립트와 (절약한 토큰 수를 더한) 정규화 통계 반환"""
+    normalized, stats = normalize_script(text)
+    tokens_saved = estimate_tokens(clean_script_text(text)) - estimate_tokens(clean_script_text(normalized))
+    return normalized, dict(stats, tokens_saved=tokens_saved)
+
 def chunk_text(text, max_chunk_size=8000):
     """텍스트를 적절한 크기로 분할"""
     # PDF가 너무 길면 처음과 중간, 끝부분만 분석
@@ -55,6 +143,205 @@ def chunk_text(text, max_chunk_size=8000):
     
     return chunks
 
+def split_script_segments(text, max_segment_tokens):
+    """스크립트를 장면 단위로 정리해 나누고 토큰 상한을 넘는 장면은 다시 분할"""
+    scenes = split_scene_texts(text) or [{"text": text}]
+    
+    segments = []
+    for scene in scenes:
+        scene_text = clean_script_text(scene["text"])
+        if not scene_text:
+            continue
+        
+        tokens = estimate_tokens(scene_text)
+        if tokens <= max_segment_tokens:
+            segments.append(scene_text)
+            continue
+        
+        # 한 장면이 상한보다 길면 추정 토큰 비율에 맞춰 글자 단위로 분할
+        piece_chars = max(1, len(scene_text) * max_segment_tokens // tokens)
+        segments.extend(scene_text[i:i + piece_chars] for i in range(0, len(scene_text), piece_chars))
+    
+    return segments
+
+def _is_chunk_boundary(segment):
+    """장면 내용의 해시로 청크 경계 여부 결정"""
+    digest = hashlib.md5(segment.encode("utf-8")).hexdigest()
+    return int(digest[:8], 16) % CHUNK_BOUNDARY_DIVISOR == 0
+
+def chunk_scenes(text, max_chunk_tokens=None):
+    """장면 경계를 기준으로 스크립트를 토큰 예산 크기의 청크로 분할 (경계는 장면 내용으로 결정)"""
+    if max_chunk_tokens is None:
+        max_chunk_tokens = plan_input_budget("summary_map", planning_model("summary_map"), MAP_OUTPUT_TOKENS)
+    
+    chunks = []
+    current_chunk = []
+    current_tokens = 0
+    
+    for segment in split_script_segments(text, max_chunk_tokens):
+        segment_tokens = estimate_tokens(segment)
+        if current_chunk and current_tokens + segment_tokens > max_chunk_tokens:
+            chunks.append(' '.join(current_chunk))
+            current_chunk = []
+            current_tokens = 0
+        current_chunk.append(segment)
+        current_tokens += segment_tokens
+        
+        # 수정된 장면 주변 청크만 바뀌도록 장면 내용으로 경계를 정함
+        if len(current_chunk) >= CHUNK_MIN_SEGMENTS and _is_chunk_boundary(segment):
+            chunks.append(' '.join(current_chunk))
+            current_chunk = []
+            current_tokens = 0
+    
+    if current_chunk:
+        chunks.append(' '.join(current_chunk))
+    
+    return chunks
+
+def source_hash(text):
+    """요청에 넣은 입력 조각(발췌 구간, 한 번에 보낸 전체 텍스트)의 해시"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def record_sources(artifact, hashes):
+    """현재 분석에서 결과 하나를 만드는 데 실제로 쓴 입력 조각 해시 기록"""
+    sources = _analysis_sources.get()
+    if sources is not None:
+        sources[artifact] = list(hashes)
+
+def plan_script_excerpt(text, stage, model=None, max_output_tokens=1000, fixed_text=""):
+    """단계별 토큰 예산 안에서 정보량이 높은 장면을 골라 발췌문 생성 (예산 안이면 전체, 모델을 주지 않으면 단계별 선택표의 모델 기준, 고른 구간은 단계 이름으로 출처 기록)"""
+    budget = plan_input_budget(stage, model or planning_model(stage), max_output_tokens, fixed_text)
+    segments = split_script_segments(text, max(budget // EXCERPT_MIN_SEGMENTS, 1))
+    # 구간마다 이어 붙일 구분 문자 몫으로 1토큰씩 더함
+    tokens = [estimate_tokens(segment) + 1 for segment in segments]
+    
+    if sum(tokens) <= budget:
+        record_sources(stage, [source_hash(segment) for segment in segments])
+        return ' '.join(segments)
+    
+    # TF-IDF/TextRank 점수로 핵심 장면과 대사를 예산이 찰 때까지 선택
+    selected = select_segments(segments, tokens, budget)
+    record_sources(stage, [source_hash(segments[i]) for i in selected])
+    return _join_selected(segments, selected)
+
+def _join_selected(segments, selected):
+    """고른 구간을 원래 순서대로 이어 붙이고 건너뛴 구간은 생략 표시"""
+    excerpt = ""
+    previous = None
+    for i in selected:
+        if previous is not None:
+            excerpt += " " if i == previous + 1 else "\n\n...\n\n"
+        excerpt += segments[i]
+        previous = i
+    return excerpt
+
+def group_summaries(summaries, max_tokens, max_items=REDUCE_GROUP_SIZE):
+    """부분 요약을 순서대로 토큰 예산과 최대 개수 안에서 묶음"""
+    groups = []
+    current_group = []
+    current_tokens = 0
+    
+    for summary in summaries:
+        summary_tokens = estimate_tokens(summary)
+        if current_group and (len(current_group) >= max_items or current_tokens + summary_tokens > max_tokens):
+            groups.append(current_group)
+            current_group = []
+            current_tokens = 0
+        current_group.append(summary)
+        current_tokens += summary_tokens
+    
+    if current_group:
+        groups.append(current_group)
+    
+    return groups
+
+def condense_chunk(chunk, budget):
+    """청크에서 정보량이 높은 문장을 골라 예산 안으로 줄임 (원래 순서 유지, 문장이 하나뿐이면 앞부분만)"""
+    sentences = [sentence for sentence in SENTENCE_PATTERN.split(chunk) if sentence]
+    tokens = [estimate_tokens(sentence) + 1 for sentence in sentences]
+    if sum(tokens) <= budget:
+        return chunk
+    if len(sentences) < 2:
+        return chunk[:len(chunk) * budget // max(tokens[0], 1)]
+    return _join_selected(sentences, select_segments(sentences, tokens, budget))
+
+def fit_chunks_to_budget(chunks, token_budget=SCRIPT_TOKEN_BUDGET):
+    """토큰 예산을 넘으면 청크를 빼지 않고 모든 청크를 같은 비율로 줄여 스크립트 전체를 다룸"""
+    tokens = [estimate_tokens(chunk) for chunk in chunks]
+    if sum(tokens) <= token_budget:
+        return chunks
+    
+    # 생략 표시가 더해져 예산을 넘으면 비율을 한 단계씩 낮춤
+    ratio = math.floor(token_budget / sum(tokens) / CONDENSE_RATIO_STEP) * CONDENSE_RATIO_STEP
+    while True:
+        condensed = [condense_chunk(chunk, max(1, int(chunk_tokens * ratio))) for chunk, chunk_tokens in zip(chunks, tokens)]
+        if ratio <= CONDENSE_RATIO_STEP or sum(estimate_tokens(chunk) for chunk in condensed) <= token_budget:
+            return condensed
+        ratio -= CONDENSE_RATIO_STEP
+
+@lru_cache(maxsize=8)
+def script_chunks(text):
+    """맵 단계에 쓸 스크립트 청크 목록 (같은 텍스트는 다시 나누지 않음)"""
+    return tuple(fit_chunks_to_budget(chunk_scenes(text)))
+
+def chunk_hash(chunk, model=None):
+    """정규화된 청크 텍스트와 모델(기본은 맵 단계 모델)로 청크 해시 생성"""
+    model = model or route_model("summary_map")
+    return hashlib.sha256(f"{model}\n{chunk}".encode("utf-8")).hexdigest()
+
+def load_chunk_summaries(hashes, model=None):
+    """저장된 청크 요약 조회 (해시 -> 요약)"""
+    if not hashes:
+        return {}
+    model = model or route_model("summary_map")
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    placeholders = ", ".join("?" for _ in hashes)
+    cursor.execute(f"""
+        SELECT chunk_hash, summary FROM chunk_summaries
+        WHERE model = ? AND chunk_hash IN ({placeholders})
+    """, (model, *hashes))
+    stored = dict(cursor.fetchall())
+    conn.close()
+    return stored
+
+def save_chunk_summaries(summaries, model=None):
+    """청크 요약 저장 (해시 -> 요약)"""
+    if not summaries:
+        return
+    model = model or route_model("summary_map")
+    
+    conn = get_db_connection()
+    conn.executemany("""
+        INSERT OR REPLACE INTO chunk_summaries (chunk_hash, model, summary)
+        VALUES (?, ?, ?)
+    """, [(hash_value, model, summary) for hash_value, summary in summaries.items()])
+    conn.commit()
+    conn.close()
+
+def save_analysis_sources(conn, movie_id, sources):
+    """분석 결과별로 사용한 입력 조각 해시 기록 (결과 종류 -> 해시 목록, 커밋은 호출한 쪽에서 수행)"""
+    cursor = conn.cursor()
+    for artifact in SOURCE_ARTIFACTS:
+        if artifact not in sources:
+            continue
+        cursor.execute("DELETE FROM analysis_sources WHERE movie_id = ? AND artifact = ?", (movie_id, artifact))
+        cursor.executemany("""
+            INSERT INTO analysis_sources (movie_id, artifact, position, chunk_hash)
+            VALUES (?, ?, ?, ?)
+        """, [(movie_id, artifact, position, hash_value) for position, hash_value in enumerate(sources[artifact])])
+
+def count_changed_chunks(movie_id, hashes, artifact="summary"):
+    """이전 분석 이후 새로 생기거나 바뀐 입력 조각 수 (이전 분석이 없으면 전체)"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT chunk_hash FROM analysis_sources WHERE movie_id = ? AND artifact = ?",
+                   (movie_id, artifact))
+    previous = {row[0] for row in cursor.fetchall()}
+    conn.close()
+    return sum(1 for hash_value in hashes if hash_value not in previous)
+
 def extract_text_from_pdf(pdf_file):
     """PDF 파일에서 텍스트 추출"""
     try:
@@ -65,15 +352,38 @@ def extract_text_from_pdf(pdf_file):
         else:  # 업로드된 파일 객체
             reader = PdfReader(pdf_file)
             
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-        return text
+        # 페이지 통계로 머리글/바닥글을 찾을 수 있도록 페이지 사이에 구분 문자를 넣음
+        pages = [(page.extract_text() or "").replace(PAGE_BREAK, " ") for page in reader.pages]
+        return f"\n{PAGE_BREAK}\n".join(pages) + "\n"
     except Exception as e:
         return f"PDF 파일 처리 중 오류 발생: {str(e)}"
 
-def summarize_script(text, debug=False):
-    """스크립트 요약"""
+def build_summary_request(text):
+    """요약 요청 생성 (예산을 넘는 스크립트는 핵심 장면 발췌)"""
+    cleaned_text = clean_script_text(text)
+    
+    if estimate_tokens(cleaned_text) <= plan_input_budget("summary", planning_model("summary"), SUMMARY_OUTPUT_TOKENS):
+        record_sources("summary", [source_hash(cleaned_text)])
+        messages = [
+            {"role": "system", "content": "당신은 영화/드라마 스크립트 분석 전문가입니다. 주어진 스크립트를 분석하여 다음 정보를 추출해 주세요: 1) 주요 인물과 관계, 2) 주요 사건과 줄거리, 3) 주제와 메시지."},
+            {"role": "user", "content": f"다음 스크립트를 분석해 주세요:\n\n{cleaned_text}"}
+        ]
+    else:
+        excerpt = plan_script_excerpt(text, "summary", max_output_tokens=SUMMARY_OUTPUT_TOKENS)
+        messages = [
+            {"role": "system", "content": "당신은 효율적인 스크립트 분석 전문가입니다. 긴 스크립트의 핵심 내용을 빠르게 분석해야 합니다."},
+            {"role": "user", "content": f"다음은 스크립트 전체에서 핵심 장면을 발췌한 내용입니다('...'는 생략된 부분). 이를 보고 전체 내용을 추론하여 분석해주세요. 주요 인물, 관계, 사건, 줄거리, 주제를 파악하세요:\n\n{excerpt}"}
+        ]
+    
+    return {
+        "model": route_model("summary", messages),
+        "messages": messages,
+        "temperature": 0.5,
+        "max_tokens": SUMMARY_OUTPUT_TOKENS
+    }
+
+def summarize_script(text, debug=False, mode=None, on_partial=None, chunks=None):
+    """스크립트 요약 (on_partial을 주면 지금까지 만든 요약을 중간중간 전달, chunks를 주면 맵 단계에 그 청크 사용)"""
     if not text or len(text) < 100:
         return "텍스트가 너무 짧거나 없습니다."
     
@@ -81,76 +391,23 @@ def summarize_script(text, debug=False):
         # 텍스트 청소
         cleaned_text = clean_script_text(text)
         
-        # 처리 시간 단축을 위해 더 효율적인 방법 사용
-        # 텍스트가 매우 길면 처음, 중간, 끝 부분만 사용
-        if len(cleaned_text) > 12000:
-            # 직접 API로 전체 내용 요약 시도
-            if debug: print("🔄 텍스트가 매우 길어 처음/중간/끝 부분만 분석합니다.")
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo", # 더 빠른 모델 사용
-                messages=[
-                    {"role": "system", "content": "당신은 효율적인 스크립트 분석 전문가입니다. 긴 스크립트의 핵심 내용을 빠르게 분석해야 합니다."},
-                    {"role": "user", "content": f"다음 스크립트의 처음, 중간, 끝 부분을 보고 전체 내용을 추론하여 분석해주세요. 주요 인물, 관계, 사건, 줄거리, 주제를 파악하세요:\n\n[스크립트 시작 부분]\n{cleaned_text[:4000]}\n\n[스크립트 중간 부분]\n{cleaned_text[len(cleaned_text)//2-2000:len(cleaned_text)//2+2000]}\n\n[스크립트 끝 부분]\n{cleaned_text[-4000:]}"}
-                ],
-                temperature=0.5,
-                max_tokens=1500
-            )
-            return response.choices[0].message.content
-        
-        # 중간 길이 스크립트는 두 부분만 분석
-        elif len(cleaned_text) > 6000:
-            if debug: print("🔄 텍스트가 중간 길이로 시작/끝 부분만 분석합니다.")
-            # 시작과 끝 부분 분석
-            start_response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "당신은 스크립트 분석 전문가입니다. 주어진 스크립트를 분석하여 핵심 정보를 추출해 주세요."},
-                    {"role": "user", "content": f"다음 스크립트의 시작 부분을 분석해 주세요. 주요 인물과 관계, 배경 설정에 집중하세요:\n\n{cleaned_text[:5000]}"}
-                ],
-                temperature=0.5,
-                max_tokens=1000
-            )
-            
-            end_response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "당신은 스크립트 분석 전문가입니다. 주어진 스크립트를 분석하여 핵심 정보를 추출해 주세요."},
-                    {"role": "user", "content": f"다음 스크립트의 마지막 부분을 분석해 주세요. 결말, 주제, 메시지에 집중하세요:\n\n{cleaned_text[-5000:]}"}
-                ],
-                temperature=0.5,
-                max_tokens=1000
-            )
-            
-            # 결과 통합
-            combined_analysis = [start_response.choices[0].message.content, end_response.choices[0].message.content]
-            
-            final_response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "당신은 스크립트 분석 전문가입니다. 부분 분석을 통합하여 전체적인 요약을 제공해 주세요."},
-                    {"role": "user", "content": f"스크립트의 시작과 끝 부분 분석을 통합하여 종합적인 요약을 만들어주세요:\n\n[시작 부분 분석]\n{combined_analysis[0]}\n\n[끝 부분 분석]\n{combined_analysis[1]}"}
-                ],
-                temperature=0.5,
-                max_tokens=1500
-            )
-            
-            return final_response.choices[0].message.content
+        # 입력 예산을 넘는 긴 스크립트는 장면 단위 맵-리듀스로 전체 내용을 요약
+        fits_budget = estimate_tokens(cleaned_text) <= plan_input_budget("summary", planning_model("summary"), SUMMARY_OUTPUT_TOKENS)
+        if not fits_budget and (mode or SUMMARY_MODE) == "mapreduce":
+            return summarize_script_mapreduce(text, debug=debug, on_partial=on_partial, chunks=chunks)
         
-        # 짧은 스크립트는 한 번에 분석
-        else:
-            if debug: print("🔄 텍스트가 짧아 전체를 한 번에 분석합니다.")
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "당신은 영화/드라마 스크립트 분석 전문가입니다. 주어진 스크립트를 분석하여 다음 정보를 추출해 주세요: 1) 주요 인물과 관계, 2) 주요 사건과 줄거리, 3) 주제와 메시지."},
-                    {"role": "user", "content": f"다음 스크립트를 분석해 주세요:\n\n{cleaned_text}"}
-                ],
-                temperature=0.5,
-                max_tokens=1500
-            )
-            
-            return response.choices[0].message.content
+        # 예산 안이면 전체를, 샘플 방식이면 핵심 장면만 골라 한 번에 분석
+        if debug:
+            if fits_budget:
+                print("🔄 텍스트가 예산 안에 들어와 전체를 한 번에 분석합니다.")
+            else:
+                print("🔄 텍스트가 예산보다 길어 핵심 장면만 분석합니다.")
+        
+        return chat(stage="summary", on_partial=on_partial, **build_summary_request(text))
         
+    except LLMError:
+        # API 실패는 오류 문구가 결과로 저장되지 않도록 호출한 쪽으로 전달
+        raise
     except Exception as e:
         # AI API 오류 시 기본 정보 제공
         return f"""
@@ -162,16 +419,106 @@ OpenAI API 호출 중 오류가 발생했습니다: {str(e)}
 상세한 분석을 위해서는 OpenAI API 키를 확인하세요.
         """
 
-def extract_structured_data(summary):
-    """요약에서 구조화된 데이터 추출"""
-    try:
-        # API 오류 메시지가 포함되어 있는지 확인
-        if "API 호출 중 오류가 발생했습니다" in summary:
-            # 기본 분석 결과만 반환
-            return "OpenAI API 호출 중 오류가 발생했습니다. 상세 분석을 위해 API 설정을 확인하세요."
+def summarize_chunk(chunk, index, total):
+    """맵 단계: 스크립트 청크 하나를 요약"""
+    return chat(
+        stage="summary_map",
+        messages=[
+            {"role": "system", "content": "당신은 스크립트 분석 전문가입니다. 스크립트의 일부분을 읽고 이후 전체 요약에 쓸 핵심 정보를 정리합니다."},
+            {"role": "user", "content": f"다음은 스크립트 전체 {total}개 부분 중 {index}번째 부분입니다. 등장인물, 인물 관계, 주요 사건, 갈등과 감정 변화를 간결하게 요약해 주세요:\n\n{chunk}"}
+        ],
+        temperature=0.3,
+        max_tokens=MAP_OUTPUT_TOKENS
+    )
+
+def reduce_summaries(summaries, final=False, on_partial=None):
+    """리듀스 단계: 부분 요약 여러 개를 하나로 통합"""
+    joined = "\n\n".join(f"[부분 {i}]\n{summary}" for i, summary in enumerate(summaries, 1))
+    
+    if final:
+        instruction = "다음은 스크립트를 순서대로 나눠 요약한 내용입니다. 이를 통합하여 다음 정보를 담은 전체 요약을 작성해 주세요: 1) 주요 인물과 관계, 2) 주요 사건과 줄거리, 3) 주제와 메시지."
+        max_tokens = SUMMARY_OUTPUT_TOKENS
+    else:
+        instruction = "다음은 스크립트의 연속된 부분 요약입니다. 사건의 순서와 인물 정보를 유지하면서 하나의 요약으로 통합해 주세요."
+        max_tokens = REDUCE_OUTPUT_TOKENS
+    
+    return chat(
+        stage="summary_reduce",
+        on_partial=on_partial,
+        messages=[
+            {"role": "system", "content": "당신은 스크립트 분석 전문가입니다. 부분 분석을 통합하여 전체적인 요약을 제공해 주세요."},
+            {"role": "user", "content": f"{instruction}\n\n{joined}"}
+        ],
+        temperature=0.5,
+        max_tokens=max_tokens
+    )
+
+def summarize_script_mapreduce(text, debug=False, max_workers=None, on_partial=None, chunks=None):
+    """장면 단위 청크를 병렬로 요약한 뒤 단계적으로 통합 (맵-리듀스, 이전에 요약한 청크는 재사용)"""
+    if chunks is None:
+        chunks = script_chunks(text)
+    hashes = [chunk_hash(chunk) for chunk in chunks]
+    record_sources("summary", hashes)
+    
+    # 내용이 같은 청크는 저장된 요약을 그대로 사용
+    stored = load_chunk_summaries(hashes)
+    summaries = [stored.get(hash_value) for hash_value in hashes]
+    missing = [i for i, summary in enumerate(summaries) if summary is None]
+    if debug: print(f"🔄 {len(chunks)}개 청크 중 {len(missing)}개를 병렬로 요약합니다. ({len(chunks) - len(missing)}개 재사용)")
+    
+    def report_partial():
+        if on_partial:
+            on_partial("\n\n".join(f"**[부분 {i}/{len(chunks)}]** {partial}"
+                                     for i, partial in enumerate(summaries, 1) if partial is not None))
+    
+    if len(missing) < len(chunks):
+        report_partial()
+    
+    with ThreadPoolExecutor(max_workers=max_workers or AI_MAX_CONCURRENCY) as executor:
+        # 맵 단계 (바뀐 청크만 요약하고 끝나는 대로 부분 요약을 전달)
+        new_summaries = executor.map(_with_context(summarize_chunk), [chunks[i] for i in missing],
+                                     [i + 1 for i in missing], [len(chunks)] * len(missing))
+        for i, summary in zip(missing, new_summaries):
+            summaries[i] = summary
+            report_partial()
         
-        # 정상적인 요약이 있는 경우 API 사용
-        prompt = f"""
+        save_chunk_summaries({hashes[i]: summaries[i] for i in missing})
+        
+        return reduce_to_summary(summaries, executor, debug=debug, on_partial=on_partial)
+
+def reduce_to_summary(summaries, executor, debug=False, on_partial=None):
+    """부분 요약이 최종 통합 예산 안의 한 그룹에 들어갈 때까지 병렬로 통합한 뒤 전체 요약 생성"""
+    reduce_budget = plan_input_budget("summary_reduce", planning_model("summary_reduce"), SUMMARY_OUTPUT_TOKENS)
+    while len(summaries) > 1 and len(group_summaries(summaries, reduce_budget)) > 1:
+        groups = group_summaries(summaries, reduce_budget)
+        if debug: print(f"🔄 부분 요약 {len(summaries)}개를 {len(groups)}개로 통합합니다.")
+        summaries = list(executor.map(_with_context(reduce_summaries), groups))
+    
+    return reduce_summaries(summaries, final=True, on_partial=on_partial)
+
+def parse_json_response(result):
+    """응답에서 JSON을 추출해 파싱 (실패하면 원본 텍스트 반환)"""
+    # JSON 형식 추출 (텍스트에서 JSON 부분만 추출)
+    json_pattern = r'```json\n(.*?)\n```'
+    json_match = re.search(json_pattern, result, re.DOTALL)
+    
+    if json_match:
+        # JSON 코드 블록 내용 추출
+        json_str = json_match.group(1)
+    else:
+        # 전체 응답을 JSON으로 간주
+        json_str = result
+    
+    # JSON 파싱 시도
+    try:
+        return json.loads(json_str)
+    except json.JSONDecodeError:
+        # JSON 파싱 실패 시 원본 텍스트 반환
+        return result
+
+def build_structured_request(summary):
+    """요약에서 구조화된 데이터를 추출하는 요청 생성"""
+    prompt = f"""
         다음 스크립트 요약에서 구조화된 데이터를 효율적으로 추출해 주세요:
 
         {summary}
@@ -194,75 +541,95 @@ def extract_structured_data(summary):
             ]
         }}
         """
+    
+    messages = [
+        {"role": "system", "content": "당신은 효율적인 스크립트 분석가로, 요약 내용에서 핵심 정보를 JSON 형식으로 추출합니다."},
+        {"role": "user", "content": prompt}
+    ]
+    
+    return {
+        "model": route_model("structured", messages),
+        "messages": messages,
+        "temperature": 0.3,
+        "max_tokens": 800
+    }
 
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo", # 더 빠른 모델 사용
-            messages=[
-                {"role": "system", "content": "당신은 효율적인 스크립트 분석가로, 요약 내용에서 핵심 정보를 JSON 형식으로 추출합니다."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-            max_tokens=800
-        )
-        
-        result = response.choices[0].message.content
-        
-        # JSON 형식 추출 (텍스트에서 JSON 부분만 추출)
-        json_pattern = r'```json\n(.*?)\n```'
-        json_match = re.search(json_pattern, result, re.DOTALL)
+def extract_structured_data(summary):
+    """요약에서 구조화된 데이터 추출"""
+    try:
+        # API 오류 메시지가 포함되어 있는지 확인
+        if "API 호출 중 오류가 발생했습니다" in summary:
+            # 기본 분석 결과만 반환
+            return "OpenAI API 호출 중 오류가 발생했습니다. 상세 분석을 위해 API 설정을 확인하세요."
         
-        if json_match:
-            # JSON 코드 블록 내용 추출
-            json_str = json_match.group(1)
-        else:
-            # 전체 응답을 JSON으로 간주
-            json_str = result
+        # 정상적인 요약이 있는 경우 API 사용
+        response = chat(stage="structured", **build_structured_request(summary))
         
-        # JSON 파싱 시도
-        try:
-            data = json.loads(json_str)
-            return data
-        except json.JSONDecodeError:
-            # JSON 파싱 실패 시 원본 텍스트 반환
-            return result
+        return parse_json_response(response)
     
+    except LLMError:
+        # API 실패는 오류 문구가 결과로 저장되지 않도록 호출한 쪽으로 전달
+        raise
     except Exception as e:
         # 오류 발생 시 기본 정보만 반환
         return f"구조화된 데이터 추출 중 오류 발생: {str(e)}"
 
-def analyze_characters_and_relationships(text):
-    """스크립트에서 등장인물과 관계를 분석"""
-    try:
-        # 텍스트 청소
-        cleaned_text = clean_script_text(text)
-        
-        # 텍스트 길이에 따라 처리 (너무 길면 일부만)
-        if len(cleaned_text) > 10000:
-            analysis_text = f"{cleaned_text[:5000]}\n\n...\n\n{cleaned_text[-5000:]}"
-        else:
-            analysis_text = cleaned_text
-            
-        # 등장인물 분석 요청
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo", # 비용 효율적 모델
-            messages=[
-                {"role": "system", "content": "당신은 스크립트에서 등장인물과 그들의 관계를 분석하는 전문가입니다."},
-                {"role": "user", "content": f"""다음 스크립트를 분석하여 등장인물과 그들의 관계를 상세히 추출해 주세요:
+def _strict_object(**properties):
+    """모든 필드가 필수이고 다른 필드는 허용하지 않는 JSON 스키마 객체 (구조화 출력 strict 모드 조건)"""
+    return {"type": "object", "properties": properties, "required": list(properties), "additionalProperties": False}
+
+# 관계 간선 스키마 (등장인물 분석과 통합 분석에서 같이 사용)
+RELATIONSHIP_SCHEMA = _strict_object(
+    source={"type": "string"},
+    target={"type": "string"},
+    relation={"type": "string", "description": "가족, 동료, 적대 등 짧은 관계 이름"})
+
+# 등장인물 분석 응답 스키마
+CHARACTERS_SCHEMA = _strict_object(
+    characters={"type": "array", "items": _strict_object(
+        name={"type": "string"},
+        description={"type": "string", "description": "역할과 특징"})},
+    relationships={"type": "array", "items": RELATIONSHIP_SCHEMA},
+    hierarchy={"type": "string", "description": "가족, 직장 등으로 묶은 인물 관계의 계층 구조"}
+)
+
+def build_characters_request(text):
+    """등장인물과 관계 분석 요청 생성 (관계는 JSON 간선으로 받음)"""
+    # 토큰 예산에 맞춰 장면 발췌 (예산 안이면 전체)
+    analysis_text = plan_script_excerpt(text, "characters", max_output_tokens=1000)
+    
+    messages = [
+        {"role": "system", "content": "당신은 스크립트에서 등장인물과 그들의 관계를 분석하는 전문가입니다."},
+        {"role": "user", "content": f"""다음 스크립트를 분석하여 등장인물과 그들의 관계를 상세히 추출해 주세요:
 
 {analysis_text}
 
-다음 형식으로 결과를 반환해 주세요:
-1. 등장인물 목록: 각 인물의 이름과 간략한 설명
-2. 주요 관계: 중요한 인물 관계를 설명
-3. 계층 구조: 인물 간의 관계를 계층 구조로 표현 (예: 가족 관계, 직장 관계 등)
+1. characters: 각 인물의 이름과 간략한 설명
+2. relationships: 중요한 인물 관계 (source, target에는 스크립트에 쓰인 인물 이름을 그대로 적음)
+3. hierarchy: 인물 간의 관계를 계층 구조로 표현 (예: 가족 관계, 직장 관계 등)
                 """}
-            ],
-            temperature=0.5,
-            max_tokens=1000
-        )
-        
-        return response.choices[0].message.content
+    ]
+    
+    return {
+        "model": route_model("characters", messages),
+        "messages": messages,
+        "temperature": 0.5,
+        "max_tokens": 1000,
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": {"name": "character_analysis", "strict": True, "schema": CHARACTERS_SCHEMA}
+        }
+    }
+
+def analyze_characters_and_relationships(text):
+    """스크립트에서 등장인물과 관계를 분석해 {characters, relationships, hierarchy} 반환"""
+    try:
+        # 등장인물 분석 요청 (JSON이 아닌 응답은 원본 텍스트 반환)
+        return parse_json_response(chat(stage="characters", **build_characters_request(text)))
     
+    except LLMError:
+        # API 실패는 오류 문구가 결과로 저장되지 않도록 호출한 쪽으로 전달
+        raise
     except Exception as e:
         # API 오류 시 기본 메시지 반환
         return f"등장인물 분석 중 오류 발생: {str(e)}"
@@ -270,18 +637,12 @@ def analyze_characters_and_relationships(text):
 def generate_character_tree(text):
     """등장인물 관계를 트리 구조 형태의 Mermaid 다이어그램으로 생성"""
     try:
-        # 텍스트 청소
-        cleaned_text = clean_script_text(text)
-        
-        # 너무 길면 처음과 끝 부분만 분석
-        if len(cleaned_text) > 8000:
-            analysis_text = f"{cleaned_text[:4000]}\n\n...\n\n{cleaned_text[-4000:]}"
-        else:
-            analysis_text = cleaned_text
+        # 토큰 예산에 맞춰 장면 발췌 (예산 안이면 전체)
+        analysis_text = plan_script_excerpt(text, "character_tree", max_output_tokens=800)
         
         # 관계도 생성 요청
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
+        response = chat(
+            stage="character_tree",
             messages=[
                 {"role": "system", "content": "당신은 스크립트 분석가이며, 등장인물 관계도를 Mermaid 다이어그램 형식으로 생성하는 전문가입니다."},
                 {"role": "user", "content": f"""다음 스크립트를 분석하여 주요 등장인물과 그들의 관계를 트리 구조로 표현하는 Mermaid 다이어그램 코드를 생성해 주세요.
@@ -309,7 +670,7 @@ graph TD
         )
         
         # Mermaid 코드 추출
-        mermaid_response = response.choices[0].message.content
+        mermaid_response = response
         
         # Mermaid 코드 블록 추출
         mermaid_pattern = re.compile(r'```mermaid\n(.*?)```', re.DOTALL)
@@ -325,28 +686,21 @@ graph TD
             else:
                 return "graph TD\n  A[분석 오류] --> B[관계도를 생성할 수 없습니다]"
             
+    except LLMError:
+        # API 실패는 오류 문구가 결과로 저장되지 않도록 호출한 쪽으로 전달
+        raise
     except Exception as e:
         # API 오류 시 기본 트리 구조 생성
         return f"graph TD\n  A[오류] --> B[등장인물 관계도 생성 실패: {str(e)}]"
 
-def analyze_sentiment(text, movie_id):
-    """스크립트의 전반적인 감정을 분석"""
-    try:
-        # 텍스트 청소
-        cleaned_text = clean_script_text(text)
-        
-        # 텍스트가 너무 길면 부분만 사용
-        if len(cleaned_text) > 8000:
-            analysis_text = f"{cleaned_text[:4000]}\n\n...\n\n{cleaned_text[-4000:]}"
-        else:
-            analysis_text = cleaned_text
-        
-        # 감정 분석 요청
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "당신은 스크립트의 감정 분석을 수행하는 전문가입니다."},
-                {"role": "user", "content": f"""다음 스크립트의 전반적인 감정과 분위기를 분석해 주세요.
+def build_sentiment_request(text):
+    """전반적인 감정 분석 요청 생성"""
+    # 토큰 예산에 맞춰 장면 발췌 (예산 안이면 전체)
+    analysis_text = plan_script_excerpt(text, "sentiment", max_output_tokens=800)
+    
+    messages = [
+        {"role": "system", "content": "당신은 스크립트의 감정 분석을 수행하는 전문가입니다."},
+        {"role": "user", "content": f"""다음 스크립트의 전반적인 감정과 분위기를 분석해 주세요.
 
 {analysis_text}
 
@@ -359,235 +713,559 @@ def analyze_sentiment(text, movie_id):
     "emotional_arcs": ["감정 변화 곡선에 대한 설명"]
 }}
                 """}
-            ],
-            temperature=0.5,
-            max_tokens=800
-        )
-        
-        # JSON 결과 추출
-        result = response.choices[0].message.content
-        
-        # JSON 형식 추출 (텍스트에서 JSON 부분만 추출)
-        json_pattern = r'```json\n(.*?)\n```'
-        json_match = re.search(json_pattern, result, re.DOTALL)
-        
-        if json_match:
-            # JSON 코드 블록 내용 추출
-            json_str = json_match.group(1)
-        else:
-            # 전체 응답을 JSON으로 간주
-            json_str = result
+    ]
+    
+    return {
+        "model": route_model("sentiment", messages),
+        "messages": messages,
+        "temperature": 0.5,
+        "max_tokens": 800
+    }
+
+def save_sentiment(conn, movie_id, data):
+    """전체 감정 분석 결과를 현재 결과로 저장하고 오래된 기록 정리 (커밋은 호출한 쪽에서 수행)"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO sentiment_analysis 
+        (movie_id, stage, sentiment_score, sentiment_label, sentiment_text, created_at)
+        VALUES (?, 'overall', ?, ?, ?, ?)
+    """, (
+        movie_id, 
+        data.get('sentiment_score', 0), 
+        data.get('overall_sentiment', 'N/A'),
+        json.dumps(data, ensure_ascii=False, separators=(",", ":")),
+        time.time()
+    ))
+    
+    # 최근 기록만 남기고 방금 저장한 결과를 현재 결과로 표시
+    compact_sentiment_history(cursor, movie_id)
+
+def analyze_sentiment(text):
+    """스크립트의 전반적인 감정을 분석 (저장은 호출한 쪽에서 수행)"""
+    try:
+        # 감정 분석 요청
+        response = chat(stage="sentiment", **build_sentiment_request(text))
         
-        # JSON 파싱 시도
-        try:
-            data = json.loads(json_str)
-            
-            # 데이터베이스에 감정 분석 저장
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            # 전체 감정 분석 저장
-            cursor.execute("""
-                INSERT INTO sentiment_analysis 
-                (movie_id, sentiment_score, sentiment_label, sentiment_text)
-                VALUES (?, ?, ?, ?)
-            """, (
-                movie_id, 
-                data.get('sentiment_score', 0), 
-                data.get('overall_sentiment', 'N/A'),
-                json.dumps(data)
-            ))
-            
-            conn.commit()
-            conn.close()
-            
-            return data
-        except json.JSONDecodeError:
-            # JSON 파싱 실패 시 원본 텍스트 반환
-            return result
+        # JSON 결과 추출 (파싱 실패 시 원본 텍스트 반환)
+        return parse_json_response(response)
     
+    except LLMError:
+        # API 실패는 오류 문구가 결과로 저장되지 않도록 호출한 쪽으로 전달
+        raise
     except Exception as e:
         # 오류 발생 시 기본 정보만 반환
         return f"감정 분석 중 오류 발생: {str(e)}"
 
-def save_plot_analysis(movie_id, structured_data):
-    """줄거리 분석 결과를 데이터베이스에 저장"""
-    try:
-        if isinstance(structured_data, str):
-            # 문자열인 경우 JSON 파싱 시도
-            try:
-                data = json.loads(structured_data)
-            except json.JSONDecodeError:
-                return False
-        else:
-            data = structured_data
-            
-        # 줄거리 요소 추출
-        plot_points = data.get('plot_points', [])
-        if not plot_points:
-            return False
-            
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 기존 데이터 삭제
-        cursor.execute("DELETE FROM plot_analysis WHERE movie_id = ?", (movie_id,))
-        
-        # 새 데이터 삽입
-        for i, plot in enumerate(plot_points):
-            cursor.execute("""
-                INSERT INTO plot_analysis 
-                (movie_id, plot_element, plot_description, plot_order)
-                VALUES (?, ?, ?, ?)
-            """, (movie_id, f"plot_point_{i+1}", plot, i+1))
-        
-        # 주제 데이터 추가
-        themes = data.get('themes', [])
-        for i, theme in enumerate(themes):
-            cursor.execute("""
-                INSERT INTO plot_analysis 
-                (movie_id, plot_element, plot_description, plot_order)
-                VALUES (?, ?, ?, ?)
-            """, (movie_id, f"theme_{i+1}", theme, 100+i))
-        
-        conn.commit()
-        conn.close()
-        return True
+# 통합 분석 응답 스키마
+COMBINED_SCHEMA = _strict_object(
+    title={"type": "string", "description": "작품 제목 (추정)"},
+    genre={"type": "string", "description": "추정 장르"},
+    summary={"type": "string", "description": "이 부분의 줄거리 요약"},
+    characters={"type": "array", "items": _strict_object(
+        name={"type": "string"},
+        description={"type": "string", "description": "역할과 특징"})},
+    relationships={"type": "array", "items": RELATIONSHIP_SCHEMA},
+    plot_points={"type": "array", "items": {"type": "string"}, "description": "이 부분의 핵심 사건 1~3개"},
+    themes={"type": "array", "items": {"type": "string"}},
+    sentiment=_strict_object(
+        label={"type": "string", "enum": ["긍정적", "부정적", "중립적"]},
+        score={"type": "number", "description": "-1.0(부정) ~ 1.0(긍정)"},
+        emotions={"type": "array", "items": {"type": "string"}},
+        mood={"type": "string"})
+)
+
+def build_combined_request(chunk, index, total):
+    """청크 하나의 요약, 인물, 관계, 줄거리, 주제, 감정을 한 번에 요청하는 구조화 출력 요청 생성"""
+    messages = [
+        {"role": "system", "content": "당신은 스크립트 분석 전문가입니다. 스크립트의 일부분을 읽고 요약, 등장인물, 인물 관계, 핵심 사건, 주제, 감정을 JSON으로 정리합니다."},
+        {"role": "user", "content": f"다음은 스크립트 전체 {total}개 부분 중 {index}번째 부분입니다. 이 부분에 드러난 내용만 분석하고, 인물 이름은 스크립트에 쓰인 그대로 적어 주세요:\n\n{chunk}"}
+    ]
+    
+    return {
+        "model": route_model("combined", messages),
+        "messages": messages,
+        "temperature": 0.3,
+        "max_tokens": COMBINED_OUTPUT_TOKENS,
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": {"name": "script_analysis", "strict": True, "schema": COMBINED_SCHEMA}
+        }
+    }
+
+def analyze_chunk_combined(chunk, index, total):
+    """청크 하나를 통합 분석 (JSON이 아닌 응답은 빈 결과로 취급)"""
+    data = parse_json_response(chat(stage="combined", **build_combined_request(chunk, index, total)))
+    return data if isinstance(data, dict) else {}
+
+def _spread(items, count):
+    """목록 전체에 고르게 퍼지도록 최대 count개를 순서대로 선택"""
+    if len(items) <= count:
+        return list(items)
+    return [items[i * len(items) // count] for i in range(count)]
+
+def _sentiment_label(score):
+    """감정 점수를 긍정적/부정적/중립적으로 변환"""
+    return "긍정적" if score > 0.2 else "부정적" if score < -0.2 else "중립적"
+
+def merge_combined_results(results):
+    """청크별 통합 분석 결과를 (언급 순 인물 목록, 인물 설명, 관계 간선, 구조화 데이터, 감정 분석)으로 병합"""
+    descriptions = {}
+    mentions = Counter()
+    edges = {}
+    
+    for result in results:
+        for character in result.get("characters", []):
+            name = character.get("name", "").strip()
+            if name:
+                mentions[name] += 1
+                descriptions.setdefault(name, character.get("description", "").strip())
         
-    except Exception as e:
-        print(f"줄거리 분석 저장 중 오류: {str(e)}")
-        return False
+        # 방향과 관계없이 같은 두 인물의 관계는 처음 나온 것만 사용
+        for edge in result.get("relationships", []):
+            source, target = edge.get("source", "").strip(), edge.get("target", "").strip()
+            if source and target and source != target:
+                edges.setdefault(frozenset((source, target)), (source, target, edge.get("relation", "").strip()))
+    
+    names = [name for name, _ in mentions.most_common()]
+    genres = Counter(result["genre"] for result in results if result.get("genre"))
+    themes = Counter(theme for result in results for theme in result.get("themes", []))
+    structured_data = {
+        "title": next((result["title"] for result in results if result.get("title")), ""),
+        "genre": genres.most_common(1)[0][0] if genres else "",
+        "main_characters": [{"name": name, "description": descriptions[name]} for name in names[:TREE_MAX_CHARACTERS]],
+        "plot_points": _spread([point for result in results for point in result.get("plot_points", [])],
+                               COMBINED_MAX_PLOT_POINTS),
+        "themes": [theme for theme, _ in themes.most_common(COMBINED_MAX_THEMES)]
+    }
+    
+    # 부분별 감정 점수를 평균 내고, 이야기를 몇 구간으로 나눠 구간별 평균으로 감정 변화를 기록
+    moods = [result["sentiment"] for result in results if isinstance(result.get("sentiment"), dict)]
+    scores = [float(mood.get("score") or 0) for mood in moods]
+    score = round(sum(scores) / len(scores), 2) if scores else 0.0
+    segments = min(COMBINED_ARC_SEGMENTS, len(scores))
+    arcs = []
+    for i in range(segments):
+        part = scores[i * len(scores) // segments:(i + 1) * len(scores) // segments]
+        part_score = sum(part) / len(part)
+        arcs.append(f"{i + 1}/{segments} 구간: {_sentiment_label(part_score)} ({part_score:+.2f})")
+    emotions = Counter(emotion for mood in moods for emotion in mood.get("emotions", []))
+    sentiment = {
+        "overall_sentiment": _sentiment_label(score),
+        "sentiment_score": score,
+        "dominant_emotions": [emotion for emotion, _ in emotions.most_common(3)],
+        "mood_description": max(moods, key=lambda mood: abs(float(mood.get("score") or 0))).get("mood", "") if moods else "",
+        "emotional_arcs": arcs
+    }
+    
+    return names, descriptions, list(edges.values()), structured_data, sentiment
 
-def save_character_relationships(movie_id, character_analysis, conn=None):
-    """등장인물 관계 분석 결과를 데이터베이스에 저장"""
-    try:
-        close_conn = False
-        if conn is None:
-            conn = get_db_connection()
-            close_conn = True
-            
-        cursor = conn.cursor()
+def format_character_analysis(character_analysis):
+    """등장인물 분석 결과를 화면 표시용 문서로 변환 (JSON이 아닌 결과는 그대로 반환)"""
+    if not isinstance(character_analysis, dict):
+        return character_analysis
+    
+    lines = ["1. 등장인물 목록:"]
+    lines += [f"- {character.get('name', '')}: {character.get('description', '')}"
+              for character in character_analysis.get("characters", [])]
+    lines += ["", "2. 주요 관계:"]
+    lines += [f"- {edge.get('source', '')}와(과) {edge.get('target', '')}의 관계: {edge.get('relation', '')}"
+              for edge in character_analysis.get("relationships", [])]
+    if character_analysis.get("hierarchy"):
+        lines += ["", "3. 계층 구조:", character_analysis["hierarchy"]]
+    return "\n".join(lines)
+
+def build_character_tree(names, descriptions, edges, max_characters=TREE_MAX_CHARACTERS):
+    """인물과 관계 간선으로 Mermaid 관계도 생성 (관계가 가장 많은 인물이 맨 위)"""
+    degree = Counter()
+    for source, target, _ in edges:
+        degree[source] += 1
+        degree[target] += 1
+    
+    ranked = sorted(set(names) | set(degree), key=lambda name: (-degree[name], names.index(name) if name in names else len(names)))
+    ranked = ranked[:max_characters]
+    if not ranked:
+        return "graph TD\n  A[분석 오류] --> B[관계도를 생성할 수 없습니다]"
+    
+    # Mermaid 문법과 겹치는 기호는 라벨에서 제거
+    def label(text):
+        return re.sub(r'[\[\]{}()|<>"]', ' ', text).strip()
+    
+    node_ids = {name: f"C{i}" for i, name in enumerate(ranked)}
+    mermaid = "graph TD\n"
+    for name in ranked:
+        description = label(descriptions.get(name, ""))[:20]
+        mermaid += f"  {node_ids[name]}[{label(name)}{f' - {description}' if description else ''}]\n"
+    for source, target, relation in edges:
+        if source in node_ids and target in node_ids:
+            mermaid += f"  {node_ids[source]} -->|{label(relation) or '관계'}| {node_ids[target]}\n"
+    
+    return mermaid.rstrip("\n")
+
+def analyze_script_combined(text, on_event=None, stream=False, max_workers=None, chunks=None):
+    """청크마다 통합 분석 호출 한 번으로 (요약, 구조화 데이터, 등장인물 분석, 관계도, 감정 분석, 결과별 출처 해시) 생성"""
+    if chunks is None:
+        chunks = script_chunks(text)
+    model = route_model("combined")
+    hashes = [chunk_hash(chunk, f"combined:{model}") for chunk in chunks]
+    for stage in ANALYSIS_STAGES:
+        _emit(on_event, "start", stage)
+    
+    # 내용이 같은 청크는 저장된 통합 분석 결과를 그대로 사용
+    stored = load_chunk_summaries(hashes, f"combined:{model}")
+    results = [json.loads(stored[hash_value]) if hash_value in stored else None for hash_value in hashes]
+    missing = [i for i, result in enumerate(results) if result is None]
+    on_partial = _partial_handler(on_event, "summary") if stream else None
+    
+    with ThreadPoolExecutor(max_workers=max_workers or AI_MAX_CONCURRENCY) as executor:
+        new_results = executor.map(_with_context(analyze_chunk_combined), [chunks[i] for i in missing],
+                                   [i + 1 for i in missing], [len(chunks)] * len(missing))
+        for i, result in zip(missing, new_results):
+            results[i] = result
+            if on_partial:
+                on_partial("\n\n".join(f"**[부분 {n}/{len(chunks)}]** {result.get('summary', '')}"
+                                         for n, result in enumerate(results, 1) if result is not None))
         
-        # 등장인물 ID 가져오기
-        cursor.execute("SELECT character_id, name FROM characters WHERE movie_id = ?", (movie_id,))
-        characters = {name.lower(): char_id for char_id, name in cursor.fetchall()}
-        
-        # 관계 패턴 찾기
-        relation_patterns = [
-            r'(\w+)와\(과\)\s*(\w+)의\s*관계[:：]?\s*([^,\.]+)',
-            r'(\w+)와\(과\)\s*(\w+)[:：]?\s*([^,\.]+)',
-            r'(\w+)와\(과\)\s*(\w+)\s*사이[:：]?\s*([^,\.]+)',
-            r'(\w+)와\(과\)\s*(\w+)\s*-\s*([^,\.]+)',
-            r'(\w+)[:：]\s*(\w+)의\s*([^,\.]+)'
-        ]
+        save_chunk_summaries({hashes[i]: json.dumps(results[i], ensure_ascii=False) for i in missing if results[i]},
+                             f"combined:{model}")
         
-        relations_found = []
+        # 인물, 관계도, 감정, 구조화 데이터는 추가 호출 없이 병합
+        names, descriptions, edges, structured_data, sentiment = merge_combined_results(results)
+        character_analysis = {
+            "characters": [{"name": name, "description": descriptions.get(name, "")} for name in names],
+            "relationships": [{"source": source, "target": target, "relation": relation}
+                              for source, target, relation in edges],
+            "hierarchy": ""
+        }
+        character_tree = build_character_tree(names, descriptions, edges)
+        _emit(on_event, "done", "structured", result=structured_data)
+        _emit(on_event, "done", "characters", result=character_analysis)
+        _emit(on_event, "done", "character_tree", result=character_tree)
+        _emit(on_event, "done", "sentiment", result=sentiment)
         
-        for pattern in relation_patterns:
-            matches = re.finditer(pattern, character_analysis, re.MULTILINE)
-            for match in matches:
-                char1, char2, rel_type = match.groups()
-                char1 = char1.strip().lower()
-                char2 = char2.strip().lower()
-                rel_type = rel_type.strip()
-                
-                if char1 in characters and char2 in characters:
-                    relations_found.append((
-                        characters[char1],
-                        characters[char2],
-                        rel_type
-                    ))
-        
-        # 관계 저장
-        for char1_id, char2_id, rel_type in relations_found:
-            # 이미 있는 관계인지 확인
-            cursor.execute("""
-                SELECT relationship_id FROM relationships
-                WHERE movie_id = ? AND 
-                      ((character1_id = ? AND character2_id = ?) OR
-                       (character1_id = ? AND character2_id = ?))
-            """, (movie_id, char1_id, char2_id, char2_id, char1_id))
-            
-            existing = cursor.fetchone()
-            
-            if existing:
-                # 업데이트
-                cursor.execute("""
-                    UPDATE relationships
-                    SET relationship_type = ?
-                    WHERE relationship_id = ?
-                """, (rel_type, existing[0]))
-            else:
-                # 새로 추가
-                cursor.execute("""
-                    INSERT INTO relationships
-                    (movie_id, character1_id, character2_id, relationship_type)
-                    VALUES (?, ?, ?, ?)
-                """, (movie_id, char1_id, char2_id, rel_type))
-        
-        if close_conn:
+        # 부분 요약만 통합 호출로 하나의 요약으로 만듦
+        summaries = [result.get("summary", "") for result in results if result.get("summary")]
+        if len(summaries) > 1:
+            summary = reduce_to_summary(summaries, executor, on_partial=on_partial)
+        else:
+            summary = summaries[0] if summaries else "요약할 내용을 찾지 못했습니다."
+        _emit(on_event, "done", "summary", result=summary)
+    
+    # 모든 결과가 같은 통합 분석 청크에서 나옴
+    sources = {artifact: hashes for artifact in SOURCE_ARTIFACTS}
+    return summary, structured_data, character_analysis, character_tree, sentiment, sources
+
+def _parse_structured_data(structured_data):
+    """구조화 데이터가 문자열이면 JSON으로 파싱 (실패하면 None)"""
+    if not isinstance(structured_data, str):
+        return structured_data
+    try:
+        return json.loads(structured_data)
+    except json.JSONDecodeError:
+        return None
+
+def save_plot_analysis(movie_id, structured_data, conn=None):
+    """줄거리 분석 결과를 데이터베이스에 저장 (conn을 주면 커밋과 오류 처리는 호출한 쪽에서 수행)"""
+    if conn is None:
+        conn = get_db_connection()
+        try:
+            saved = save_plot_analysis(movie_id, structured_data, conn)
             conn.commit()
+            return saved
+        except Exception as e:
+            print(f"줄거리 분석 저장 중 오류: {str(e)}")
+            return False
+        finally:
             conn.close()
-            
-        return len(relations_found)
-        
-    except Exception as e:
-        print(f"등장인물 관계 저장 중 오류: {str(e)}")
-        if close_conn and conn:
-            conn.close()
-        return 0
+    
+    # 줄거리 요소 추출
+    data = _parse_structured_data(structured_data)
+    if not isinstance(data, dict) or not data.get('plot_points'):
+        return False
+    
+    cursor = conn.cursor()
+    
+    # 기존 데이터 삭제
+    cursor.execute("DELETE FROM plot_analysis WHERE movie_id = ?", (movie_id,))
+    
+    # 줄거리 요소와 주제를 한 번에 삽입 (주제는 100번부터)
+    rows = [(movie_id, f"plot_point_{i+1}", plot, i+1) for i, plot in enumerate(data['plot_points'])]
+    rows += [(movie_id, f"theme_{i+1}", theme, 100+i) for i, theme in enumerate(data.get('themes', []))]
+    cursor.executemany("""
+        INSERT INTO plot_analysis 
+        (movie_id, plot_element, plot_description, plot_order)
+        VALUES (?, ?, ?, ?)
+    """, rows)
+    return True
 
-def update_movie_summary(movie_id, summary, structured_data):
-    """영화 요약 정보 업데이트"""
-    try:
+def _alias_key(name):
+    """이름 비교용 키 (소문자, 공백과 문장부호 제거)"""
+    return re.sub(r'[\W_]+', '', name.lower())
+
+def _strip_title(key):
+    """이름 키 끝의 호칭 제거 (호칭만 남는 경우는 그대로)"""
+    for title in NAME_TITLES:
+        if key.endswith(title) and len(key) > len(title) + 1:
+            return key[:-len(title)]
+    return key
+
+def build_alias_index(characters):
+    """(인물 ID, 이름) 목록으로 별칭 -> 인물 ID 색인 생성 (호칭을 뗀 이름, 세 글자 한국어 이름은 성을 뺀 이름도 포함)"""
+    index = {}
+    derived = {}
+    for char_id, name in characters:
+        key = _alias_key(name)
+        if not key:
+            continue
+        index.setdefault(key, char_id)
+        base = _strip_title(key)
+        aliases = {base}
+        if re.fullmatch(r'[가-힣]{3}', base) and base[1:] not in NAME_TITLES:
+            aliases.add(base[1:])
+        for alias in aliases:
+            derived.setdefault(alias, set()).add(char_id)
+    
+    # 실제 이름이 우선이고, 여러 인물에 겹치는 별칭은 쓰지 않음
+    for alias, char_ids in derived.items():
+        if alias not in index and len(char_ids) == 1:
+            index[alias] = next(iter(char_ids))
+    return index
+
+def resolve_character(name, alias_index):
+    """이름을 별칭 색인으로 인물 ID에 맞춤 (정확히 맞지 않으면 가장 비슷한 별칭, 없으면 None)"""
+    key = _alias_key(name)
+    if not key:
+        return None
+    for candidate in (key, _strip_title(key)):
+        if candidate in alias_index:
+            return alias_index[candidate]
+    match = difflib.get_close_matches(_strip_title(key), alias_index, n=1, cutoff=ALIAS_MATCH_CUTOFF)
+    return alias_index[match[0]] if match else None
+
+def _relationship_edges(character_analysis):
+    """등장인물 분석 결과(딕셔너리나 JSON 문자열)에서 관계 간선 목록 추출"""
+    if isinstance(character_analysis, str):
+        character_analysis = parse_json_response(character_analysis)
+    if not isinstance(character_analysis, dict):
+        return []
+    return [edge for edge in character_analysis.get("relationships", []) if isinstance(edge, dict)]
+
+def save_character_relationships(movie_id, character_analysis, conn=None):
+    """등장인물 관계 분석 결과를 데이터베이스에 저장 (conn을 주면 커밋과 오류 처리는 호출한 쪽에서 수행)"""
+    if conn is None:
         conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # JSON 형식인지 확인
-        if isinstance(structured_data, str):
-            try:
-                data = json.loads(structured_data)
-            except json.JSONDecodeError:
-                data = {"error": "JSON 파싱 오류"}
-        else:
-            data = structured_data
-            
-        # 영화 정보 업데이트
+        try:
+            count = save_character_relationships(movie_id, character_analysis, conn)
+            conn.commit()
+            return count
+        except Exception as e:
+            print(f"등장인물 관계 저장 중 오류: {str(e)}")
+            return 0
+        finally:
+            conn.close()
+    
+    cursor = conn.cursor()
+    
+    # 영화의 등장인물로 별칭 색인을 한 번만 만듦
+    cursor.execute("SELECT character_id, name FROM characters WHERE movie_id = ?", (movie_id,))
+    alias_index = build_alias_index(cursor.fetchall())
+    
+    # 이미 있는 관계는 저장된 방향을 유지하도록 한 번에 조회
+    cursor.execute("SELECT character1_id, character2_id FROM relationships WHERE movie_id = ?", (movie_id,))
+    stored = {frozenset((char1_id, char2_id)): (char1_id, char2_id) for char1_id, char2_id in cursor.fetchall()}
+    
+    # 방향과 관계없이 같은 두 인물의 관계는 처음 나온 것만 사용
+    rows = {}
+    for edge in _relationship_edges(character_analysis):
+        char1_id = resolve_character(str(edge.get("source", "")), alias_index)
+        char2_id = resolve_character(str(edge.get("target", "")), alias_index)
+        if char1_id is None or char2_id is None or char1_id == char2_id:
+            continue
+        pair = frozenset((char1_id, char2_id))
+        char1_id, char2_id = stored.get(pair, (char1_id, char2_id))
+        rows.setdefault(pair, (movie_id, char1_id, char2_id, str(edge.get("relation", "")).strip()))
+    
+    # 관계 저장 (있으면 관계 종류 갱신, 없으면 추가)
+    cursor.executemany("""
+        INSERT INTO relationships
+        (movie_id, character1_id, character2_id, relationship_type)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (movie_id, character1_id, character2_id) DO UPDATE
+        SET relationship_type = excluded.relationship_type
+    """, list(rows.values()))
+    
+    return len(rows)
+
+def save_movie_summary(conn, movie_id, summary):
+    """영화 요약 저장 및 검색 인덱스 반영 (커밋은 호출한 쪽에서 수행)"""
+    cursor = conn.cursor()
+    cursor.execute("UPDATE movies SET summary = ? WHERE movie_id = ?", (summary, movie_id))
+    
+    # 검색 인덱스에 요약 반영
+    index_movie_summary(conn, movie_id, summary)
+
+def save_structured_data(conn, movie_id, data):
+    """구조화된 데이터의 장르, 주제, 제목 저장 (커밋은 호출한 쪽에서 수행)"""
+    cursor = conn.cursor()
+    
+    # 영화 정보 업데이트
+    cursor.execute("""
+        UPDATE movies
+        SET genre = ?,
+            theme = ?
+        WHERE movie_id = ?
+    """, (
+        data.get('genre', ''),
+        ', '.join(data.get('themes', [])) if isinstance(data.get('themes', []), list) else '',
+        movie_id
+    ))
+    
+    # 영화 제목이 있으면 업데이트
+    if 'title' in data and data['title']:
         cursor.execute("""
             UPDATE movies
-            SET summary = ?,
-                genre = ?,
-                theme = ?
+            SET title = ?
             WHERE movie_id = ?
-        """, (
-            summary,
-            data.get('genre', ''),
-            ', '.join(data.get('themes', [])) if isinstance(data.get('themes', []), list) else '',
-            movie_id
-        ))
-        
-        # 영화 제목이 있으면 업데이트
-        if 'title' in data and data['title']:
-            cursor.execute("""
-                UPDATE movies
-                SET title = ?
-                WHERE movie_id = ?
-            """, (data['title'], movie_id))
-        
+        """, (data['title'], movie_id))
+
+def save_movie_analysis(conn, movie_id, summary, structured_data):
+    """영화 요약, 구조화 데이터, 줄거리 분석 저장 (커밋은 호출한 쪽에서 수행)"""
+    # JSON 형식인지 확인
+    data = _parse_structured_data(structured_data)
+    if not isinstance(data, dict):
+        data = {"error": "JSON 파싱 오류"}
+    
+    # 영화 정보 업데이트
+    save_movie_summary(conn, movie_id, summary)
+    save_structured_data(conn, movie_id, data)
+    
+    # 줄거리 분석 저장
+    save_plot_analysis(movie_id, data, conn)
+
+def update_movie_summary(movie_id, summary, structured_data):
+    """영화 요약 정보 업데이트"""
+    conn = get_db_connection()
+    try:
+        save_movie_analysis(conn, movie_id, summary, structured_data)
         conn.commit()
-        
-        # 줄거리 분석 저장
-        save_plot_analysis(movie_id, data)
-        
-        conn.close()
         return True
-        
     except Exception as e:
         print(f"영화 요약 업데이트 중 오류: {str(e)}")
         return False
+    finally:
+        conn.close()
 
-def process_ai_analysis(movie_id, text=None, pdf_path=None):
-    """영화 스크립트의 AI 분석을 수행하고 데이터베이스에 저장"""
+def save_ai_results(conn, movie_id, summary, structured_data, character_analysis, sentiment, sources):
+    """영화 하나의 AI 분석 결과를 모두 같은 연결에 저장 (한 트랜잭션으로 반영되도록 커밋은 호출한 쪽에서 수행)"""
+    save_movie_analysis(conn, movie_id, summary, structured_data)
+    
+    # 등장인물 관계 저장
+    save_character_relationships(movie_id, character_analysis, conn)
+    
+    # 감정 분석 저장
+    if isinstance(sentiment, dict):
+        save_sentiment(conn, movie_id, sentiment)
+    
+    # 분석 결과별 출처 입력 조각 기록
+    save_analysis_sources(conn, movie_id, sources)
+    
+    # 상세 화면용 스냅샷 갱신
+    rebuild_movie_snapshot(conn, movie_id)
+
+def _with_context(func):
+    """현재 컨텍스트(호출 기록용 영화 ID 등)를 이어받아 다른 스레드에서 실행되도록 감싼 함수 반환"""
+    context = contextvars.copy_context()
+    
+    def run(*args, **kwargs):
+        # 여러 스레드가 같은 컨텍스트에 동시에 들어갈 수 없으므로 호출마다 복사본 사용
+        return context.copy().run(func, *args, **kwargs)
+    return run
+
+def _emit(on_event, event_type, stage, **data):
+    """진행 이벤트 전달 (on_event가 없으면 무시)"""
+    if on_event:
+        on_event({"type": event_type, "stage": stage, **data})
+
+def _partial_handler(on_event, stage):
+    """스트리밍 중간 결과를 partial 이벤트로 전달하는 함수 생성"""
+    if not on_event:
+        return None
+    return lambda text: _emit(on_event, "partial", stage, text=text)
+
+def _run_stage(on_event, stage, func, *args, **kwargs):
+    """분석 단계 하나를 실행하며 start/done 이벤트 전달"""
+    _emit(on_event, "start", stage)
+    result = func(*args, **kwargs)
+    _emit(on_event, "done", stage, result=result)
+    return result
+
+def summarize_and_extract(text, on_event=None, stream=False, chunks=None):
+    """요약 생성 후 요약에서 구조화된 데이터 추출"""
+    summary = _run_stage(on_event, "summary", summarize_script, text,
+                        on_partial=_partial_handler(on_event, "summary") if stream else None, chunks=chunks)
+    return summary, _run_stage(on_event, "structured", extract_structured_data, summary)
+
+def _record_stage_sources(func, *args):
+    """분석 단계 하나를 실행해 (결과, 그 단계가 요청에 실제로 넣은 입력 조각 해시) 반환"""
+    sources = {}
+    token = _analysis_sources.set(sources)
+    try:
+        return func(*args), sources
+    finally:
+        _analysis_sources.reset(token)
+
+def _run_shared_stage(content_hash, stage, func, *args):
+    """같은 스크립트의 같은 단계를 다른 요청이 실행 중이면 기다렸다가 재사용 ((결과, 출처 해시, 재사용 여부) 반환)"""
+    (result, sources), shared = run_single_flight(content_hash, f"staged:{stage}", _record_stage_sources, func, *args)
+    return result, sources, shared
+
+def _analyze_script_staged(text, on_event=None, stream=False, max_workers=None, chunks=None, content_hash=None):
+    """단계별 호출로 ((요약, 구조화 데이터, 등장인물 분석, 관계도, 감정 분석, 결과별 출처 해시), 재사용한 단계 목록) 생성 (단계마다 따로 단일 실행)"""
+    if content_hash is None:
+        content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    
+    # 요약 -> 구조화 데이터 추출만 순서가 필요하므로 나머지 단계와 동시에 실행
+    with ThreadPoolExecutor(max_workers=max_workers or AI_MAX_CONCURRENCY) as executor:
+        # 요약 생성 및 구조화된 데이터 추출
+        summary_future = executor.submit(_with_context(_run_shared_stage), content_hash, "summary",
+                                         summarize_and_extract, text, on_event, stream, chunks)
+        
+        # 등장인물 및 관계 분석
+        character_future = executor.submit(_with_context(_run_shared_stage), content_hash, "characters",
+                                           _run_stage, on_event, "characters", analyze_characters_and_relationships, text)
+        
+        # 관계도 생성
+        tree_future = executor.submit(_with_context(_run_shared_stage), content_hash, "character_tree",
+                                      _run_stage, on_event, "character_tree", generate_character_tree, text)
+        
+        # 감정 분석
+        sentiment_future = executor.submit(_with_context(_run_shared_stage), content_hash, "sentiment",
+                                           _run_stage, on_event, "sentiment", analyze_sentiment, text)
+        
+        (summary, structured_data), summary_sources, summary_shared = summary_future.result()
+        character_analysis, character_sources, character_shared = character_future.result()
+        character_tree, _, tree_shared = tree_future.result()
+        sentiment, sentiment_sources, sentiment_shared = sentiment_future.result()
+    
+    # 다른 요청의 결과를 받은 단계는 완료 이벤트만 전달
+    results = {"summary": summary, "structured": structured_data, "characters": character_analysis,
+               "character_tree": character_tree, "sentiment": sentiment}
+    shared_flags = {"summary": summary_shared, "structured": summary_shared, "characters": character_shared,
+                    "character_tree": tree_shared, "sentiment": sentiment_shared}
+    shared_stages = [stage for stage in ANALYSIS_STAGES if shared_flags[stage]]
+    for stage in shared_stages:
+        _emit(on_event, "done", stage, result=results[stage], shared=True)
+    
+    # 구조화 데이터는 요약에서 추출하므로 요약과 같은 출처
+    sources = dict(summary_sources, **character_sources, **sentiment_sources)
+    if "summary" in sources:
+        sources["structured"] = sources["summary"]
+    return (summary, structured_data, character_analysis, character_tree, sentiment, sources), shared_stages
+
+def process_ai_analysis(movie_id, text=None, pdf_path=None, max_workers=None, on_event=None, stream=False, mode=None,
+                        before_commit=None):
+    """영화 스크립트의 AI 분석을 수행하고 데이터베이스에 저장 (on_event로 단계별 진행 이벤트 전달, stream이면 중간 결과도 전달, mode로 분석 방식 선택, before_commit(conn)이 예외를 내면 저장 취소)"""
+    # 이 분석에서 나가는 API 호출을 영화별로 기록
+    context_token = set_call_context(movie_id=movie_id)
     try:
         # 텍스트 준비
         if text is None and pdf_path:
@@ -598,35 +1276,53 @@ def process_ai_analysis(movie_id, text=None, pdf_path=None):
                 "success": False,
                 "message": "텍스트가 너무 짧거나 없습니다."
             }
-            
-        # 요약 생성
-        summary = summarize_script(text)
-        
-        # 구조화된 데이터 추출
-        structured_data = extract_structured_data(summary)
         
-        # 등장인물 및 관계 분석
-        character_analysis = analyze_characters_and_relationships(text)
+        # 모든 단계가 같은 정규화 텍스트를 쓰도록 한 번만 정리
+        text, normalization = prepare_script_text(text)
+            
+        # 청크는 한 번만 나눠 맵 단계에 사용 (바뀌지 않은 청크의 요약은 재사용)
+        chunks = script_chunks(text)
         
-        # 관계도 생성
-        character_tree = generate_character_tree(text)
+        # 같은 스크립트를 다른 요청이 분석 중이면 기다렸다가 그 결과를 재사용
+        # (staged는 단계마다, combined는 모든 결과를 한 번에 만들므로 분석 전체를 한 단위로 공유)
+        content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        mode = mode or AI_ANALYSIS_MODE
+        if mode == "combined":
+            # 청크마다 한 번의 구조화 출력 호출로 모든 결과를 만들고 관계도는 간선으로 직접 생성
+            results, shared = run_single_flight(content_hash, "analysis:combined", analyze_script_combined,
+                                                text, on_event, stream, max_workers, chunks)
+            shared_stages = list(ANALYSIS_STAGES) if shared else []
+            for stage, result in zip(shared_stages, results):
+                _emit(on_event, "done", stage, result=result, shared=True)
+        else:
+            results, shared_stages = _analyze_script_staged(text, on_event, stream, max_workers, chunks, content_hash)
+        summary, structured_data, character_analysis, character_tree, sentiment, sources = results
         
-        # 감정 분석
-        sentiment = analyze_sentiment(text, movie_id)
+        # 요약이 실제로 쓴 입력 조각 중 이전 분석 이후 바뀐 조각 수
+        changed_chunks = count_changed_chunks(movie_id, sources.get("summary", []))
         
-        # 데이터베이스에 정보 저장
+        # 모든 결과를 한 연결, 한 트랜잭션으로 저장 (중간에 실패하면 아무것도 반영하지 않음)
+        _emit(on_event, "start", "save")
         conn = get_db_connection()
-        
-        # 영화 요약 업데이트
-        update_movie_summary(movie_id, summary, structured_data)
-        
-        # 등장인물 관계 저장
-        save_character_relationships(movie_id, character_analysis, conn)
-        
-        conn.close()
+        try:
+            save_ai_results(conn, movie_id, summary, structured_data, character_analysis, sentiment, sources)
+            # 쓰기 잠금을 잡은 같은 트랜잭션 안에서 저장해도 되는지 마지막으로 확인 (작업 임대 등)
+            if before_commit:
+                before_commit(conn)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        _emit(on_event, "done", "save")
         
         return {
             "success": True,
+            "changed_chunks": changed_chunks,
+            "total_chunks": len(sources.get("summary", [])),
+            "shared": shared_stages,
+            "tokens_saved": normalization["tokens_saved"],
             "summary": summary,
             "structured_data": structured_data,
             "character_analysis": character_analysis,
@@ -634,16 +1330,41 @@ def process_ai_analysis(movie_id, text=None, pdf_path=None):
             "sentiment": sentiment
         }
         
+    except LLMError as e:
+        return {
+            "success": False,
+            "message": f"AI API 호출 실패: {str(e)}"
+        }
     except Exception as e:
         return {
             "success": False,
             "message": f"AI 분석 중 오류 발생: {str(e)}"
         }
+    finally:
+        reset_call_context(context_token)
+
+def process_ai_analysis_batch(movie_files, max_workers=None):
+    """여러 영화의 AI 분석을 동시에 실행하고 끝나는 순서대로 (영화 ID, 결과) 반환"""
+    with ThreadPoolExecutor(max_workers=max_workers or AI_BATCH_CONCURRENCY) as executor:
+        futures = {executor.submit(process_ai_analysis, movie_id, pdf_path=pdf_path): movie_id
+                   for movie_id, pdf_path in movie_files}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
 
 if __name__ == "__main__":
     # 테스트용 코드
     import sys
-    if len(sys.argv) > 1:
+    if len(sys.argv) > 2 and sys.argv[1] == "--batch-export":
+        # 배치 요청 파일 생성: --batch-export 출력.jsonl [단계,단계] [PDF 폴더]
+        from ai_batch import SCRIPT_STAGES, export_batch_requests
+        stages = sys.argv[3].split(",") if len(sys.argv) > 3 else SCRIPT_STAGES
+        directory = sys.argv[4] if len(sys.argv) > 4 else "data"
+        export_batch_requests(sys.argv[2], stages=stages, directory=directory)
+    elif len(sys.argv) > 2 and sys.argv[1] == "--batch-import":
+        # 배치 결과 반영: --batch-import 결과.jsonl
+        from ai_batch import import_batch_results
+        import_batch_results(sys.argv[2])
+    elif len(sys.argv) > 1:
         pdf_path = sys.argv[1]
         text = extract_text_from_pdf(pdf_path)
         print(f"텍스트 길이: {len(text):,}자")
@@ -687,8 +1408,9 @@ if __name__ == "__main__":
         
         if result["success"]:
             print("\n✅ 분석 완료!")
+            print(f"- 정규화로 절약한 토큰: {result['tokens_saved']:,}개")
             print(f"- 요약: {len(result['summary'])}자")
-            print(f"- 등장인물 분석: {len(result['character_analysis'])}자")
+            print(f"- 등장인물 관계: {len(_relationship_edges(result['character_analysis']))}개")
             print(f"- 관계도 생성: {'성공' if result['character_tree'] else '실패'}")
             
             # 감정 분석 결과 출력
@@ -703,4 +1425,6 @@ if __name__ == "__main__":
         else:
             print(f"\n❌ 분석 실패: {result['message']}")
     else:
-        print("사용법: python ai_analyzer.py [PDF 파일 경로]")
\ No newline at end of file
+        print("사용법: python ai_analyzer.py [PDF 파일 경로]")
+        print("       python ai_analyzer.py --batch-export [출력.jsonl] [단계,단계] [PDF 폴더]")
+        print("       python ai_analyzer.py --batch-import [결과.jsonl]")
\ No newline at end of file
@@ -0,0 +1,173 @@
+import os
+import json
+from db_schema import get_db_connection
+from movie_snapshot import rebuild_movie_snapshot
+from llm_client import fit_response_format
+from ai_analyzer import (extract_text_from_pdf, prepare_script_text, build_summary_request, build_structured_request,
+                         build_characters_request, build_sentiment_request, parse_json_response,
+                         save_movie_summary, save_structured_data, save_plot_analysis,
+                         save_character_relationships, save_sentiment)
+
+# 배치 요청 대상 엔드포인트
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+# 스크립트 본문으로 요청을 만드는 단계
+SCRIPT_STAGES = ("summary", "characters", "sentiment")
+
+# 저장된 요약으로 요청을 만드는 단계 (요약 결과를 반영한 뒤 다시 내보내야 함)
+SUMMARY_STAGES = ("structured",)
+
+BATCH_STAGES = SCRIPT_STAGES + SUMMARY_STAGES
+
+# 단계별 요청 생성 함수
+REQUEST_BUILDERS = {
+    "summary": build_summary_request,
+    "characters": build_characters_request,
+    "sentiment": build_sentiment_request,
+    "structured": build_structured_request
+}
+
+# 결과 반영 순서 (요약을 구조화 데이터보다 먼저 반영)
+INGEST_ORDER = {stage: i for i, stage in enumerate(("summary", "structured", "characters", "sentiment"))}
+
+def make_custom_id(movie_id, stage):
+    """영화 ID와 분석 단계로 배치 요청 ID 생성"""
+    return f"movie-{movie_id}-{stage}"
+
+def parse_custom_id(custom_id):
+    """배치 요청 ID에서 (영화 ID, 분석 단계) 추출"""
+    parts = custom_id.split("-", 2)
+    if len(parts) != 3 or parts[0] != "movie" or not parts[1].isdigit() or parts[2] not in BATCH_STAGES:
+        raise ValueError(f"알 수 없는 요청 ID입니다: {custom_id}")
+    return int(parts[1]), parts[2]
+
+def export_batch_requests(output_path, movie_ids=None, stages=SCRIPT_STAGES, directory="data"):
+    """영화들의 분석 요청을 OpenAI 배치 형식 JSONL 파일로 저장"""
+    unknown = [stage for stage in stages if stage not in BATCH_STAGES]
+    if unknown:
+        raise ValueError(f"지원하지 않는 분석 단계입니다: {', '.join(unknown)}")
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    if movie_ids:
+        placeholders = ", ".join("?" for _ in movie_ids)
+        cursor.execute(f"""
+            SELECT movie_id, filename, summary FROM movies
+            WHERE movie_id IN ({placeholders})
+            ORDER BY movie_id
+        """, list(movie_ids))
+    else:
+        cursor.execute("SELECT movie_id, filename, summary FROM movies ORDER BY movie_id")
+    movies = cursor.fetchall()
+    conn.close()
+    
+    request_count = 0
+    with open(output_path, "w", encoding="utf-8") as f:
+        for movie_id, filename, summary in movies:
+            sources = {}
+            
+            # 스크립트 단계는 PDF 원문으로 요청 생성
+            if any(stage in SCRIPT_STAGES for stage in stages):
+                pdf_path = os.path.join(directory, filename)
+                text = extract_text_from_pdf(pdf_path) if os.path.exists(pdf_path) else ""
+                if len(text) < 100 or text.startswith("PDF 파일 처리 중 오류"):
+                    print(f"⚠️ '{filename}' 스크립트를 읽을 수 없어 건너뜁니다.")
+                else:
+                    text, normalization = prepare_script_text(text)
+                    print(f"'{filename}' 정규화로 토큰 {normalization['tokens_saved']:,}개를 절약했습니다.")
+                    sources.update({stage: text for stage in SCRIPT_STAGES})
+            
+            # 요약 단계는 저장된 요약으로 요청 생성
+            if summary:
+                sources.update({stage: summary for stage in SUMMARY_STAGES})
+            
+            for stage in stages:
+                if stage not in sources:
+                    continue
+                
+                request = {
+                    "custom_id": make_custom_id(movie_id, stage),
+                    "method": "POST",
+                    "url": BATCH_ENDPOINT,
+                    "body": fit_response_format(REQUEST_BUILDERS[stage](sources[stage]))
+                }
+                f.write(json.dumps(request, ensure_ascii=False) + "\n")
+                request_count += 1
+    
+    print(f"✅ 영화 {len(movies)}편의 요청 {request_count}개를 '{output_path}'에 저장했습니다.")
+    return request_count
+
+def read_batch_results(results_path):
+    """배치 결과 JSONL에서 (영화 ID, 분석 단계, 응답) 목록과 실패한 요청 ID 목록 추출"""
+    results = []
+    failed = []
+    
+    with open(results_path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            
+            item = json.loads(line)
+            custom_id = item.get("custom_id", "")
+            response = item.get("response") or {}
+            
+            if item.get("error") or response.get("status_code") != 200:
+                failed.append(custom_id)
+                continue
+            
+            movie_id, stage = parse_custom_id(custom_id)
+            content = response["body"]["choices"][0]["message"]["content"]
+            results.append((movie_id, stage, content))
+    
+    return results, failed
+
+def import_batch_results(results_path):
+    """배치 결과를 movies, plot_analysis, sentiment_analysis, relationships에 반영"""
+    results, failed = read_batch_results(results_path)
+    for custom_id in failed:
+        print(f"⚠️ 실패한 요청: {custom_id}")
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT movie_id FROM movies")
+    existing_movies = {row[0] for row in cursor.fetchall()}
+    
+    counts = {stage: 0 for stage in BATCH_STAGES}
+    updated_movies = set()
+    
+    for movie_id, stage, content in sorted(results, key=lambda result: INGEST_ORDER[result[1]]):
+        if movie_id not in existing_movies:
+            print(f"⚠️ 영화 ID {movie_id}가 없어 '{stage}' 결과를 건너뜁니다.")
+            continue
+        
+        if stage == "summary":
+            save_movie_summary(conn, movie_id, content)
+        elif stage == "characters":
+            save_character_relationships(movie_id, content, conn)
+        else:
+            # 구조화 데이터와 감정 분석은 JSON 응답만 반영
+            data = parse_json_response(content)
+            if not isinstance(data, dict):
+                print(f"⚠️ 영화 ID {movie_id}의 '{stage}' 결과가 JSON 형식이 아니어서 건너뜁니다.")
+                continue
+            
+            if stage == "structured":
+                save_structured_data(conn, movie_id, data)
+                save_plot_analysis(movie_id, data, conn)
+            else:
+                save_sentiment(conn, movie_id, data)
+        
+        counts[stage] += 1
+        updated_movies.add(movie_id)
+    
+    # 상세 화면용 스냅샷 갱신
+    for movie_id in updated_movies:
+        rebuild_movie_snapshot(conn, movie_id)
+    
+    conn.commit()
+    conn.close()
+    
+    report = ", ".join(f"{stage} {count}개" for stage, count in counts.items() if count)
+    print(f"✅ 영화 {len(updated_movies)}편에 결과를 반영했습니다. ({report or '반영된 결과 없음'}, 실패 {len(failed)}개)")
+    return counts
@@ -4,7 +4,9 @@ import sqlite3
 from datetime import datetime
 from db_schema import get_db_connection, init_database
 from character_extraction import process_character_data
-from scene_extraction import process_scene_data
+from scene_extraction import process_scene_data, extract_text_from_pdf
+from movie_snapshot import rebuild_movie_snapshot
+from search_index import has_script_documents, index_movie_text, index_movie_scenes
 
 def extract_movie_title(file_name):
     """파일명에서 영화 제목 추출"""
@@ -136,8 +138,13 @@ def process_single_file(conn, pdf_path):
         print(f"❌ 파일이 존재하지 않습니다: {pdf_path}")
         return False
     
-    # 파일이 수정되었는지 확인
+    # 파일이 수정되었는지 확인 (변경이 없어도 대본 본문이 색인되지 않은 영화는 색인만 수행)
     if not is_file_modified(conn, pdf_path):
+        movie_id = get_movie_id(conn, pdf_path)
+        if not has_script_documents(conn, movie_id):
+            index_movie_text(conn, movie_id, extract_text_from_pdf(pdf_path))
+            conn.commit()
+            print(f"🔎 '{os.path.basename(pdf_path)}' 대본 본문을 검색 인덱스에 추가했습니다.")
         print(f"🔄 '{os.path.basename(pdf_path)}' 변경 없음. 업데이트 건너뜁니다.")
         return True
     
@@ -165,6 +172,14 @@ def process_single_file(conn, pdf_path):
     # 영화 수정 시간 업데이트
     update_movie_modified_time(conn, movie_id, pdf_path)
     
+    # 검색 인덱스 갱신
+    index_movie_text(conn, movie_id, extract_text_from_pdf(pdf_path))
+    index_movie_scenes(conn, movie_id)
+    
+    # 상세 화면용 스냅샷 갱신
+    rebuild_movie_snapshot(conn, movie_id)
+    conn.commit()
+    
     print(f"✅ '{os.path.basename(pdf_path)}' 데이터베이스 업데이트 완료!\n")
     return True
 
@@ -209,7 +224,7 @@ def delete_movie_data(conn, movie_id=None, filename=None):
         movie_id = result[0]
     
     # 연결된 데이터 삭제
-    tables = ["sentiment_analysis", "plot_analysis", "relationships", "characters", "scenes"]
+    tables = ["jobs", "movie_snapshots", "search_documents", "analysis_sources", "sentiment_analysis", "plot_analysis", "relationships", "characters", "scenes"]
     for table in tables:
         cursor.execute(f"DELETE FROM {table} WHERE movie_id = ?", (movie_id,))
     
@@ -0,0 +1,124 @@
+import os
+import gzip
+import shutil
+import sqlite3
+import tempfile
+from db_schema import SCHEMA_VERSION, upgrade_schema
+
+# 백업 한 단계에서 복사할 페이지 수 (단계 사이에 다른 연결이 쓰기 가능)
+BACKUP_PAGES_PER_STEP = 256
+
+# 백업 단계 사이 대기 시간 (초)
+BACKUP_STEP_SLEEP = 0.01
+
+# 압축/복사 시 읽기 단위
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# 복원 파일에 반드시 있어야 하는 테이블
+REQUIRED_TABLES = ("movies", "characters", "scenes", "relationships",
+                   "sentiment_analysis", "plot_analysis")
+
+# 복원 시 다른 연결의 작업이 끝나기를 기다리는 최대 시간 (초)
+RESTORE_LOCK_TIMEOUT = 30
+
+# gzip 파일 식별자
+GZIP_MAGIC = b"\x1f\x8b"
+
+def backup_database(dest_path, db_path="scripts.db", compress=False, progress=None,
+                    pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP):
+    """SQLite 백업 API로 실행 중인 데이터베이스의 일관된 백업 생성 (progress(복사한 페이지, 전체 페이지))"""
+    backup_path = f"{dest_path}.tmp" if compress else dest_path
+    
+    def report(status, remaining, total):
+        if progress and total:
+            progress(total - remaining, total)
+    
+    source = sqlite3.connect(db_path)
+    target = sqlite3.connect(backup_path)
+    try:
+        # 페이지 단위로 나눠 복사 (단계 사이에 잠금을 풀어 쓰기 작업이 멈추지 않음)
+        source.backup(target, pages=pages, progress=report, sleep=sleep)
+    finally:
+        target.close()
+        source.close()
+    
+    if compress:
+        # 백업 파일을 스트리밍으로 압축
+        with open(backup_path, "rb") as src, gzip.open(dest_path, "wb") as dst:
+            shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+        os.remove(backup_path)
+    
+    return os.path.getsize(dest_path)
+
+def validate_database(db_path):
+    """복원할 데이터베이스 파일 검증 후 현재 스키마로 업그레이드"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    try:
+        # 무결성 검사
+        cursor.execute("PRAGMA integrity_check")
+        result = cursor.fetchone()[0]
+    except sqlite3.DatabaseError as e:
+        conn.close()
+        raise ValueError(f"SQLite 데이터베이스 파일이 아닙니다: {str(e)}")
+    
+    try:
+        if result != "ok":
+            raise ValueError(f"무결성 검사 실패: {result}")
+        
+        # 스키마 버전 확인
+        cursor.execute("PRAGMA user_version")
+        version = cursor.fetchone()[0]
+        if version > SCHEMA_VERSION:
+            raise ValueError(f"더 최신 버전의 데이터베이스입니다 (파일: {version}, 현재: {SCHEMA_VERSION})")
+        
+        # 필수 테이블 확인
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        tables = {row[0] for row in cursor.fetchall()}
+        missing = [table for table in REQUIRED_TABLES if table not in tables]
+        if missing:
+            raise ValueError(f"필수 테이블이 없습니다: {', '.join(missing)}")
+        
+        # 이전 버전 파일은 복원 전에 업그레이드
+        upgrade_schema(conn)
+        return version
+    finally:
+        conn.close()
+
+def restore_database(uploaded_file, db_path="scripts.db"):
+    """업로드된 백업을 임시 파일로 검증한 뒤 SQLite 백업 API로 현재 데이터베이스에 덮어씀"""
+    db_dir = os.path.dirname(os.path.abspath(db_path))
+    fd, temp_path = tempfile.mkstemp(prefix=".restore_", suffix=".db", dir=db_dir)
+    
+    try:
+        # 업로드 파일을 임시 파일로 스트리밍 (gzip 백업은 압축 해제)
+        with os.fdopen(fd, "wb") as dst:
+            header = uploaded_file.read(2)
+            uploaded_file.seek(0)
+            src = gzip.GzipFile(fileobj=uploaded_file) if header == GZIP_MAGIC else uploaded_file
+            shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+        
+        version = validate_database(temp_path)
+        
+        # 파일을 바꿔치기하면 이미 열린 연결(다른 세션, 작업 워커)은 지워진 이전 파일에 계속 쓰므로
+        # 백업 API로 현재 파일에 한 번에 덮어씀 (잠금을 지키며 복사하고 모든 연결이 복원된 내용을 봄)
+        source = sqlite3.connect(temp_path)
+        target = sqlite3.connect(db_path, timeout=RESTORE_LOCK_TIMEOUT)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        
+        return version
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def open_backup_file(path):
+    """백업 파일 다운로드용 리더 (호출될 때 파일을 읽음)"""
+    def read():
+        with open(path, "rb") as f:
+            return f.read()
+    return read
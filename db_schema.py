@@ -1,17 +1,25 @@
 import sqlite3
 import os
 
-def init_database(db_path="scripts.db"):
-    """데이터베이스 초기화 및 테이블 생성"""
-    # 디렉토리가 없으면 생성
-    db_dir = os.path.dirname(db_path)
-    if db_dir and not os.path.exists(db_dir):
-        os.makedirs(db_dir)
-    
-    # 데이터베이스 연결
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
+# 스키마 버전 (PRAGMA user_version 으로 관리)
+SCHEMA_VERSION = 9
+
+# 영화, 분석 단계, 장면별로 남길 감정 분석 기록 수 (가장 최근 결과가 현재 결과)
+SENTIMENT_HISTORY_LIMIT = int(os.getenv("SENTIMENT_HISTORY_LIMIT", 3))
+
+# 기존 테이블에 나중에 추가된 열 (테이블, 열 이름, 정의)
+ADDED_COLUMNS = (
+    ("sentiment_analysis", "stage", "TEXT NOT NULL DEFAULT 'overall'"),
+    ("sentiment_analysis", "is_current", "INTEGER NOT NULL DEFAULT 0"),
+    ("sentiment_analysis", "created_at", "REAL"),
+    ("llm_calls", "planned_tokens", "INTEGER NOT NULL DEFAULT 0"),
+)
+
+# 이번 프로세스에서 스키마 확인이 끝난 데이터베이스 경로
+_checked_paths = set()
+
+def create_tables(cursor):
+    """테이블 생성 (이미 있는 테이블은 건너뜀)"""
     # 영화 테이블 생성
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS movies (
@@ -81,12 +89,18 @@ def init_database(db_path="scripts.db"):
         sentiment_score REAL,
         sentiment_label TEXT,
         sentiment_text TEXT,
+        stage TEXT NOT NULL DEFAULT 'overall',
+        is_current INTEGER NOT NULL DEFAULT 0,
+        created_at REAL,
         FOREIGN KEY (movie_id) REFERENCES movies (movie_id),
         FOREIGN KEY (scene_id) REFERENCES scenes (scene_id),
         FOREIGN KEY (character_id) REFERENCES characters (character_id)
     )
     ''')
     
+    # 현재 감정 분석 결과를 바로 찾기 위한 인덱스
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sentiment_current ON sentiment_analysis (movie_id, stage, is_current)")
+    
     # 줄거리 분석 테이블 생성
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS plot_analysis (
@@ -109,20 +123,342 @@ def init_database(db_path="scripts.db"):
     )
     ''')
     
+    # 영화별 분석 스냅샷 테이블 생성 (상세 화면을 한 번의 조회로 표시)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS movie_snapshots (
+        movie_id INTEGER PRIMARY KEY,
+        snapshot TEXT NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (movie_id) REFERENCES movies (movie_id)
+    )
+    ''')
+    
+    # 전체 통계 테이블 생성 (단일 행, 트리거로 갱신)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS corpus_stats (
+        stats_id INTEGER PRIMARY KEY CHECK (stats_id = 1),
+        movie_count INTEGER NOT NULL DEFAULT 0,
+        character_count INTEGER NOT NULL DEFAULT 0,
+        scene_count INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO corpus_stats (stats_id) VALUES (1)")
+    
+    # 영화별 통계 테이블 생성 (최다 등장인물/씬 조회용)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS movie_stats (
+        movie_id INTEGER PRIMARY KEY,
+        character_count INTEGER NOT NULL DEFAULT 0,
+        scene_count INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY (movie_id) REFERENCES movies (movie_id)
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_movie_stats_characters ON movie_stats (character_count)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_movie_stats_scenes ON movie_stats (scene_count)")
+    
+    # 통계 갱신 트리거 생성
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_movies_insert_stats AFTER INSERT ON movies
+    BEGIN
+        INSERT OR IGNORE INTO movie_stats (movie_id) VALUES (NEW.movie_id);
+        UPDATE corpus_stats SET movie_count = movie_count + 1 WHERE stats_id = 1;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_movies_delete_stats AFTER DELETE ON movies
+    BEGIN
+        DELETE FROM movie_stats WHERE movie_id = OLD.movie_id;
+        UPDATE corpus_stats SET movie_count = movie_count - 1 WHERE stats_id = 1;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_characters_insert_stats AFTER INSERT ON characters
+    BEGIN
+        UPDATE movie_stats SET character_count = character_count + 1 WHERE movie_id = NEW.movie_id;
+        UPDATE corpus_stats SET character_count = character_count + 1 WHERE stats_id = 1;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_characters_delete_stats AFTER DELETE ON characters
+    BEGIN
+        UPDATE movie_stats SET character_count = character_count - 1 WHERE movie_id = OLD.movie_id;
+        UPDATE corpus_stats SET character_count = character_count - 1 WHERE stats_id = 1;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_scenes_insert_stats AFTER INSERT ON scenes
+    BEGIN
+        UPDATE movie_stats SET scene_count = scene_count + 1 WHERE movie_id = NEW.movie_id;
+        UPDATE corpus_stats SET scene_count = scene_count + 1 WHERE stats_id = 1;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_scenes_delete_stats AFTER DELETE ON scenes
+    BEGIN
+        UPDATE movie_stats SET scene_count = scene_count - 1 WHERE movie_id = OLD.movie_id;
+        UPDATE corpus_stats SET scene_count = scene_count - 1 WHERE stats_id = 1;
+    END
+    ''')
+    
+    # 검색 문서 테이블 생성 (대본, 대사, 장면 헤딩, AI 요약)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS search_documents (
+        doc_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        movie_id INTEGER NOT NULL,
+        source TEXT NOT NULL,
+        ref TEXT,
+        body TEXT NOT NULL,
+        FOREIGN KEY (movie_id) REFERENCES movies (movie_id)
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_search_documents_movie ON search_documents (movie_id, source)")
+    
+    # 전문 검색 인덱스 생성 (한국어 검색을 위해 trigram 토크나이저 사용)
+    try:
+        cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS script_search USING fts5(
+            body, content='search_documents', content_rowid='doc_id', tokenize='trigram'
+        )
+        ''')
+    except sqlite3.OperationalError:
+        # trigram을 지원하지 않는 SQLite 버전은 기본 토크나이저 사용
+        cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS script_search USING fts5(
+            body, content='search_documents', content_rowid='doc_id'
+        )
+        ''')
+    
+    # 검색 문서와 전문 검색 인덱스 동기화 트리거 생성
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_search_documents_insert AFTER INSERT ON search_documents
+    BEGIN
+        INSERT INTO script_search (rowid, body) VALUES (NEW.doc_id, NEW.body);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_search_documents_delete AFTER DELETE ON search_documents
+    BEGIN
+        INSERT INTO script_search (script_search, rowid, body) VALUES ('delete', OLD.doc_id, OLD.body);
+    END
+    ''')
+    
+    # 청크 요약 테이블 생성 (내용이 같은 청크는 다시 요약하지 않음)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS chunk_summaries (
+        chunk_hash TEXT NOT NULL,
+        model TEXT NOT NULL,
+        summary TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (chunk_hash, model)
+    )
+    ''')
+    
+    # 분석 결과별 출처 청크 테이블 생성
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS analysis_sources (
+        movie_id INTEGER NOT NULL,
+        artifact TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        chunk_hash TEXT NOT NULL,
+        PRIMARY KEY (movie_id, artifact, position),
+        FOREIGN KEY (movie_id) REFERENCES movies (movie_id)
+    )
+    ''')
+    
+    # 분석 작업 대기열 테이블 생성 (워커가 임대 시간을 갱신하며 실행)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS jobs (
+        job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        job_type TEXT NOT NULL,
+        movie_id INTEGER,
+        payload TEXT,
+        state TEXT NOT NULL DEFAULT 'queued',
+        stage TEXT,
+        progress TEXT,
+        partial TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL DEFAULT 3,
+        worker_id TEXT,
+        lease_until REAL,
+        available_at REAL NOT NULL DEFAULT 0,
+        result TEXT,
+        error TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        started_at TIMESTAMP,
+        updated_at TIMESTAMP,
+        finished_at TIMESTAMP
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state, available_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_movie ON jobs (movie_id, job_type)")
+    
+    # LLM API 호출 기록 테이블 생성 (단계, 모델, 계획/실제 토큰, 지연 시간, 재시도, 캐시 적중)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS llm_calls (
+        call_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        movie_id INTEGER,
+        stage TEXT,
+        model TEXT NOT NULL,
+        planned_tokens INTEGER NOT NULL DEFAULT 0,
+        prompt_tokens INTEGER NOT NULL DEFAULT 0,
+        completion_tokens INTEGER NOT NULL DEFAULT 0,
+        latency REAL NOT NULL,
+        retries INTEGER NOT NULL DEFAULT 0,
+        cache_hit INTEGER NOT NULL DEFAULT 0,
+        error TEXT,
+        created_at REAL NOT NULL
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_created ON llm_calls (created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_movie ON llm_calls (movie_id, stage)")
+    
+    # 같은 스크립트 분석 중복 실행 방지용 잠금 테이블 (내용 해시와 분석 단계별로 한 곳에서만 실행하고 결과 공유)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS analysis_locks (
+        content_hash TEXT NOT NULL,
+        stage TEXT NOT NULL,
+        owner TEXT NOT NULL,
+        state TEXT NOT NULL DEFAULT 'running',
+        lease_until REAL NOT NULL,
+        result TEXT,
+        error TEXT,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (content_hash, stage)
+    )
+    ''')
+
+def refresh_stats(cursor):
+    """통계 테이블을 실제 데이터 기준으로 다시 계산"""
+    cursor.execute("DELETE FROM movie_stats")
+    cursor.execute("""
+        INSERT INTO movie_stats (movie_id, character_count, scene_count)
+        SELECT m.movie_id,
+               (SELECT COUNT(*) FROM characters c WHERE c.movie_id = m.movie_id),
+               (SELECT COUNT(*) FROM scenes s WHERE s.movie_id = m.movie_id)
+        FROM movies m
+    """)
+    cursor.execute("""
+        UPDATE corpus_stats
+        SET movie_count = (SELECT COUNT(*) FROM movies),
+            character_count = (SELECT COUNT(*) FROM characters),
+            scene_count = (SELECT COUNT(*) FROM scenes)
+        WHERE stats_id = 1
+    """)
+
+def add_missing_columns(cursor):
+    """기존 테이블에 나중에 추가된 열 추가 (테이블이 아직 없으면 create_tables에서 생성)"""
+    for table, column, definition in ADDED_COLUMNS:
+        columns = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})").fetchall()}
+        if columns and column not in columns:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+def compact_sentiment_history(cursor, movie_id=None, keep=SENTIMENT_HISTORY_LIMIT):
+    """감정 분석 기록을 영화, 단계, 장면, 인물별 최근 keep개만 남기고 가장 최근 결과를 현재 결과로 표시 (movie_id를 주면 그 영화만)"""
+    cursor.execute("""
+        WITH ranked AS (
+            SELECT sentiment_id, ROW_NUMBER() OVER (
+                PARTITION BY movie_id, stage, scene_id, character_id ORDER BY sentiment_id DESC
+            ) AS position
+            FROM sentiment_analysis
+            WHERE ? IS NULL OR movie_id = ?
+        )
+        DELETE FROM sentiment_analysis
+        WHERE sentiment_id IN (SELECT sentiment_id FROM ranked WHERE position > ?)
+    """, (movie_id, movie_id, keep))
+    cursor.execute("""
+        UPDATE sentiment_analysis
+        SET is_current = sentiment_id IN (
+            SELECT MAX(sentiment_id) FROM sentiment_analysis
+            WHERE ? IS NULL OR movie_id = ?
+            GROUP BY movie_id, stage, scene_id, character_id
+        )
+        WHERE ? IS NULL OR movie_id = ?
+    """, (movie_id, movie_id, movie_id, movie_id))
+
+def upgrade_schema(conn):
+    """기존 데이터베이스를 현재 스키마 버전으로 업그레이드"""
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA user_version")
+    version = cursor.fetchone()[0]
+    
+    if version >= SCHEMA_VERSION:
+        return False
+    
+    # 기존 테이블에 추가된 열을 먼저 만들고 (새 열을 쓰는 인덱스가 있으므로) 새로 추가된 테이블 생성
+    add_missing_columns(cursor)
+    create_tables(cursor)
+    
+    # 통계 테이블이 새로 생긴 경우 기존 데이터로 채움
+    if version < 2:
+        refresh_stats(cursor)
+    
+    # 검색 인덱스가 새로 생긴 경우 기존 장면 헤딩, 요약, 대본 본문을 색인
+    if version < 3:
+        cursor.execute("""
+            INSERT INTO search_documents (movie_id, source, ref, body)
+            SELECT movie_id, 'scene', scene_number, heading
+            FROM scenes
+            WHERE heading IS NOT NULL AND heading != ''
+        """)
+        cursor.execute("""
+            INSERT INTO search_documents (movie_id, source, ref, body)
+            SELECT movie_id, 'summary', '', summary
+            FROM movies
+            WHERE summary IS NOT NULL AND summary != ''
+        """)
+        
+        # 대본 본문은 저장된 파일 경로에서 다시 읽음 (파일이 없으면 data_uploader가 다음에 확인할 때 색인)
+        from scene_extraction import extract_text_from_pdf, find_pdf_file
+        from search_index import index_movie_text
+        cursor.execute("SELECT movie_id, file_path FROM movies WHERE file_path IS NOT NULL")
+        for movie_id, file_path in cursor.fetchall():
+            pdf_path = find_pdf_file(file_path)
+            if pdf_path:
+                index_movie_text(conn, movie_id, extract_text_from_pdf(pdf_path))
+    
+    # 쌓여 있던 감정 분석 기록 정리 후 JSON을 공백 없이 다시 저장
+    if version < 8:
+        compact_sentiment_history(cursor)
+        cursor.execute("""
+            UPDATE sentiment_analysis SET sentiment_text = json(sentiment_text)
+            WHERE json_valid(sentiment_text)
+        """)
+    
+    cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
     conn.commit()
+    return True
+
+def init_database(db_path="scripts.db"):
+    """데이터베이스 초기화 및 테이블 생성"""
+    # 디렉토리가 없으면 생성
+    db_dir = os.path.dirname(db_path)
+    if db_dir and not os.path.exists(db_dir):
+        os.makedirs(db_dir)
+    
+    # 데이터베이스 연결
+    conn = sqlite3.connect(db_path)
+    upgrade_schema(conn)
     conn.close()
     
+    _checked_paths.add(os.path.abspath(db_path))
     print("✅ 데이터베이스 초기화 완료")
 
 def check_db_exists(db_path="scripts.db"):
     """데이터베이스 파일이 존재하는지 확인"""
     return os.path.exists(db_path)
 
-def get_db_connection(db_path="scripts.db"):
-    """데이터베이스 연결을 반환"""
+def get_db_connection(db_path="scripts.db", timeout=5.0, check_same_thread=True):
+    """데이터베이스 연결을 반환 (timeout은 다른 연결의 잠금을 기다리는 시간)"""
     if not check_db_exists(db_path):
         init_database(db_path)
-    return sqlite3.connect(db_path)
+    conn = sqlite3.connect(db_path, timeout=timeout, check_same_thread=check_same_thread)
+    
+    # 기존 데이터베이스는 프로세스당 한 번 스키마 업그레이드 확인
+    abs_path = os.path.abspath(db_path)
+    if abs_path not in _checked_paths:
+        upgrade_schema(conn)
+        _checked_paths.add(abs_path)
+    return conn
 
 if __name__ == "__main__":
     # 데이터베이스 초기화
@@ -0,0 +1,434 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+from db_schema import get_db_connection
+from data_uploader import process_single_file
+from ai_analyzer import process_ai_analysis
+from llm_client import flush_llm_calls
+
+# 작업 상태
+JOB_STATES = {
+    "queued": "대기",
+    "running": "실행 중",
+    "done": "완료",
+    "failed": "실패"
+}
+
+# 끝난 작업 상태
+FINISHED_STATES = ("done", "failed")
+
+# 작업 종류
+JOB_TYPES = {
+    "basic": "기본 분석",
+    "ai": "AI 분석"
+}
+
+# 작업 임대 시간 (초): 이 시간 안에 임대를 갱신하지 않은 작업은 다른 워커가 가져감
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "120"))
+
+# 임대 갱신 간격 (초)
+JOB_HEARTBEAT_INTERVAL = JOB_LEASE_SECONDS / 4
+
+# 작업당 최대 시도 횟수
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+# 실패한 작업을 다시 시도하기 전 기본 대기 시간 (초, 시도마다 2배)
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "30"))
+
+# 대기 중인 작업이 없을 때 다시 확인하는 간격 (초)
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+
+# 다른 워커가 쓰는 중일 때 기다리는 최대 시간 (밀리초)
+JOB_BUSY_TIMEOUT = 30000
+
+# 작성 중인 요약을 저장하는 최소 간격 (초)
+JOB_PARTIAL_INTERVAL = 1.0
+
+# 워커가 처리할 업로드 파일 보관 폴더
+JOB_FILES_DIR = "job_files"
+
+# 작업 조회 컬럼
+JOB_COLUMNS = ("job_id", "job_type", "movie_id", "payload", "state", "stage", "progress", "partial",
+               "attempts", "max_attempts", "worker_id", "lease_until", "available_at", "result",
+               "error", "created_at", "started_at", "updated_at", "finished_at")
+
+def _connect():
+    """작업 큐용 데이터베이스 연결 (여러 워커가 동시에 쓰므로 잠금 대기 시간 설정)"""
+    conn = get_db_connection()
+    conn.execute(f"PRAGMA busy_timeout = {JOB_BUSY_TIMEOUT}")
+    return conn
+
+def _row_to_job(row):
+    """작업 행을 딕셔너리로 변환"""
+    job = dict(zip(JOB_COLUMNS, row))
+    for key in ("payload", "progress", "result"):
+        job[key] = json.loads(job[key]) if job[key] else {}
+    return job
+
+def make_worker_id():
+    """호스트 이름과 프로세스 ID로 워커 ID 생성"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+def store_job_file(filename, data):
+    """업로드된 파일을 워커가 읽을 수 있는 위치에 저장하고 경로 반환"""
+    os.makedirs(JOB_FILES_DIR, exist_ok=True)
+    path = os.path.join(JOB_FILES_DIR, os.path.basename(filename))
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+def enqueue_job(job_type, movie_id=None, payload=None, max_attempts=JOB_MAX_ATTEMPTS):
+    """작업 등록 (같은 영화의 같은 작업이 아직 끝나지 않았으면 기존 작업 ID 반환)"""
+    if job_type not in JOB_TYPES:
+        raise ValueError(f"알 수 없는 작업 종류입니다: {job_type}")
+    
+    conn = _connect()
+    cursor = conn.cursor()
+    
+    if movie_id is not None:
+        cursor.execute("""
+            SELECT job_id FROM jobs
+            WHERE job_type = ? AND movie_id = ? AND state IN ('queued', 'running')
+            ORDER BY job_id
+            LIMIT 1
+        """, (job_type, movie_id))
+        existing = cursor.fetchone()
+        if existing:
+            conn.close()
+            return existing[0]
+    
+    cursor.execute("""
+        INSERT INTO jobs (job_type, movie_id, payload, max_attempts, available_at)
+        VALUES (?, ?, ?, ?, ?)
+    """, (job_type, movie_id, json.dumps(payload or {}, ensure_ascii=False), max_attempts, time.time()))
+    job_id = cursor.lastrowid
+    conn.commit()
+    conn.close()
+    return job_id
+
+def claim_job(worker_id, job_types=None, lease_seconds=JOB_LEASE_SECONDS):
+    """실행할 작업 하나를 임대 (대기 중이거나 임대가 만료된 작업, 없으면 None)"""
+    now = time.time()
+    type_filter = ""
+    params = []
+    if job_types:
+        type_filter = f"AND job_type IN ({', '.join('?' for _ in job_types)})"
+        params = list(job_types)
+    
+    conn = _connect()
+    cursor = conn.cursor()
+    
+    # 임대가 만료됐지만 더 시도할 수 없는 작업은 실패 처리
+    cursor.execute("""
+        UPDATE jobs
+        SET state = 'failed', worker_id = NULL, lease_until = NULL,
+            error = COALESCE(error, '작업 임대 만료'),
+            updated_at = CURRENT_TIMESTAMP, finished_at = CURRENT_TIMESTAMP
+        WHERE state = 'running' AND lease_until < ? AND attempts >= max_attempts
+    """, (now,))
+    
+    # 조회와 임대를 한 문장으로 처리해 여러 워커가 같은 작업을 가져가지 않음
+    cursor.execute(f"""
+        UPDATE jobs
+        SET state = 'running', worker_id = ?, lease_until = ?, attempts = attempts + 1,
+            started_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+        WHERE job_id = (
+            SELECT job_id FROM jobs
+            WHERE ((state = 'queued' AND available_at <= ?)
+                   OR (state = 'running' AND lease_until < ?))
+              {type_filter}
+            ORDER BY job_id
+            LIMIT 1
+        )
+        RETURNING {', '.join(JOB_COLUMNS)}
+    """, [worker_id, now + lease_seconds, now, now, *params])
+    row = cursor.fetchone()
+    conn.commit()
+    conn.close()
+    return _row_to_job(row) if row else None
+
+def heartbeat_job(job_id, worker_id, lease_seconds=JOB_LEASE_SECONDS):
+    """작업 임대 연장 (다른 워커가 가져간 작업이면 False)"""
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE jobs
+        SET lease_until = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE job_id = ? AND worker_id = ? AND state = 'running'
+    """, (time.time() + lease_seconds, job_id, worker_id))
+    conn.commit()
+    owned = cursor.rowcount == 1
+    conn.close()
+    return owned
+
+def update_job_progress(job_id, worker_id, stage=None, progress=None, partial=None):
+    """작업의 현재 단계, 단계별 진행 상태, 작성 중인 결과 저장"""
+    conn = _connect()
+    conn.execute("""
+        UPDATE jobs
+        SET stage = COALESCE(?, stage), progress = COALESCE(?, progress), partial = COALESCE(?, partial),
+            updated_at = CURRENT_TIMESTAMP
+        WHERE job_id = ? AND worker_id = ? AND state = 'running'
+    """, (stage, json.dumps(progress) if progress is not None else None, partial, job_id, worker_id))
+    conn.commit()
+    conn.close()
+
+def check_job_lease(conn, job_id, worker_id):
+    """작업 임대가 아직 이 워커에 있는지 확인 (결과 저장 트랜잭션 안에서 호출, 잃었으면 RuntimeError)"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT 1 FROM jobs
+        WHERE job_id = ? AND worker_id = ? AND state = 'running' AND lease_until > ?
+    """, (job_id, worker_id, time.time()))
+    if not cursor.fetchone():
+        raise RuntimeError(f"작업 {job_id}의 임대를 잃어 결과를 저장하지 않았습니다.")
+
+def _remove_job_files(cursor, job_id):
+    """끝난 작업이 store_job_file로 저장한 업로드 파일 삭제 (아직 끝나지 않은 다른 작업이 쓰는 파일은 남김)"""
+    cursor.execute("SELECT payload FROM jobs WHERE job_id = ?", (job_id,))
+    row = cursor.fetchone()
+    payload = json.loads(row[0]) if row and row[0] else {}
+    files_dir = os.path.abspath(JOB_FILES_DIR) + os.sep
+    paths = {payload.get(key) for key in ("file_path", "pdf_path")}
+    paths = {path for path in paths if path and os.path.abspath(path).startswith(files_dir)}
+    if not paths:
+        return
+    
+    cursor.execute("SELECT payload FROM jobs WHERE state IN ('queued', 'running') AND job_id != ?", (job_id,))
+    for (other,) in cursor.fetchall():
+        other = json.loads(other) if other else {}
+        paths -= {other.get("file_path"), other.get("pdf_path")}
+    
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"⚠️ 작업 파일 삭제 실패 ({path}): {str(e)}")
+
+def complete_job(job_id, worker_id, result):
+    """작업 완료 처리 후 업로드 파일 삭제 (임대를 잃은 작업이면 False)"""
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE jobs
+        SET state = 'done', result = ?, partial = NULL, error = NULL,
+            movie_id = COALESCE(movie_id, ?), worker_id = NULL, lease_until = NULL,
+            updated_at = CURRENT_TIMESTAMP, finished_at = CURRENT_TIMESTAMP
+        WHERE job_id = ? AND worker_id = ? AND state = 'running'
+    """, (json.dumps(result, ensure_ascii=False), result.get("movie_id"), job_id, worker_id))
+    conn.commit()
+    owned = cursor.rowcount == 1
+    if owned:
+        _remove_job_files(cursor, job_id)
+    conn.close()
+    return owned
+
+def fail_job(job_id, worker_id, error):
+    """작업 실패 처리 (시도 횟수가 남았으면 잠시 뒤 다시 대기열에 넣고, 마지막 시도였으면 업로드 파일 삭제)"""
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute("SELECT attempts, max_attempts FROM jobs WHERE job_id = ? AND worker_id = ?",
+                   (job_id, worker_id))
+    row = cursor.fetchone()
+    if not row:
+        conn.close()
+        return None
+    
+    attempts, max_attempts = row
+    state = "queued" if attempts < max_attempts else "failed"
+    available_at = time.time() + JOB_RETRY_DELAY * 2 ** (attempts - 1)
+    cursor.execute("""
+        UPDATE jobs
+        SET state = ?, error = ?, available_at = ?, worker_id = NULL, lease_until = NULL,
+            updated_at = CURRENT_TIMESTAMP,
+            finished_at = CASE WHEN ? = 'failed' THEN CURRENT_TIMESTAMP END
+        WHERE job_id = ? AND worker_id = ?
+    """, (state, str(error), available_at, state, job_id, worker_id))
+    conn.commit()
+    if state == "failed":
+        _remove_job_files(cursor, job_id)
+    conn.close()
+    return state
+
+def retry_job(job_id):
+    """실패한 작업을 시도 횟수를 초기화해 다시 대기열에 넣음"""
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE jobs
+        SET state = 'queued', attempts = 0, error = NULL, available_at = ?,
+            updated_at = CURRENT_TIMESTAMP, finished_at = NULL
+        WHERE job_id = ? AND state = 'failed'
+    """, (time.time(), job_id))
+    conn.commit()
+    retried = cursor.rowcount == 1
+    conn.close()
+    return retried
+
+def get_jobs(job_ids):
+    """작업 ID 목록으로 작업 조회 (작업 ID -> 작업)"""
+    if not job_ids:
+        return {}
+    
+    conn = _connect()
+    cursor = conn.cursor()
+    placeholders = ", ".join("?" for _ in job_ids)
+    cursor.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE job_id IN ({placeholders})", list(job_ids))
+    jobs = {row[0]: _row_to_job(row) for row in cursor.fetchall()}
+    conn.close()
+    return jobs
+
+def get_job(job_id):
+    """작업 한 건 조회 (없으면 None)"""
+    return get_jobs([job_id]).get(job_id)
+
+def count_jobs():
+    """상태별 작업 수 조회"""
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state")
+    counts = {state: 0 for state in JOB_STATES}
+    counts.update(dict(cursor.fetchall()))
+    conn.close()
+    return counts
+
+def run_basic_job(job, report):
+    """기본 분석 작업 실행 (AI 분석이 요청된 경우 이어서 AI 분석 작업 등록)"""
+    payload = job["payload"]
+    file_path = payload["file_path"]
+    report(stage="basic")
+    
+    conn = _connect()
+    try:
+        if not process_single_file(conn, file_path):
+            raise RuntimeError(f"기본 분석 실패: {os.path.basename(file_path)}")
+        
+        cursor = conn.cursor()
+        cursor.execute("SELECT movie_id FROM movies WHERE filename = ?", (os.path.basename(file_path),))
+        movie = cursor.fetchone()
+    finally:
+        conn.close()
+    
+    if not movie:
+        raise RuntimeError(f"영화 ID를 찾을 수 없습니다: {os.path.basename(file_path)}")
+    
+    result = {"movie_id": movie[0]}
+    if payload.get("run_ai"):
+        result["ai_job_id"] = enqueue_job("ai", movie[0], {"pdf_path": file_path})
+    return result
+
+def run_ai_job(job, report):
+    """AI 분석 작업 실행 (단계별 진행 상태와 작성 중인 요약을 작업에 기록)"""
+    progress = {}
+    last_partial = [0.0]
+    lock = threading.Lock()
+    
+    def on_event(event):
+        with lock:
+            if event["type"] in ("start", "done"):
+                progress[event["stage"]] = event["type"]
+                report(stage=event["stage"] if event["type"] == "start" else None, progress=dict(progress))
+            elif event["type"] == "partial" and event["stage"] == "summary":
+                # 작성 중인 요약은 너무 자주 쓰지 않도록 간격을 두고 저장
+                if time.time() - last_partial[0] >= JOB_PARTIAL_INTERVAL:
+                    last_partial[0] = time.time()
+                    report(partial=event["text"])
+    
+    # 결과 저장은 작업 임대를 아직 가진 경우에만 같은 트랜잭션에서 커밋
+    result = process_ai_analysis(job["movie_id"], pdf_path=job["payload"]["pdf_path"],
+                                 on_event=on_event, stream=True,
+                                 before_commit=lambda conn: check_job_lease(conn, job["job_id"], job["worker_id"]))
+    if not result["success"]:
+        raise RuntimeError(result["message"])
+    return result
+
+# 작업 종류별 실행 함수
+JOB_HANDLERS = {
+    "basic": run_basic_job,
+    "ai": run_ai_job
+}
+
+def run_job(job, worker_id):
+    """임대한 작업 실행 (실행 중에는 주기적으로 임대 연장)"""
+    stop = threading.Event()
+    
+    def keep_lease():
+        while not stop.wait(JOB_HEARTBEAT_INTERVAL):
+            try:
+                if not heartbeat_job(job["job_id"], worker_id):
+                    print(f"⚠️ 작업 {job['job_id']}의 임대를 잃었습니다.")
+                    return
+            except sqlite3.OperationalError as e:
+                # 다른 연결이 오래 쓰는 중이면 다음 간격에 다시 연장
+                print(f"⚠️ 작업 {job['job_id']} 임대 연장 실패: {str(e)}")
+    
+    def report(stage=None, progress=None, partial=None):
+        # 진행 상태 기록에 실패해도 작업은 계속 진행
+        try:
+            update_job_progress(job["job_id"], worker_id, stage, progress, partial)
+        except sqlite3.OperationalError as e:
+            print(f"⚠️ 작업 {job['job_id']} 진행 상태 기록 실패: {str(e)}")
+    
+    heartbeat = threading.Thread(target=keep_lease, daemon=True)
+    heartbeat.start()
+    try:
+        result = JOB_HANDLERS[job["job_type"]](job, report)
+    except Exception as e:
+        state = fail_job(job["job_id"], worker_id, e)
+        print(f"❌ 작업 {job['job_id']} 실패 ({job['attempts']}/{job['max_attempts']}회 시도, {JOB_STATES.get(state, '임대 만료')}): {str(e)}")
+        return False
+    finally:
+        stop.set()
+        heartbeat.join()
+    
+    if not complete_job(job["job_id"], worker_id, result):
+        print(f"⚠️ 작업 {job['job_id']}는 다른 워커가 가져가 결과를 저장하지 않았습니다.")
+        return False
+    
+    print(f"✅ 작업 {job['job_id']} ({JOB_TYPES[job['job_type']]}) 완료")
+    return True
+
+def run_worker(worker_id=None, job_types=None, drain=False, poll_interval=JOB_POLL_INTERVAL):
+    """대기열의 작업을 하나씩 가져와 실행 (drain이면 대기 작업이 없을 때 종료)"""
+    worker_id = worker_id or make_worker_id()
+    print(f"🚀 워커 {worker_id} 시작")
+    processed = 0
+    
+    try:
+        while True:
+            job = claim_job(worker_id, job_types)
+            if job is None:
+                if drain:
+                    break
+                time.sleep(poll_interval)
+                continue
+            
+            print(f"🔄 작업 {job['job_id']} ({JOB_TYPES[job['job_type']]}) 시작 ({job['attempts']}/{job['max_attempts']}회째)")
+            run_job(job, worker_id)
+            # 작업 중 모아 둔 API 호출 기록은 다음 작업을 기다리기 전에 저장
+            flush_llm_calls()
+            processed += 1
+    except KeyboardInterrupt:
+        print("⏹️ 워커를 중지합니다. (실행 중이던 작업은 임대가 만료되면 다시 실행됩니다)")
+    
+    print(f"워커 {worker_id} 종료 (처리한 작업 {processed}개)")
+    return processed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="분석 작업 대기열")
+    parser.add_argument("--worker", action="store_true", help="대기열의 작업을 실행하는 워커로 동작")
+    parser.add_argument("--types", help="처리할 작업 종류 (쉼표로 구분, 예: ai)")
+    parser.add_argument("--drain", action="store_true", help="대기 작업을 모두 처리하면 종료")
+    args = parser.parse_args()
+    
+    if args.worker:
+        run_worker(job_types=args.types.split(",") if args.types else None, drain=args.drain)
+    else:
+        counts = count_jobs()
+        print(" · ".join(f"{JOB_STATES[state]} {count}개" for state, count in counts.items()))
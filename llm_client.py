@@ -0,0 +1,772 @@
+import os
+import re
+import json
+import math
+import time
+import atexit
+import random
+import sqlite3
+import hashlib
+import logging
+import threading
+import contextvars
+import openai
+from dotenv import load_dotenv
+from openai import OpenAI
+from db_schema import get_db_connection
+
+# 환경 변수 로드
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# 기본 모델
+DEFAULT_MODEL = "gpt-3.5-turbo"
+
+# 모델별 컨텍스트 길이 (토큰)
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-4": 8192,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000
+}
+
+# 단계별 입력 토큰 상한 (컨텍스트가 더 커도 이 이상은 보내지 않음)
+STAGE_INPUT_BUDGETS = {
+    "summary": 9000,
+    "summary_map": 3000,
+    "summary_reduce": 6000,
+    "structured": 3000,
+    "characters": 7000,
+    "character_tree": 5000,
+    "sentiment": 5000,
+    "scene_scores": 6000
+}
+DEFAULT_INPUT_BUDGET = 4000
+
+# 단계별 모델 선택표: (입력 토큰 상한, 모델)을 순서대로 확인해 처음 맞는 모델 사용 (상한이 None이면 나머지 전부)
+# 숫자/라벨만 답하는 짧은 요청은 작고 빠른 모델, 긴 요약만 큰 모델로 보냄
+MODEL_ROUTES = {
+    "summary": ((None, "gpt-4o"),),
+    "summary_map": ((None, "gpt-4o-mini"),),
+    "summary_reduce": ((3000, "gpt-4o-mini"), (None, "gpt-4o")),
+    "structured": ((None, "gpt-4o-mini"),),
+    "characters": ((None, "gpt-4o-mini"),),
+    "character_tree": ((None, DEFAULT_MODEL),),
+    "sentiment": ((None, "gpt-4o-mini"),),
+    "combined": ((None, "gpt-4o-mini"),),
+    "plot_split": ((None, "gpt-4o"),),
+    "scene_scores": ((None, "gpt-4o-mini"),),
+    "script_qa": ((None, "gpt-4o-mini"),)
+}
+
+# 구조화 출력(json_schema)을 지원하는 모델과 JSON 모드(json_object)까지만 지원하는 모델
+STRUCTURED_OUTPUT_MODELS = ("gpt-4o", "gpt-4o-mini")
+JSON_MODE_MODELS = ("gpt-3.5-turbo",) + STRUCTURED_OUTPUT_MODELS
+
+# 구조화 출력을 지원하지 않는 모델에 스키마를 프롬프트로 넘길 때 앞에 붙이는 안내문
+JSON_SCHEMA_PROMPT = "다음 JSON 스키마에 맞는 JSON 객체 하나로만 답하세요."
+
+# 모델 선택표 사용 여부 (끄면 모든 단계에 기본 모델 사용)
+LLM_ROUTING_ENABLED = os.getenv("LLM_ROUTING_ENABLED", "1") != "0"
+
+# 느려지거나 오류가 잦은 모델 대신 쓸 더 빠른 모델
+FALLBACK_MODELS = {
+    "gpt-4": "gpt-4o-mini",
+    "gpt-4o": "gpt-4o-mini",
+    "gpt-3.5-turbo": "gpt-4o-mini"
+}
+
+# 대체 모델 전환 기준: 최근 기록(캐시 적중 제외)의 p95 지연 시간(초) 또는 오류 비율이 넘으면 전환
+LLM_FALLBACK_WINDOW = float(os.getenv("LLM_FALLBACK_WINDOW", 600))
+LLM_FALLBACK_MIN_CALLS = int(os.getenv("LLM_FALLBACK_MIN_CALLS", 5))
+LLM_FALLBACK_LATENCY = float(os.getenv("LLM_FALLBACK_LATENCY", 30.0))
+LLM_FALLBACK_ERROR_RATE = float(os.getenv("LLM_FALLBACK_ERROR_RATE", 0.3))
+
+# 모델 상태를 다시 조회하기 전까지 재사용하는 시간 (초)
+LLM_HEALTH_TTL = float(os.getenv("LLM_HEALTH_TTL", 30.0))
+_model_health = {}
+_model_health_lock = threading.Lock()
+
+# 프롬프트 지시문과 메시지 구분에 쓰이는 여유 토큰
+PROMPT_MARGIN_TOKENS = 200
+
+# 토큰 추정 보정값 (실제 usage / 추정치 의 이동 평균, 요청 한도 확인과 기록에만 사용)
+CALIBRATION_ALPHA = 0.1
+
+# 컨텍스트 한도를 계획 단위로 환산할 때 보정값을 이 간격으로 올림 (보정값이 조금 움직여도 계획이 바뀌지 않도록)
+CALIBRATION_STEP = 0.25
+
+# 모델별 보정값은 메모리에서 갱신하고 바뀐 모델만 호출 기록과 함께 저장
+_calibration = {}
+_calibration_dirty = set()
+_calibration_lock = threading.Lock()
+
+# 응답 캐시 설정
+CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") != "0"
+CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.db")
+CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", 30 * 24 * 3600))  # 30일
+CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 5000))
+CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_MB", 200)) * 1024 * 1024
+
+# 프로세스 전체에서 동시에 보낼 수 있는 최대 API 요청 수
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+_request_slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+
+# 분당 요청 수/토큰 수 한도 (0이면 제한 없음)
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", 500))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", 200000))
+
+# 재시도 설정 (지수 백오프 + 지터)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 5))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", 1.0))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", 30.0))
+
+# 요청 하나의 최대 대기 시간 (초)
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", 60.0))
+
+# 서킷 브레이커 설정 (연속 실패가 한도를 넘으면 대기 시간 동안 요청 차단)
+LLM_CIRCUIT_THRESHOLD = int(os.getenv("LLM_CIRCUIT_THRESHOLD", 5))
+LLM_CIRCUIT_COOLDOWN = float(os.getenv("LLM_CIRCUIT_COOLDOWN", 60.0))
+_circuit = {"failures": 0, "opened_at": None}
+_circuit_lock = threading.Lock()
+
+# 재시도할 수 있는 일시적 오류
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APITimeoutError,
+                    openai.APIConnectionError, openai.InternalServerError)
+
+# 사용할 LLM 백엔드 (openai: OpenAI 또는 OPENAI_BASE_URL의 호환 서버, stub: 프로세스 내 스텁)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+
+# OpenAI 클라이언트 (처음 사용할 때 생성)
+_client = None
+_client_lock = threading.Lock()
+
+# API 호출 기록 저장 여부
+LLM_TELEMETRY_ENABLED = os.getenv("LLM_TELEMETRY_ENABLED", "1") != "0"
+
+# API 호출 기록을 모아서 저장하는 개수와 최대 대기 시간 (초), 저장 시 다른 연결의 잠금을 기다리는 시간 (초)
+LLM_CALL_FLUSH_SIZE = int(os.getenv("LLM_CALL_FLUSH_SIZE", 50))
+LLM_CALL_FLUSH_INTERVAL = float(os.getenv("LLM_CALL_FLUSH_INTERVAL", 5.0))
+LLM_CALL_BUSY_TIMEOUT = 10.0
+
+# 저장 대기 중인 호출 기록과 기록 저장용 연결 (처음 저장할 때 만들고 프로세스가 끝날 때까지 재사용)
+_pending_calls = []
+_pending_since = None
+_telemetry_conn = None
+_telemetry_lock = threading.Lock()
+
+# 모델별 100만 토큰당 가격 (입력, 출력 / 달러)
+MODEL_PRICES = {
+    "gpt-3.5-turbo": (0.5, 1.5),
+    "gpt-4": (30.0, 60.0),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6)
+}
+
+# 호출 기록에 함께 남길 정보 (영화 ID 등, 다른 스레드에서 호출할 때는 컨텍스트를 복사해 넘겨야 함)
+_call_context = contextvars.ContextVar("llm_call_context", default={})
+
+# 캐시 테이블 생성 여부와 이번 프로세스의 적중 통계
+_cache_ready = False
+_cache_lock = threading.Lock()
+_cache_stats = {"hits": 0, "misses": 0}
+
+class LLMError(Exception):
+    """재시도 후에도 실패했거나 차단된 LLM 요청 오류"""
+
+class TokenBucket:
+    """분당 한도를 초 단위로 채워 가며 소비하는 토큰 버킷"""
+    
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def acquire(self, amount=1):
+        """필요한 양이 찰 때까지 기다린 뒤 차감"""
+        if self.capacity <= 0:
+            return
+        
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+    
+    def adjust(self, amount):
+        """예상과 실제 사용량의 차이를 되돌림 (음수면 추가 차감)"""
+        if self.capacity <= 0:
+            return
+        
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+# 프로세스 전체가 공유하는 요청 수/토큰 수 제한
+_request_bucket = TokenBucket(LLM_REQUESTS_PER_MINUTE)
+_token_bucket = TokenBucket(LLM_TOKENS_PER_MINUTE)
+
+def _create_openai_client():
+    """OpenAI 클라이언트 생성 (OPENAI_BASE_URL로 호환 서버 지정 가능)"""
+    # 재시도는 이 모듈에서 직접 처리
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"),
+                  base_url=os.getenv("OPENAI_BASE_URL") or None,
+                  timeout=LLM_REQUEST_TIMEOUT,
+                  max_retries=0)
+
+def _create_stub_client():
+    """네트워크 없이 동작하는 스텁 클라이언트 생성"""
+    from llm_stub_server import create_stub_client
+    return create_stub_client()
+
+# 백엔드 이름별 클라이언트 생성 함수 (chat.completions.create를 가진 객체 반환)
+LLM_BACKENDS = {
+    "openai": _create_openai_client,
+    "stub": _create_stub_client
+}
+
+def register_backend(name, factory):
+    """LLM 백엔드 등록"""
+    LLM_BACKENDS[name] = factory
+
+def set_backend(name):
+    """사용할 LLM 백엔드 변경 (다음 요청부터 새 클라이언트 사용)"""
+    global LLM_BACKEND, _client
+    if name not in LLM_BACKENDS:
+        raise ValueError(f"등록되지 않은 LLM 백엔드입니다: {name}")
+    with _client_lock:
+        LLM_BACKEND = name
+        _client = None
+
+def get_client():
+    """현재 백엔드의 클라이언트 반환"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            if LLM_BACKEND not in LLM_BACKENDS:
+                raise LLMError(f"등록되지 않은 LLM 백엔드입니다: {LLM_BACKEND}")
+            _client = LLM_BACKENDS[LLM_BACKEND]()
+        return _client
+
+def _check_circuit():
+    """서킷이 열려 있으면 LLMError 발생 (대기 시간이 지나면 요청 하나를 시험으로 허용)"""
+    with _circuit_lock:
+        opened_at = _circuit["opened_at"]
+        if opened_at is None:
+            return
+        
+        remaining = LLM_CIRCUIT_COOLDOWN - (time.monotonic() - opened_at)
+        if remaining > 0:
+            raise LLMError(f"API 오류가 계속되어 요청을 중단했습니다 ({remaining:.0f}초 후 재시도)")
+        
+        # 반열림 상태: 다음 요청이 실패하면 바로 다시 열림
+        _circuit["opened_at"] = None
+        _circuit["failures"] = LLM_CIRCUIT_THRESHOLD - 1
+
+def _record_success():
+    """요청 성공 시 연속 실패 횟수 초기화"""
+    with _circuit_lock:
+        _circuit["failures"] = 0
+        _circuit["opened_at"] = None
+
+def _record_failure():
+    """요청 실패 기록 (연속 실패가 한도에 닿으면 서킷을 엶)"""
+    with _circuit_lock:
+        _circuit["failures"] += 1
+        if _circuit["failures"] >= LLM_CIRCUIT_THRESHOLD and _circuit["opened_at"] is None:
+            _circuit["opened_at"] = time.monotonic()
+            logger.warning("연속 %d회 API 오류로 %.0f초 동안 요청을 차단합니다.",
+                           _circuit["failures"], LLM_CIRCUIT_COOLDOWN)
+
+def get_circuit_state():
+    """서킷 브레이커 상태 조회"""
+    with _circuit_lock:
+        return {"failures": _circuit["failures"], "open": _circuit["opened_at"] is not None}
+
+def _retry_delay(attempt, error):
+    """재시도 대기 시간 계산 (Retry-After 헤더 우선, 없으면 지터를 준 지수 백오프)"""
+    delay = random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** attempt))
+    
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            delay = max(delay, min(float(retry_after), LLM_RETRY_MAX_DELAY))
+        except ValueError:
+            pass
+    
+    return delay
+
+def _read_stream(stream, on_partial):
+    """스트리밍 응답을 읽으며 지금까지 받은 텍스트를 on_partial로 전달 후 (전체 텍스트, usage) 반환"""
+    content = ""
+    usage = None
+    
+    for chunk in stream:
+        # include_usage 옵션이면 마지막 조각에 사용량이 담겨 옴
+        if getattr(chunk, "usage", None):
+            usage = chunk.usage
+        if chunk.choices and chunk.choices[0].delta.content:
+            content += chunk.choices[0].delta.content
+            on_partial(content)
+    
+    return content, usage
+
+def _create_completion(model, messages, stage, params, on_partial=None, stats=None):
+    """요청/토큰 한도, 재시도, 서킷 브레이커를 적용해 API 호출 후 (응답 텍스트, usage) 반환 (stats에 재시도 횟수 기록)"""
+    _check_circuit()
+    
+    # 토큰 한도는 보정된 입력 추정치와 최대 출력 토큰으로 미리 차감
+    reserved_tokens = estimate_messages_tokens(messages, model, calibrated=True) + params.get("max_tokens", 1000)
+    _token_bucket.acquire(reserved_tokens)
+    
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        _request_bucket.acquire()
+        try:
+            with _request_slots:
+                if on_partial:
+                    # 스트리밍 중 오류로 재시도하면 on_partial은 처음부터 다시 받은 텍스트를 전달받음
+                    stream = get_client().chat.completions.create(
+                        model=model, messages=messages, stream=True,
+                        stream_options={"include_usage": True}, **params)
+                    content, usage = _read_stream(stream, on_partial)
+                else:
+                    response = get_client().chat.completions.create(model=model, messages=messages, **params)
+                    content, usage = response.choices[0].message.content, getattr(response, "usage", None)
+        except RETRYABLE_ERRORS as e:
+            _record_failure()
+            if stats is not None:
+                stats["retries"] = attempt
+            if attempt == LLM_MAX_RETRIES:
+                raise LLMError(f"API 요청이 {attempt + 1}회 모두 실패했습니다: {str(e)}") from e
+            
+            delay = _retry_delay(attempt, e)
+            logger.warning("[%s] API 오류로 %.1f초 후 재시도 (%d/%d): %s",
+                           stage or "-", delay, attempt + 1, LLM_MAX_RETRIES, e)
+            time.sleep(delay)
+            if stats is not None:
+                stats["retries"] = attempt + 1
+            _check_circuit()
+            continue
+        except openai.OpenAIError as e:
+            # 인증 오류, 잘못된 요청 등은 재시도해도 같으므로 바로 실패
+            raise LLMError(f"API 요청 실패: {str(e)}") from e
+        
+        _record_success()
+        
+        # 실제 사용량으로 토큰 한도 보정
+        if usage:
+            _token_bucket.adjust(reserved_tokens - usage.total_tokens)
+        
+        return content, usage
+
+def _raw_token_estimate(text):
+    """보정 전 토큰 수 추정 (한국어 기준 근사치)"""
+    if not text:
+        return 0
+    
+    # 한글 음절은 대부분 1~2토큰으로 나뉨
+    hangul = len(re.findall(r'[가-힣ㄱ-ㅎㅏ-ㅣ]', text))
+    # 영문/숫자 단어는 약 4글자당 1토큰
+    latin = sum(len(word) for word in re.findall(r'[A-Za-z0-9]+', text))
+    # 공백을 제외한 나머지 문장 부호, 기호는 대부분 1토큰
+    other = len(re.findall(r'[^\sA-Za-z0-9가-힣ㄱ-ㅎㅏ-ㅣ]', text))
+    
+    return int(hangul * 1.2 + (latin + 3) // 4 + other)
+
+def _load_calibration(model):
+    """모델별 토큰 보정값 (프로세스에서 처음 쓸 때만 저장된 값을 읽고, 읽는 동안 잠금을 잡지 않음)"""
+    state = _calibration.get(model)
+    if state is not None:
+        return state
+    
+    ratio, samples = 1.0, 0
+    try:
+        conn = get_db_connection()
+        row = conn.execute("SELECT setting_value FROM settings WHERE setting_key = ?",
+                           (f"token_calibration:{model}",)).fetchone()
+        conn.close()
+        if row:
+            saved = json.loads(row[0])
+            ratio, samples = saved["ratio"], saved["samples"]
+    except Exception as e:
+        logger.warning("토큰 보정값 조회 실패: %s", e)
+    
+    with _calibration_lock:
+        return _calibration.setdefault(model, {"ratio": ratio, "samples": samples})
+
+def calibrate_tokens(model, raw_estimate, actual_tokens):
+    """실제 usage 값으로 모델별 토큰 추정 보정값을 메모리에서 갱신 (첫 값도 이동 평균으로 반영, 저장은 flush_llm_calls에서 수행)"""
+    if not raw_estimate or not actual_tokens:
+        return
+    
+    state = _load_calibration(model)
+    with _calibration_lock:
+        sample = actual_tokens / raw_estimate
+        state["ratio"] += CALIBRATION_ALPHA * (sample - state["ratio"])
+        state["samples"] += 1
+        _calibration_dirty.add(model)
+
+def estimate_tokens(text):
+    """프롬프트 계획과 청크 경계에 쓰는 토큰 수 추정 (같은 텍스트는 항상 같은 값이 되도록 보정하지 않음)"""
+    return _raw_token_estimate(text)
+
+def calibrated_tokens(text, model=DEFAULT_MODEL):
+    """실제 usage로 보정한 토큰 수 추정 (요청 한도 확인과 기록용)"""
+    raw = _raw_token_estimate(text)
+    return int(raw * _load_calibration(model)["ratio"])
+
+def estimate_messages_tokens(messages, model=DEFAULT_MODEL, calibrated=False):
+    """메시지 목록의 입력 토큰 수 추정 (메시지당 구분 토큰 포함, calibrated면 보정한 값)"""
+    if calibrated:
+        return sum(calibrated_tokens(message["content"], model) + 4 for message in messages) + 3
+    return sum(estimate_tokens(message["content"]) + 4 for message in messages) + 3
+
+def _planning_ratio(model):
+    """컨텍스트 한도 환산용 보정값 (CALIBRATION_STEP 단위로 올림, 1 미만은 1)"""
+    ratio = _load_calibration(model)["ratio"]
+    return max(1.0, math.ceil(ratio / CALIBRATION_STEP) * CALIBRATION_STEP)
+
+def plan_input_budget(stage, model=DEFAULT_MODEL, max_output_tokens=1000, fixed_text=""):
+    """모델 컨텍스트와 단계별 상한을 고려해 스크립트에 쓸 수 있는 입력 토큰 계산 (estimate_tokens 기준)"""
+    # 컨텍스트 한도는 실제 토큰 기준이므로 보정값으로 계획 단위로 환산
+    context_window = MODEL_CONTEXT_WINDOWS.get(model, 8192)
+    available = int((context_window - max_output_tokens - PROMPT_MARGIN_TOKENS) / _planning_ratio(model)) - estimate_tokens(fixed_text)
+    return max(0, min(available, STAGE_INPUT_BUDGETS.get(stage, DEFAULT_INPUT_BUDGET)))
+
+def make_cache_key(model, messages, params):
+    """모델, 파라미터, 메시지로 캐시 키 생성"""
+    payload = json.dumps({
+        "model": model,
+        "messages": messages,
+        "params": params
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _cache_connection():
+    """캐시 데이터베이스 연결 반환 (처음이면 테이블 생성)"""
+    global _cache_ready
+    conn = sqlite3.connect(CACHE_PATH, timeout=30)
+    
+    if not _cache_ready:
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            cache_key TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            response TEXT NOT NULL,
+            usage TEXT,
+            size INTEGER NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            last_access REAL NOT NULL
+        )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache (last_access)")
+        conn.commit()
+        _cache_ready = True
+    
+    return conn
+
+def cache_get(cache_key):
+    """캐시된 응답 조회 (없거나 만료되면 None)"""
+    with _cache_lock:
+        conn = _cache_connection()
+        try:
+            row = conn.execute("SELECT response, created_at FROM llm_cache WHERE cache_key = ?",
+                               (cache_key,)).fetchone()
+            now = time.time()
+            
+            if row and now - row[1] <= CACHE_TTL:
+                conn.execute("""
+                    UPDATE llm_cache
+                    SET hits = hits + 1, last_access = ?
+                    WHERE cache_key = ?
+                """, (now, cache_key))
+                conn.commit()
+                _cache_stats["hits"] += 1
+                return row[0]
+            
+            if row:
+                # 만료된 항목 삭제
+                conn.execute("DELETE FROM llm_cache WHERE cache_key = ?", (cache_key,))
+                conn.commit()
+            
+            _cache_stats["misses"] += 1
+            return None
+        finally:
+            conn.close()
+
+def cache_put(cache_key, model, response, usage=None):
+    """응답을 캐시에 저장하고 용량 초과분 정리"""
+    now = time.time()
+    with _cache_lock:
+        conn = _cache_connection()
+        try:
+            conn.execute("""
+                INSERT OR REPLACE INTO llm_cache
+                (cache_key, model, response, usage, size, hits, created_at, last_access)
+                VALUES (?, ?, ?, ?, ?, 0, ?, ?)
+            """, (cache_key, model, response, json.dumps(usage) if usage else None,
+                  len(response.encode("utf-8")), now, now))
+            evict_cache(conn)
+            conn.commit()
+        finally:
+            conn.close()
+
+def evict_cache(conn):
+    """만료 항목과 최대 개수/용량을 넘는 오래된 항목 삭제 (LRU)"""
+    conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - CACHE_TTL,))
+    
+    # 최근 사용 순으로 누적 개수/용량이 한도를 넘는 항목 삭제
+    conn.execute("""
+        DELETE FROM llm_cache WHERE cache_key IN (
+            SELECT cache_key FROM (
+                SELECT cache_key,
+                       ROW_NUMBER() OVER (ORDER BY last_access DESC) AS entry_rank,
+                       SUM(size) OVER (ORDER BY last_access DESC) AS total_size
+                FROM llm_cache
+            )
+            WHERE entry_rank > ? OR total_size > ?
+        )
+    """, (CACHE_MAX_ENTRIES, CACHE_MAX_BYTES))
+
+def get_cache_stats():
+    """캐시 항목 수, 용량, 적중률 조회"""
+    with _cache_lock:
+        conn = _cache_connection()
+        try:
+            entries, total_size, stored_hits = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(hits), 0) FROM llm_cache"
+            ).fetchone()
+        finally:
+            conn.close()
+    
+    requests = _cache_stats["hits"] + _cache_stats["misses"]
+    return {
+        "entries": entries,
+        "size_bytes": total_size,
+        "total_hits": stored_hits,
+        "hits": _cache_stats["hits"],
+        "misses": _cache_stats["misses"],
+        "hit_rate": _cache_stats["hits"] / requests if requests else 0.0
+    }
+
+def clear_cache():
+    """캐시 전체 삭제"""
+    with _cache_lock:
+        conn = _cache_connection()
+        try:
+            conn.execute("DELETE FROM llm_cache")
+            conn.commit()
+        finally:
+            conn.close()
+
+def set_call_context(**values):
+    """이후 API 호출 기록에 영화 ID 등 정보를 붙임 (reset_call_context에 넘길 토큰 반환)"""
+    return _call_context.set({**_call_context.get(), **values})
+
+def reset_call_context(token):
+    """set_call_context 이전 상태로 되돌림"""
+    _call_context.reset(token)
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    """토큰 수로 예상 비용 계산 (달러, 가격을 모르는 모델은 0)"""
+    input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+def route_model(stage, messages=None, prompt_tokens=None):
+    """모델 선택표에서 단계와 입력 토큰 수(또는 prompt_tokens)에 맞는 모델 선택 (표에 없는 단계는 기본 모델)"""
+    if not LLM_ROUTING_ENABLED:
+        return DEFAULT_MODEL
+    
+    if prompt_tokens is None:
+        prompt_tokens = estimate_messages_tokens(messages) if messages else 0
+    for max_tokens, model in MODEL_ROUTES.get(stage, ()):
+        if max_tokens is None or prompt_tokens <= max_tokens:
+            return model
+    return DEFAULT_MODEL
+
+def fit_response_format(request):
+    """요청의 response_format을 모델이 지원하는 형식으로 맞춘 요청 반환 (json_schema를 못 쓰는 모델은 스키마를 프롬프트로 넘기고 가능하면 JSON 모드 사용)"""
+    response_format = request.get("response_format")
+    if not response_format or response_format.get("type") != "json_schema" or request["model"] in STRUCTURED_OUTPUT_MODELS:
+        return request
+    
+    schema = json.dumps(response_format["json_schema"]["schema"], ensure_ascii=False)
+    request = dict(request, messages=[*request["messages"],
+                                      {"role": "system", "content": f"{JSON_SCHEMA_PROMPT}\n{schema}"}])
+    if request["model"] in JSON_MODE_MODELS:
+        request["response_format"] = {"type": "json_object"}
+    else:
+        del request["response_format"]
+    return request
+
+def planning_model(stage):
+    """입력 예산 계획에 쓸 모델 (단계별 입력 상한만큼 보낸다고 보고 선택표로 고른 모델)"""
+    return route_model(stage, prompt_tokens=STAGE_INPUT_BUDGETS.get(stage, DEFAULT_INPUT_BUDGET))
+
+def model_health(model):
+    """최근 호출 기록으로 모델의 호출 수, p95 지연 시간, 오류 비율, 대체 필요 여부 계산 (잠시 캐시)"""
+    with _model_health_lock:
+        cached = _model_health.get(model)
+        if cached and time.monotonic() - cached[0] < LLM_HEALTH_TTL:
+            return cached[1]
+    
+    health = {"calls": 0, "p95_latency": 0.0, "error_rate": 0.0, "degraded": False}
+    flush_llm_calls()
+    try:
+        conn = get_db_connection()
+        rows = conn.execute("""
+            SELECT latency, error IS NOT NULL FROM llm_calls
+            WHERE model = ? AND cache_hit = 0 AND created_at >= ?
+        """, (model, time.time() - LLM_FALLBACK_WINDOW)).fetchall()
+        conn.close()
+    except sqlite3.Error as e:
+        logger.warning("모델 상태 조회 실패: %s", e)
+        rows = []
+    
+    if rows:
+        latencies = sorted(latency for latency, _ in rows)
+        health["calls"] = len(rows)
+        health["p95_latency"] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        health["error_rate"] = sum(failed for _, failed in rows) / len(rows)
+        health["degraded"] = len(rows) >= LLM_FALLBACK_MIN_CALLS and (
+            health["p95_latency"] > LLM_FALLBACK_LATENCY or health["error_rate"] > LLM_FALLBACK_ERROR_RATE)
+    
+    with _model_health_lock:
+        _model_health[model] = (time.monotonic(), health)
+    return health
+
+def select_healthy_model(model, messages, max_tokens=1000):
+    """모델이 최근 느리거나 오류가 잦으면 컨텍스트에 들어가는 더 빠른 대체 모델 반환"""
+    fallback = FALLBACK_MODELS.get(model)
+    if not fallback or not LLM_TELEMETRY_ENABLED:
+        return model
+    
+    health = model_health(model)
+    if not health["degraded"]:
+        return model
+    
+    if estimate_messages_tokens(messages, fallback, calibrated=True) + max_tokens > MODEL_CONTEXT_WINDOWS.get(fallback, 8192):
+        return model
+    
+    logger.warning("%s 모델이 느리거나 오류가 잦아 %s 모델로 전환합니다. (p95 %.1f초, 오류 %.0f%%)",
+                   model, fallback, health["p95_latency"], health["error_rate"] * 100)
+    return fallback
+
+def flush_llm_calls():
+    """모아 둔 API 호출 기록과 바뀐 토큰 보정값을 한 트랜잭션으로 저장 (저장에 실패해도 호출 결과에는 영향 없음)"""
+    global _pending_since, _telemetry_conn
+    with _telemetry_lock:
+        with _calibration_lock:
+            calibrations = [(f"token_calibration:{model}", json.dumps(_calibration[model]))
+                            for model in _calibration_dirty]
+            _calibration_dirty.clear()
+        if not _pending_calls and not calibrations:
+            return
+        rows = list(_pending_calls)
+        _pending_calls.clear()
+        _pending_since = None
+        
+        try:
+            if _telemetry_conn is None:
+                _telemetry_conn = get_db_connection(timeout=LLM_CALL_BUSY_TIMEOUT, check_same_thread=False)
+            with _telemetry_conn:
+                _telemetry_conn.executemany("""
+                    INSERT INTO llm_calls (movie_id, stage, model, planned_tokens, prompt_tokens, completion_tokens,
+                                           latency, retries, cache_hit, error, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, rows)
+                _telemetry_conn.executemany("""
+                    INSERT INTO settings (setting_key, setting_value, updated_at)
+                    VALUES (?, ?, CURRENT_TIMESTAMP)
+                    ON CONFLICT (setting_key) DO UPDATE
+                    SET setting_value = excluded.setting_value, updated_at = CURRENT_TIMESTAMP
+                """, calibrations)
+        except sqlite3.Error as e:
+            logger.warning("API 호출 기록 %d건 저장 실패: %s", len(rows), e)
+
+# 프로세스가 끝날 때 남은 호출 기록 저장
+atexit.register(flush_llm_calls)
+
+def record_llm_call(stage, model, latency, prompt_tokens=0, completion_tokens=0, retries=0,
+                    cache_hit=False, error=None, planned_tokens=0):
+    """API 호출 기록을 모아 두었다가 일정 개수나 시간이 지나면 한 번에 저장 (캐시 적중은 메모리에 쌓기만 함)"""
+    global _pending_since
+    if not LLM_TELEMETRY_ENABLED:
+        return
+    
+    with _telemetry_lock:
+        _pending_calls.append((_call_context.get().get("movie_id"), stage, model, planned_tokens, prompt_tokens,
+                               completion_tokens, latency, retries, int(cache_hit), error, time.time()))
+        if _pending_since is None:
+            _pending_since = time.monotonic()
+        due = len(_pending_calls) >= LLM_CALL_FLUSH_SIZE or (
+            not cache_hit and time.monotonic() - _pending_since >= LLM_CALL_FLUSH_INTERVAL)
+    
+    if due:
+        flush_llm_calls()
+
+def chat(messages, model=None, stage=None, use_cache=True, on_partial=None, **params):
+    """채팅 완성 요청 후 응답 텍스트 반환 (모델을 주지 않으면 단계별로 선택, 같은 요청은 캐시에서 반환, 실패 시 LLMError, on_partial을 주면 스트리밍)"""
+    use_cache = use_cache and CACHE_ENABLED
+    
+    # 단계별 모델 선택 후 최근 상태가 나쁘면 대체 모델 사용
+    model = select_healthy_model(model or route_model(stage, messages), messages, params.get("max_tokens", 1000))
+    
+    # 구조화 출력을 지원하지 않는 모델(기본 모델, 대체 모델)이면 JSON 모드로 바꿔 요청
+    params = fit_response_format({"model": model, "messages": messages, **params})
+    del params["model"]
+    messages = params.pop("messages")
+    cache_key = make_cache_key(model, messages, params)
+    started = time.monotonic()
+    
+    if use_cache:
+        cached = cache_get(cache_key)
+        if cached is not None:
+            record_llm_call(stage, model, time.monotonic() - started, cache_hit=True)
+            if on_partial:
+                on_partial(cached)
+            return cached
+    
+    # 요청 전에 계획한 입력 토큰 (실제 usage와 함께 호출 기록에 저장)
+    planned_tokens = estimate_messages_tokens(messages, model, calibrated=True)
+    stats = {"retries": 0}
+    try:
+        content, usage = _create_completion(model, messages, stage, params, on_partial, stats)
+        if content is None:
+            raise LLMError("API 응답에 내용이 없습니다.")
+    except LLMError as e:
+        record_llm_call(stage, model, time.monotonic() - started, retries=stats["retries"], error=str(e),
+                        planned_tokens=planned_tokens)
+        raise
+    
+    # 호출 기록 (usage를 주지 않는 호환 서버는 추정치로 기록)
+    if usage:
+        prompt_tokens, completion_tokens = usage.prompt_tokens, usage.completion_tokens
+    else:
+        prompt_tokens, completion_tokens = planned_tokens, calibrated_tokens(content, model)
+    record_llm_call(stage, model, time.monotonic() - started, prompt_tokens, completion_tokens, stats["retries"],
+                    planned_tokens=planned_tokens)
+    
+    # 실제 입력 토큰으로 보정값 갱신
+    if usage:
+        logger.info("[%s] %s 입력 토큰: 계획 %d / 실제 %d", stage or "-", model, planned_tokens, usage.prompt_tokens)
+        calibrate_tokens(model, estimate_messages_tokens(messages), usage.prompt_tokens)
+    
+    if use_cache and content:
+        cache_put(cache_key, model, content, usage.model_dump() if usage else None)
+    
+    return content
@@ -0,0 +1,356 @@
+import os
+import re
+import json
+import time
+import types
+import random
+import hashlib
+import argparse
+import threading
+import openai
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+from llm_client import JSON_MODE_MODELS, JSON_SCHEMA_PROMPT, STRUCTURED_OUTPUT_MODELS
+
+# 응답 지연 시간과 편차 (초)
+STUB_LATENCY = float(os.getenv("LLM_STUB_LATENCY", 0.2))
+STUB_JITTER = float(os.getenv("LLM_STUB_JITTER", 0.05))
+
+# 429/500 오류를 돌려줄 확률
+STUB_ERROR_RATE = float(os.getenv("LLM_STUB_ERROR_RATE", 0.0))
+
+# 지연/오류 난수 시드 (같은 시드와 같은 요청 순서면 같은 결과)
+STUB_SEED = int(os.getenv("LLM_STUB_SEED", 0))
+
+# 오류 응답의 Retry-After 값 (초)
+STUB_RETRY_AFTER = 0.5
+
+# 스트리밍 응답의 조각 크기 (글자 수)와 조각 사이 지연 시간 (초)
+STUB_CHUNK_CHARS = 8
+STUB_CHUNK_DELAY = float(os.getenv("LLM_STUB_CHUNK_DELAY", 0.01))
+
+# 관계도와 JSON 응답에 쓸 인물 이름 패턴 ("이름 : 대사" 형태)
+SPEAKER_PATTERN = re.compile(r'(?:^|[ \t])([가-힣]{2,4})[ \t]*:[ \t]*\S', re.MULTILINE)
+
+def _prompt_text(messages):
+    """메시지 전체 내용 연결"""
+    return "\n".join(message.get("content") or "" for message in messages)
+
+def _prompt_hash(messages):
+    """요청 내용의 짧은 해시 (같은 요청이면 같은 응답)"""
+    return hashlib.sha256(_prompt_text(messages).encode("utf-8")).hexdigest()[:8]
+
+def _main_characters(text, limit=5):
+    """프롬프트에서 대사가 많은 인물 이름 추출 (없으면 기본 이름)"""
+    counts = {}
+    for name in SPEAKER_PATTERN.findall(text):
+        counts[name] = counts.get(name, 0) + 1
+    # 한 번만 나온 이름은 지시문의 단어일 가능성이 높으므로 제외
+    names = sorted((name for name in counts if counts[name] > 1),
+                   key=lambda name: (-counts[name], name))[:limit]
+    return names if len(names) > 1 else ["주인공", "조력자", "적대자"]
+
+def _fill_schema(schema, names, prompt_id, key="", index=0, numbers=()):
+    """JSON 스키마를 만족하는 스텁 값 생성 (이름/관계 필드는 프롬프트의 인물 이름, 번호 필드는 프롬프트의 [번호] 사용)"""
+    kind = schema.get("type")
+    if kind == "object":
+        properties = schema.get("properties", {})
+        return {name: _fill_schema(value, names, prompt_id, name, index, numbers) for name, value in properties.items()}
+    if kind == "array":
+        items = schema.get("items", {})
+        # 관계 목록은 첫 인물과 나머지 인물을 잇는 간선, 번호 목록은 [번호]마다 하나, 다른 객체 목록은 인물마다 하나
+        if "source" in items.get("properties", {}):
+            return [{"source": names[0], "target": name, "relation": "관계"} for name in names[1:]]
+        if "i" in items.get("properties", {}) and numbers:
+            return [_fill_schema(items, names, prompt_id, key, i, numbers) for i in range(len(numbers))]
+        if items.get("type") == "object":
+            return [_fill_schema(items, names, prompt_id, key, i, numbers) for i in range(len(names))]
+        return [_fill_schema(items, names, prompt_id, key, i, numbers) for i in range(3)]
+    if "enum" in schema:
+        return schema["enum"][int(prompt_id, 16) % len(schema["enum"])]
+    if key == "i" and numbers:
+        return numbers[index % len(numbers)]
+    if kind == "integer" and "0~100" in schema.get("description", ""):
+        return (int(prompt_id, 16) + index * 37 + ord(key[0]) * 11) % 101
+    if kind in ("number", "integer"):
+        score = round(int(prompt_id, 16) % 200 / 100 - 1, 2)
+        return score if kind == "number" else int(score * 100)
+    if key == "name":
+        return names[index % len(names)]
+    return f"스텁 {key} {index + 1} ({prompt_id})"
+
+def unsupported_response_format(model, response_format):
+    """실제 API처럼 모델이 지원하지 않는 response_format이면 400 오류 메시지 반환 (지원하면 None)"""
+    format_type = (response_format or {}).get("type")
+    if format_type == "json_schema" and model not in STRUCTURED_OUTPUT_MODELS:
+        return f"'{model}' 모델은 response_format 'json_schema'를 지원하지 않습니다."
+    if format_type == "json_object" and model not in JSON_MODE_MODELS:
+        return f"'{model}' 모델은 response_format 'json_object'를 지원하지 않습니다."
+    return None
+
+def _prompt_schema(messages):
+    """프롬프트로 넘긴 JSON 스키마 (구조화 출력을 지원하지 않는 모델용, 없으면 None)"""
+    for message in messages:
+        content = message.get("content") or ""
+        if content.startswith(JSON_SCHEMA_PROMPT):
+            return json.loads(content[len(JSON_SCHEMA_PROMPT):])
+    return None
+
+def build_stub_content(messages, response_format=None):
+    """프롬프트 종류에 맞는 고정 형식의 응답 생성 (JSON 스키마를 주면 스키마에 맞는 JSON)"""
+    text = _prompt_text(messages)
+    prompt_id = _prompt_hash(messages)
+    names = _main_characters(text)
+    
+    # 구조화 출력 요청 (또는 프롬프트로 스키마를 받은 요청): 스키마에 맞는 JSON만 반환
+    if response_format and response_format.get("type") == "json_schema":
+        schema = response_format["json_schema"]["schema"]
+    else:
+        schema = _prompt_schema(messages)
+    if schema:
+        numbers = [int(number) for number in re.findall(r'^\[(\d+)\]', text, re.MULTILINE)]
+        return json.dumps(_fill_schema(schema, names, prompt_id, numbers=numbers), ensure_ascii=False)
+    
+    # 관계도 요청: Mermaid 코드
+    if "mermaid" in text.lower():
+        lines = ["graph TD"]
+        lines += [f"  A[{names[0]}] --> N{i}[{name}]" for i, name in enumerate(names[1:], 1)]
+        return "```mermaid\n" + "\n".join(lines) + "\n```"
+    
+    # 감정 분석 요청: 감정 JSON
+    if "overall_sentiment" in text:
+        score = round(int(prompt_id, 16) % 200 / 100 - 1, 2)
+        label = "긍정적" if score > 0.2 else "부정적" if score < -0.2 else "중립적"
+        data = {
+            "overall_sentiment": label,
+            "sentiment_score": score,
+            "dominant_emotions": ["긴장", "희망", "슬픔"],
+            "mood_description": f"스텁 분위기 설명 ({prompt_id})",
+            "emotional_arcs": ["초반 긴장에서 후반 해소로 이어짐"]
+        }
+        return "```json\n" + json.dumps(data, ensure_ascii=False, indent=2) + "\n```"
+    
+    # 구조화 데이터 요청: 요약 JSON
+    if "plot_points" in text:
+        data = {
+            "title": f"스텁 작품 {prompt_id}",
+            "genre": "드라마",
+            "main_characters": [{"name": name, "description": "스텁 인물 설명"} for name in names],
+            "plot_points": ["발단", "전개", "위기", "절정", "결말"],
+            "themes": ["가족", "성장"]
+        }
+        return "```json\n" + json.dumps(data, ensure_ascii=False, indent=2) + "\n```"
+    
+    # 그 밖의 요청: 요약 텍스트
+    return (f"[스텁 응답 {prompt_id}]\n"
+            f"1) 주요 인물: {', '.join(names)}\n"
+            f"2) 줄거리: {names[0]}이(가) 사건에 휘말리며 이야기가 전개됩니다.\n"
+            f"3) 주제: 관계와 선택")
+
+def build_completion(model, messages, max_tokens=None, response_format=None, **params):
+    """OpenAI 채팅 완성 응답 형식의 딕셔너리 생성"""
+    content = build_stub_content(messages, response_format)
+    
+    # 토큰 수는 글자 수 기반 근사치
+    prompt_tokens = sum(len(message.get("content") or "") for message in messages) // 2 + 4 * len(messages)
+    completion_tokens = len(content) // 2
+    if max_tokens:
+        completion_tokens = min(completion_tokens, max_tokens)
+    
+    return {
+        "id": f"chatcmpl-stub-{_prompt_hash(messages)}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": content}
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    }
+
+def build_completion_chunks(model, messages, max_tokens=None, include_usage=False, **params):
+    """OpenAI 스트리밍 응답 형식의 조각 딕셔너리 목록 생성"""
+    completion = build_completion(model, messages, max_tokens, **params)
+    content = completion["choices"][0]["message"]["content"]
+    base = {"id": completion["id"], "object": "chat.completion.chunk",
+            "created": completion["created"], "model": model}
+    
+    chunks = [dict(base, choices=[{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])]
+    for i in range(0, len(content), STUB_CHUNK_CHARS):
+        chunks.append(dict(base, choices=[{
+            "index": 0,
+            "delta": {"content": content[i:i + STUB_CHUNK_CHARS]},
+            "finish_reason": None
+        }]))
+    chunks.append(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+    
+    # 사용량은 선택지가 없는 마지막 조각으로 전달
+    if include_usage:
+        chunks.append(dict(base, choices=[], usage=completion["usage"]))
+    
+    return chunks
+
+class StubBehavior:
+    """요청마다 지연 시간과 오류 여부를 정하는 설정 (스레드 간 공유)"""
+    
+    def __init__(self, latency=STUB_LATENCY, jitter=STUB_JITTER, error_rate=STUB_ERROR_RATE, seed=STUB_SEED):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0}
+    
+    def next_request(self):
+        """이번 요청의 (지연 시간, 오류 상태 코드 또는 None) 반환"""
+        with self.lock:
+            self.stats["requests"] += 1
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+            status = None
+            if self.random.random() < self.error_rate:
+                status = self.random.choice((429, 500))
+                self.stats["errors"] += 1
+        return delay, status
+
+class StubCompletions:
+    """프로세스 안에서 동작하는 chat.completions 대체 객체"""
+    
+    def __init__(self, behavior):
+        self.behavior = behavior
+    
+    def create(self, model, messages, stream=False, stream_options=None, **params):
+        delay, status = self.behavior.next_request()
+        time.sleep(delay)
+        
+        error = unsupported_response_format(model, params.get("response_format"))
+        if error:
+            response = types.SimpleNamespace(request=None, status_code=400, headers={})
+            raise openai.BadRequestError(error, response=response, body=None)
+        
+        if status:
+            # SDK와 같은 예외를 발생시켜 재시도/서킷 브레이커가 실제와 같이 동작하게 함
+            response = types.SimpleNamespace(request=None, status_code=status,
+                                             headers={"retry-after": str(STUB_RETRY_AFTER)})
+            error_class = openai.RateLimitError if status == 429 else openai.InternalServerError
+            raise error_class(f"스텁 오류 응답 ({status})", response=response, body=None)
+        
+        if stream:
+            include_usage = bool(stream_options and stream_options.get("include_usage"))
+            return self._stream(build_completion_chunks(model, messages, include_usage=include_usage, **params))
+        
+        return ChatCompletion.model_validate(build_completion(model, messages, **params))
+    
+    def _stream(self, chunks):
+        for chunk in chunks:
+            time.sleep(STUB_CHUNK_DELAY)
+            yield ChatCompletionChunk.model_validate(chunk)
+
+def create_stub_client(behavior=None):
+    """OpenAI 클라이언트와 같은 형태의 프로세스 내 스텁 클라이언트 생성"""
+    completions = StubCompletions(behavior or StubBehavior())
+    return types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions))
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    """OpenAI 호환 /v1/chat/completions 요청 처리"""
+    
+    behavior = None
+    
+    def log_message(self, format, *args):
+        # 요청마다 로그를 남기지 않음
+        pass
+    
+    def _send_json(self, status, data, headers=None):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "gpt-3.5-turbo", "object": "model"}]})
+        elif self.path.rstrip("/").endswith("/stats"):
+            self._send_json(200, self.behavior.stats)
+        else:
+            self._send_json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+    
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+            return
+        
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            model = request.pop("model")
+            messages = request.pop("messages")
+        except (ValueError, KeyError) as e:
+            self._send_json(400, {"error": {"message": f"잘못된 요청: {str(e)}", "type": "invalid_request_error"}})
+            return
+        
+        delay, status = self.behavior.next_request()
+        time.sleep(delay)
+        error = unsupported_response_format(model, request.get("response_format"))
+        
+        if error:
+            self._send_json(400, {"error": {"message": error, "type": "invalid_request_error"}})
+        elif status == 429:
+            self._send_json(429, {"error": {"message": "스텁 요청 한도 초과", "type": "rate_limit_error"}},
+                            {"Retry-After": str(STUB_RETRY_AFTER)})
+        elif status:
+            self._send_json(500, {"error": {"message": "스텁 서버 오류", "type": "server_error"}})
+        elif request.get("stream"):
+            self._send_stream(build_completion_chunks(
+                model, messages, request.get("max_tokens"),
+                include_usage=bool((request.get("stream_options") or {}).get("include_usage")),
+                response_format=request.get("response_format")))
+        else:
+            self._send_json(200, build_completion(model, messages, request.get("max_tokens"),
+                                                  response_format=request.get("response_format")))
+    
+    def _send_stream(self, chunks):
+        # 서버 전송 이벤트(SSE) 형식으로 조각마다 전송
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        for chunk in chunks:
+            time.sleep(STUB_CHUNK_DELAY)
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+def run_server(host="127.0.0.1", port=8001, behavior=None):
+    """스텁 서버 실행 (Ctrl+C로 종료)"""
+    StubRequestHandler.behavior = behavior or StubBehavior()
+    server = ThreadingHTTPServer((host, port), StubRequestHandler)
+    print(f"🧪 스텁 LLM 서버: http://{host}:{port}/v1 "
+          f"(지연 {StubRequestHandler.behavior.latency}초, 오류율 {StubRequestHandler.behavior.error_rate:.0%})")
+    print(f"   OPENAI_BASE_URL=http://{host}:{port}/v1 로 지정하면 실제 API 대신 사용됩니다.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OpenAI 호환 스텁 LLM 서버")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=STUB_LATENCY, help="응답 지연 시간 (초)")
+    parser.add_argument("--jitter", type=float, default=STUB_JITTER, help="지연 시간 편차 (초)")
+    parser.add_argument("--error-rate", type=float, default=STUB_ERROR_RATE, help="429/500 오류 확률 (0~1)")
+    parser.add_argument("--seed", type=int, default=STUB_SEED, help="난수 시드")
+    args = parser.parse_args()
+    
+    run_server(args.host, args.port, StubBehavior(args.latency, args.jitter, args.error_rate, args.seed))
@@ -0,0 +1,161 @@
+import json
+
+def build_movie_data(conn, movie_id):
+    """영화 ID로 상세 화면에 필요한 데이터를 조회해 구성"""
+    cursor = conn.cursor()
+    
+    # 영화 정보 조회
+    cursor.execute("""
+        SELECT movie_id, title, filename, genre, theme, summary
+        FROM movies
+        WHERE movie_id = ?
+    """, (movie_id,))
+    
+    movie_data = cursor.fetchone()
+    
+    if not movie_data:
+        return None
+    
+    movie_dict = {
+        "movie_id": movie_data[0],
+        "title": movie_data[1],
+        "filename": movie_data[2],
+        "genre": movie_data[3],
+        "theme": movie_data[4],
+        "summary": movie_data[5]
+    }
+    
+    # 등장인물 조회
+    cursor.execute("""
+        SELECT character_id, name, count, description
+        FROM characters
+        WHERE movie_id = ?
+        ORDER BY count DESC
+    """, (movie_id,))
+    
+    characters = []
+    for row in cursor.fetchall():
+        characters.append({
+            "character_id": row[0],
+            "name": row[1],
+            "count": row[2],
+            "description": row[3] or ""
+        })
+    
+    # 씬 조회
+    cursor.execute("""
+        SELECT scene_id, scene_number, heading, location, setting, time_of_day
+        FROM scenes
+        WHERE movie_id = ?
+        ORDER BY scene_number
+    """, (movie_id,))
+    
+    scenes = []
+    for row in cursor.fetchall():
+        scenes.append({
+            "scene_id": row[0],
+            "scene_number": row[1],
+            "heading": row[2],
+            "location": row[3],
+            "setting": row[4],
+            "time_of_day": row[5]
+        })
+    
+    # 현재 전체 감정 분석 조회 (현재 결과 인덱스 사용)
+    cursor.execute("""
+        SELECT sentiment_id, sentiment_score, sentiment_label, sentiment_text
+        FROM sentiment_analysis
+        WHERE movie_id = ? AND stage = 'overall' AND is_current = 1
+    """, (movie_id,))
+    
+    sentiment_row = cursor.fetchone()
+    sentiment = None
+    if sentiment_row:
+        sentiment = {
+            "sentiment_id": sentiment_row[0],
+            "sentiment_score": sentiment_row[1],
+            "sentiment_label": sentiment_row[2],
+            "details": json.loads(sentiment_row[3]) if sentiment_row[3] else {}
+        }
+    
+    # 줄거리 분석 조회
+    cursor.execute("""
+        SELECT plot_id, plot_element, plot_description, plot_order
+        FROM plot_analysis
+        WHERE movie_id = ?
+        ORDER BY plot_order
+    """, (movie_id,))
+    
+    plot_points = []
+    themes = []
+    
+    for row in cursor.fetchall():
+        if row[1].startswith("plot_point"):
+            plot_points.append({
+                "plot_id": row[0],
+                "description": row[2],
+                "order": row[3]
+            })
+        elif row[1].startswith("theme"):
+            themes.append({
+                "plot_id": row[0],
+                "description": row[2],
+                "order": row[3]
+            })
+    
+    # 관계 조회
+    cursor.execute("""
+        SELECT r.relationship_id, c1.name, c2.name, r.relationship_type
+        FROM relationships r
+        JOIN characters c1 ON r.character1_id = c1.character_id
+        JOIN characters c2 ON r.character2_id = c2.character_id
+        WHERE r.movie_id = ?
+    """, (movie_id,))
+    
+    relationships = []
+    for row in cursor.fetchall():
+        relationships.append({
+            "relationship_id": row[0],
+            "character1": row[1],
+            "character2": row[2],
+            "relationship_type": row[3]
+        })
+    
+    # 결과 데이터 구성
+    return {
+        "movie": movie_dict,
+        "characters": characters,
+        "scenes": scenes,
+        "sentiment": sentiment,
+        "plot_points": plot_points,
+        "themes": themes,
+        "relationships": relationships
+    }
+
+def rebuild_movie_snapshot(conn, movie_id):
+    """영화 스냅샷을 다시 생성해 저장 (커밋은 호출한 쪽에서 수행)"""
+    data = build_movie_data(conn, movie_id)
+    cursor = conn.cursor()
+    
+    if data is None:
+        # 영화가 없으면 남아 있는 스냅샷 삭제
+        cursor.execute("DELETE FROM movie_snapshots WHERE movie_id = ?", (movie_id,))
+        return None
+    
+    cursor.execute("""
+        INSERT OR REPLACE INTO movie_snapshots (movie_id, snapshot, updated_at)
+        VALUES (?, ?, CURRENT_TIMESTAMP)
+    """, (movie_id, json.dumps(data, ensure_ascii=False)))
+    
+    return data
+
+def load_movie_snapshot(conn, movie_id):
+    """저장된 영화 스냅샷 조회 (없으면 None)"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT snapshot FROM movie_snapshots WHERE movie_id = ?", (movie_id,))
+    row = cursor.fetchone()
+    
+    if not row:
+        return None
+    
+    return json.loads(row[0])
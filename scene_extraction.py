@@ -12,9 +12,16 @@ def extract_text_from_pdf(pdf_path):
         print(f"PDF 텍스트 추출 중 오류: {str(e)}")
         return ""
 
-# 장면(Scene) 추출 함수
-def extract_scenes(text):
-    """스크립트에서 장면들을 추출"""
+# 저장된 PDF 경로 확인 함수
+def find_pdf_file(file_path, directory="data"):
+    """저장된 경로로 PDF 파일 찾기 (다른 OS의 경로 구분자와 data 폴더의 같은 파일명도 확인, 없으면 None)"""
+    normalized = file_path.replace("\\", "/")
+    candidates = (file_path, normalized, os.path.join(directory, os.path.basename(normalized)))
+    return next((path for path in candidates if os.path.exists(path)), None)
+
+# 장면 시작 위치 탐색 함수
+def find_scene_starts(text):
+    """스크립트에서 장면 시작 위치, 장면 번호, 헤딩을 찾음"""
     # 장면 패턴: 숫자. [장면 헤딩]
     scene_pattern = r'\n(\d+)\.\s*([^\n]+)'
     
@@ -36,6 +43,44 @@ def extract_scenes(text):
         scene_starts = [(m.start(), str(i+1), m.group(1).strip()) 
                          for i, m in enumerate(re.finditer(int_ext_pattern, text))]
     
+    return scene_starts
+
+# 장면별 본문 분할 함수
+def split_scene_texts(text):
+    """스크립트를 장면 단위 본문으로 분할"""
+    scene_starts = find_scene_starts(text)
+    
+    scene_texts = []
+    
+    # 첫 장면 이전 부분(표지, 등장인물 소개 등)은 0번 장면으로 취급
+    prelude_end = scene_starts[0][0] if scene_starts else len(text)
+    prelude = text[:prelude_end].strip()
+    if prelude:
+        scene_texts.append({
+            "scene_number": "0",
+            "location": "",
+            "text": prelude
+        })
+    
+    for i in range(len(scene_starts)):
+        start_pos, scene_number, location = scene_starts[i]
+        end_pos = scene_starts[i+1][0] if i < len(scene_starts) - 1 else len(text)
+        scene_text = text[start_pos:end_pos].strip()
+        
+        if scene_text:
+            scene_texts.append({
+                "scene_number": scene_number,
+                "location": location,
+                "text": scene_text
+            })
+    
+    return scene_texts
+
+# 장면(Scene) 추출 함수
+def extract_scenes(text):
+    """스크립트에서 장면들을 추출"""
+    scene_starts = find_scene_starts(text)
+    
     scenes = []
     
     for i in range(len(scene_starts)):
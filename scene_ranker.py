@@ -0,0 +1,126 @@
+import re
+import sys
+from functools import lru_cache
+import numpy as np
+
+# TextRank 감쇠 계수와 반복 종료 기준
+TEXTRANK_DAMPING = 0.85
+TEXTRANK_MAX_ITERATIONS = 50
+TEXTRANK_TOLERANCE = 1e-6
+
+# 이 개수 미만의 구간에 나오는 단어 조각은 구간 사이 유사도에 쓰지 않음
+MIN_TERM_SEGMENTS = 2
+
+# 최종 점수에서 TextRank(다른 장면과 얼마나 이어지는지)와 TF-IDF(고유한 정보량) 비중
+TEXTRANK_WEIGHT = 0.7
+
+def _terms(segment):
+    """구간을 단어 조각 목록으로 변환 (한국어 어미 변화에 덜 민감하도록 두 글자 단위로 자름)"""
+    terms = []
+    for word in re.findall(r'[^\W\d_]+', segment.lower()):
+        if len(word) < 2:
+            continue
+        terms.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return terms
+
+def tfidf_weights(segments):
+    """구간별 정규화 전 TF-IDF 가중치 행렬 (두 개 이상 구간에 나오는 조각만 사용)"""
+    segment_terms = [_terms(segment) for segment in segments]
+    
+    document_frequency = {}
+    for terms in segment_terms:
+        for term in set(terms):
+            document_frequency[term] = document_frequency.get(term, 0) + 1
+    vocabulary = {term: i for i, term in enumerate(
+        term for term, count in document_frequency.items() if count >= MIN_TERM_SEGMENTS)}
+    
+    matrix = np.zeros((len(segments), len(vocabulary)), dtype=np.float32)
+    for row, terms in enumerate(segment_terms):
+        columns = [vocabulary[term] for term in terms if term in vocabulary]
+        if columns:
+            np.add.at(matrix[row], columns, 1)
+    
+    # 로그 단어 빈도 x 역문서 빈도
+    counts = np.array([document_frequency[term] for term in vocabulary], dtype=np.float32)
+    return np.log1p(matrix) * (np.log((1 + len(segments)) / (1 + counts)) + 1)
+
+def tfidf_matrix(segments):
+    """구간별 TF-IDF 행렬 (행마다 L2 정규화)"""
+    return _normalize_rows(tfidf_weights(segments))
+
+def _normalize_rows(matrix):
+    """행마다 L2 정규화 (모두 0인 행은 그대로)"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+def textrank(similarity):
+    """구간 유사도 행렬로 TextRank 점수 계산 (점수 합은 1)"""
+    count = similarity.shape[0]
+    weights = similarity.copy()
+    np.fill_diagonal(weights, 0)
+    
+    # 다른 구간과 전혀 닮지 않은 구간은 모든 구간으로 고르게 이어지게 함
+    out_weights = weights.sum(axis=1, keepdims=True)
+    transition = np.divide(weights, out_weights, out=np.full_like(weights, 1 / count), where=out_weights > 0)
+    
+    scores = np.full(count, 1 / count, dtype=np.float64)
+    for _ in range(TEXTRANK_MAX_ITERATIONS):
+        updated = (1 - TEXTRANK_DAMPING) / count + TEXTRANK_DAMPING * (transition.T @ scores)
+        if np.abs(updated - scores).sum() < TEXTRANK_TOLERANCE:
+            return updated
+        scores = updated
+    return scores
+
+@lru_cache(maxsize=32)
+def rank_segments(segments):
+    """구간(튜플)별 정보량 점수 (TextRank와 TF-IDF 가중치 합을 각각 0~1로 맞춰 섞음)"""
+    if len(segments) < 2:
+        return tuple(1.0 for _ in segments)
+    
+    weights = tfidf_weights(segments)
+    matrix = _normalize_rows(weights)
+    centrality = textrank(matrix @ matrix.T)
+    
+    # 정규화 전 TF-IDF 합: 드문 단어가 많고 자주 나올수록 큼
+    information = weights.sum(axis=1, dtype=np.float64)
+    
+    def scale(values):
+        spread = values.max() - values.min()
+        return (values - values.min()) / spread if spread > 0 else np.ones_like(values)
+    
+    scores = TEXTRANK_WEIGHT * scale(centrality) + (1 - TEXTRANK_WEIGHT) * scale(information)
+    return tuple(float(score) for score in scores)
+
+def select_segments(segments, tokens, budget):
+    """예산 안에서 토큰 대비 점수가 높은 구간 번호를 원래 순서로 반환 (처음과 끝 구간은 이야기 흐름을 위해 먼저 포함)"""
+    scores = rank_segments(tuple(segments))
+    count = len(segments)
+    
+    # 긴 장면일수록 점수가 높게 나오므로 토큰 수의 제곱근으로 나눠 짧고 밀도 높은 장면도 고름
+    density = [score / max(token_count, 1) ** 0.5 for score, token_count in zip(scores, tokens)]
+    order = [0, count - 1] + sorted(range(1, count - 1), key=lambda i: (-density[i], i))
+    
+    selected = set()
+    used_tokens = 0
+    for i in order:
+        if i not in selected and used_tokens + tokens[i] <= budget:
+            selected.add(i)
+            used_tokens += tokens[i]
+    
+    return sorted(selected)
+
+if __name__ == "__main__":
+    # 선택 결과 확인: python scene_ranker.py 파일.pdf [예산 토큰]
+    from ai_analyzer import extract_text_from_pdf, prepare_script_text, split_script_segments
+    from llm_client import estimate_tokens
+    
+    text, _ = prepare_script_text(extract_text_from_pdf(sys.argv[1]))
+    budget = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    segments = split_script_segments(text, max(budget // 8, 1))
+    tokens = [estimate_tokens(segment) + 1 for segment in segments]
+    scores = rank_segments(tuple(segments))
+    
+    selected = select_segments(segments, tokens, budget)
+    print(f"구간 {len(segments)}개 중 {len(selected)}개 선택 (토큰 {sum(tokens[i] for i in selected):,}/{sum(tokens):,})")
+    for i in selected:
+        print(f"  [{i:3d}] {scores[i]:.2f} {segments[i][:60]}")
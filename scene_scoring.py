@@ -0,0 +1,210 @@
+import os
+import re
+import sys
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from db_schema import compact_sentiment_history, get_db_connection
+from scene_extraction import extract_text_from_pdf, split_scene_texts
+from llm_client import chat, estimate_tokens, route_model, set_call_context, reset_call_context
+from ai_analyzer import (AI_MAX_CONCURRENCY, _sentiment_label, _strict_object, _with_context, group_summaries,
+                         parse_json_response)
+
+# 장면 장르 (응답에는 번호로 받음)
+SCENE_GENRES = ("드라마", "로맨스", "코미디", "스릴러", "SF/판타지", "공포", "액션", "시대극", "뮤지컬")
+
+# 요청 하나에 넣을 장면 입력 토큰과 장면 수 상한
+SCENE_SCORE_BATCH_TOKENS = int(os.getenv("SCENE_SCORE_BATCH_TOKENS", 6000))
+SCENE_SCORE_BATCH_SIZE = 40
+
+# 장면 하나에서 점수를 매기는 데 쓰는 최대 토큰 (긴 장면은 앞부분만)
+SCENE_SCORE_SCENE_TOKENS = 400
+
+# 장면 하나의 응답에 필요한 출력 토큰 (짧은 키의 JSON 객체 하나)
+SCENE_SCORE_OUTPUT_TOKENS = 30
+
+# 출력 토큰 상한 여유 (공백·줄바꿈이 섞인 응답도 잘리지 않도록 배율과 고정 여유를 둠)
+SCENE_SCORE_OUTPUT_MARGIN = 1.5
+SCENE_SCORE_OUTPUT_OVERHEAD = 50
+
+# 잘린 응답에서 끝까지 받은 장면 객체 (중첩 없는 짧은 JSON 객체)
+SCENE_SCORE_ITEM_PATTERN = re.compile(r'\{[^{}]*\}')
+
+# 장면 점수 응답 스키마 (출력 토큰을 줄이려고 짧은 키와 장르 번호 사용)
+SCENE_SCORES_SCHEMA = _strict_object(
+    scores={"type": "array", "items": _strict_object(
+        i={"type": "integer", "description": "장면 앞의 [번호]"},
+        e={"type": "integer", "description": "주인공 감정 0~100 (0 매우 부정, 100 매우 긍정)"},
+        s={"type": "integer", "description": "두 번째 인물 감정 0~100"},
+        t={"type": "integer", "description": "긴박도 0~100"},
+        g={"type": "integer", "description": "장르 번호"})}
+)
+
+def _clip_scene(text, max_tokens=SCENE_SCORE_SCENE_TOKENS):
+    """점수 매기기에 쓸 장면 본문 (공백을 하나로 줄이고 너무 길면 앞부분만)"""
+    text = ' '.join(text.split())
+    tokens = estimate_tokens(text)
+    if tokens > max_tokens:
+        text = text[:len(text) * max_tokens // tokens]
+    return text
+
+def build_scene_scores_request(scenes, start):
+    """장면 묶음의 점수 요청 생성 (장면은 전체 목록 기준 [번호]로 표시)"""
+    genres = ", ".join(f"{i}={genre}" for i, genre in enumerate(SCENE_GENRES))
+    scene_lines = "\n".join(f"[{start + n}] {scene}" for n, scene in enumerate(scenes))
+    messages = [
+        {"role": "system", "content": "당신은 영화 시나리오의 장면별 감정과 긴박도를 수치로 평가하는 전문가입니다."},
+        {"role": "user", "content": f"""다음 장면마다 주인공 감정(e), 두 번째 인물 감정(s), 긴박도(t)를 0~100 정수로, 장르(g)를 번호 하나로 매겨 주세요.
+i에는 장면 앞의 [번호]를 그대로 적고, 모든 장면에 하나씩 답해 주세요.
+장르: {genres}
+
+{scene_lines}"""}
+    ]
+    
+    return {
+        "model": route_model("scene_scores", messages),
+        "messages": messages,
+        "temperature": 0,
+        "max_tokens": int(SCENE_SCORE_OUTPUT_TOKENS * len(scenes) * SCENE_SCORE_OUTPUT_MARGIN) + SCENE_SCORE_OUTPUT_OVERHEAD,
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": {"name": "scene_scores", "strict": True, "schema": SCENE_SCORES_SCHEMA}
+        }
+    }
+
+def _score_value(value):
+    """0~100 정수 점수로 변환 (숫자가 아니면 None)"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return max(0, min(100, int(value)))
+
+def _partial_scene_items(response):
+    """잘려서 JSON으로 읽히지 않는 응답에서 끝까지 받은 장면 객체만 추출"""
+    items = []
+    for match in SCENE_SCORE_ITEM_PATTERN.finditer(response or ""):
+        try:
+            items.append(json.loads(match.group(0)))
+        except json.JSONDecodeError:
+            continue
+    return items
+
+def parse_scene_scores(response, start, count):
+    """응답에서 장면 번호별 점수 추출 (범위 밖 번호와 값이 빠진 장면은 제외, 잘린 응답은 받은 장면까지만)"""
+    data = parse_json_response(response)
+    items = data.get("scores", []) if isinstance(data, dict) else _partial_scene_items(response)
+    
+    scores = {}
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get("i"), int):
+            continue
+        index = item["i"]
+        values = [_score_value(item.get(key)) for key in ("e", "s", "t")]
+        if not start <= index < start + count or None in values:
+            continue
+        genre = item.get("g")
+        scores[index] = {
+            "emotion": values[0],
+            "sub_emotion": values[1],
+            "tension": values[2],
+            "genre": SCENE_GENRES[genre] if isinstance(genre, int) and 0 <= genre < len(SCENE_GENRES) else ""
+        }
+    return scores
+
+def score_scenes(scenes, max_workers=None):
+    """장면 본문 목록을 여러 장면씩 묶어 점수 매김 (장면 순서대로 점수 딕셔너리, 응답에 빠진 장면은 None)"""
+    clipped = [_clip_scene(scene) for scene in scenes]
+    groups = group_summaries(clipped, SCENE_SCORE_BATCH_TOKENS, SCENE_SCORE_BATCH_SIZE)
+    
+    # 묶음마다 전체 목록 기준 시작 번호 (1부터)
+    starts = []
+    position = 1
+    for group in groups:
+        starts.append(position)
+        position += len(group)
+    
+    def score_group(group, start):
+        response = chat(stage="scene_scores", **build_scene_scores_request(group, start))
+        return parse_scene_scores(response, start, len(group))
+    
+    scores = {}
+    with ThreadPoolExecutor(max_workers=max_workers or AI_MAX_CONCURRENCY) as executor:
+        for group_scores in executor.map(_with_context(score_group), groups, starts):
+            scores.update(group_scores)
+    return [scores.get(i) for i in range(1, len(scenes) + 1)]
+
+def save_scene_scores(conn, movie_id, scene_ids, scores):
+    """장면별 점수를 sentiment_analysis에 한 번에 저장하고 오래된 기록 정리 (커밋은 호출한 쪽에서 수행)"""
+    now = time.time()
+    rows = []
+    for scene_id, score in zip(scene_ids, scores):
+        if score is None:
+            continue
+        # 주인공 감정 0~100을 전체 감정 분석과 같은 -1.0~1.0 범위로 변환
+        sentiment_score = round((score["emotion"] - 50) / 50, 2)
+        rows.append((movie_id, scene_id, sentiment_score, _sentiment_label(sentiment_score),
+                     json.dumps(score, ensure_ascii=False, separators=(",", ":")), now))
+    
+    cursor = conn.cursor()
+    cursor.executemany("""
+        INSERT INTO sentiment_analysis
+        (movie_id, scene_id, stage, sentiment_score, sentiment_label, sentiment_text, created_at)
+        VALUES (?, ?, 'scene', ?, ?, ?, ?)
+    """, rows)
+    compact_sentiment_history(cursor, movie_id)
+    return len(rows)
+
+def score_movie_scenes(movie_id, pdf_path=None, text=None, max_workers=None):
+    """영화의 장면별 감정과 긴박도를 매겨 장면 ID와 함께 저장 (저장된 장면만, 저장한 장면 수 반환)"""
+    # 이 작업에서 나가는 API 호출을 영화별로 기록
+    context_token = set_call_context(movie_id=movie_id)
+    try:
+        # 장면 테이블과 같은 방식으로 텍스트를 나눠 장면 번호로 장면 ID를 찾음
+        if text is None:
+            text = extract_text_from_pdf(pdf_path)
+        scenes = split_scene_texts(text)
+        
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT scene_number, scene_id FROM scenes WHERE movie_id = ?", (movie_id,))
+            scene_ids = dict(cursor.fetchall())
+            
+            # 장면 번호가 겹치면 장면 테이블처럼 처음 나온 장면만 사용
+            unique_scenes = {}
+            for scene in scenes:
+                if scene["scene_number"] in scene_ids:
+                    unique_scenes.setdefault(scene["scene_number"], scene)
+            scenes = list(unique_scenes.values())
+            
+            scores = score_scenes([scene["text"] for scene in scenes], max_workers)
+            saved = save_scene_scores(conn, movie_id, [scene_ids[scene["scene_number"]] for scene in scenes], scores)
+            conn.commit()
+        finally:
+            conn.close()
+        return saved
+    finally:
+        reset_call_context(context_token)
+
+def load_scene_scores(conn, movie_id):
+    """영화의 현재 장면별 점수를 장면 순서대로 조회"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT s.scene_number, s.heading, a.sentiment_score, a.sentiment_text
+        FROM sentiment_analysis a
+        JOIN scenes s ON s.scene_id = a.scene_id
+        WHERE a.movie_id = ? AND a.stage = 'scene' AND a.is_current = 1
+        ORDER BY s.scene_id
+    """, (movie_id,))
+    return [dict(json.loads(details), scene_number=scene_number, heading=heading, sentiment_score=sentiment_score)
+            for scene_number, heading, sentiment_score, details in cursor.fetchall()]
+
+if __name__ == "__main__":
+    # 장면별 감정/긴박도 곡선 생성: python scene_scoring.py 영화ID 파일.pdf
+    movie_id = int(sys.argv[1])
+    print(f"장면 {score_movie_scenes(movie_id, pdf_path=sys.argv[2])}개의 점수를 저장했습니다.")
+    
+    conn = get_db_connection()
+    for score in load_scene_scores(conn, movie_id):
+        print(f"  {score['scene_number']:>4} 감정 {score['emotion']:3d} 긴박도 {score['tension']:3d} "
+              f"{'#' * (score['tension'] // 5):<20} {score['genre']}")
+    conn.close()
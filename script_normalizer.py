@@ -0,0 +1,180 @@
+import re
+import sys
+from functools import lru_cache
+from collections import Counter
+
+# 페이지 구분 문자 (PDF 추출 시 페이지 사이에 넣음)
+PAGE_BREAK = "\f"
+
+# 이 비율 이상의 페이지 가장자리에서 반복되는 줄은 머리글/바닥글로 판단
+REPEATED_PAGE_RATIO = 0.5
+
+# 머리글/바닥글로 판단하는 최소 페이지 수
+MIN_REPEATED_PAGES = 3
+
+# 페이지 위/아래에서 머리글/바닥글을 찾는 최대 줄 수
+EDGE_LINES = 3
+
+# 줄 일부만 반복될 때 머리글/바닥글로 인정하는 최소 글자 수 (숫자 묶음은 한 글자로 셈)
+MIN_AFFIX_LENGTH = 3
+
+# 페이지 번호만 있는 줄: "12", "- 12 -", "12 / 80", "Page 12"
+PAGE_NUMBER_PATTERN = re.compile(r'^\s*(?:[-–—]?\s*(\d{1,4})\s*[-–—]?|(\d+)\s*/\s*\d+|page\s*(\d+))\s*$', re.IGNORECASE)
+
+# 페이지 번호로 인정하는 실제 페이지 위치와의 차이 (표지 등으로 번호가 밀린 경우)
+PAGE_NUMBER_TOLERANCE = 3
+
+# 페이지를 넘어가는 대사 표시 (괄호 없는 "계속"은 대사일 수 있으므로 제외)
+CONTINUED_PATTERN = re.compile(r"^\s*\(\s*(?:계속|CONT'?D|CONTINUED|MORE)\s*\)\s*$", re.IGNORECASE)
+
+# 장면 번호 여백: 헤딩 오른쪽에 같은 장면 번호가 한 번 더 찍힌 줄
+SCENE_GUTTER_PATTERN = re.compile(r'^(\s*(?:S\s*)?#?\s*(\d+)\s*[.)]?\s+\S.*?)\s+\2\s*$')
+
+# 페이지 구분 문자와 줄바꿈을 제외한 제어 문자
+CONTROL_CHAR_PATTERN = re.compile(r'[\x00-\x08\x0b\x0e-\x1f\x7f]')
+
+def _signature(line):
+    """줄 비교용 서명 (공백을 하나로, 숫자 묶음을 #으로)"""
+    return re.sub(r'\d+', '#', re.sub(r'\s+', ' ', line.strip()))
+
+def _signature_pattern(signature):
+    """서명을 원래 줄에 적용할 정규식 조각으로 변환"""
+    parts = []
+    for char in signature:
+        if char == '#':
+            parts.append(r'\d+')
+        elif char == ' ':
+            parts.append(r'\s+')
+        else:
+            parts.append(re.escape(char))
+    return ''.join(parts)
+
+def _common_prefix(signatures, min_pages):
+    """min_pages 이상의 페이지가 공유하는 가장 긴 앞부분 서명 (없으면 None)"""
+    best = None
+    max_length = max((len(signature) for signature in signatures), default=0)
+    
+    for length in range(1, max_length + 1):
+        counts = Counter(signature[:length] for signature in signatures if len(signature) >= length)
+        if not counts:
+            break
+        prefix, count = counts.most_common(1)[0]
+        if count < min_pages:
+            break
+        best = prefix
+    
+    if not best:
+        return None
+    
+    # 짧거나 글자, 숫자가 없는 앞부분은 본문일 수 있으므로 줄 전체가 같을 때만 인정
+    full_line = sum(1 for signature in signatures if signature == best) >= min_pages
+    if not full_line and (len(best) < MIN_AFFIX_LENGTH or not re.search(r'[^\W_]|#', best)):
+        return None
+    return best.rstrip()
+
+def _strip_edge(pages, min_pages, from_bottom):
+    """페이지 위(또는 아래) 가장자리에서 반복되는 머리글(바닥글)을 제거하고 찾은 서명 목록 반환"""
+    affixes = []
+    
+    for _ in range(EDGE_LINES):
+        index = -1 if from_bottom else 0
+        edge_pages = [lines for lines in pages if lines]
+        signatures = [_signature(lines[index]) for lines in edge_pages]
+        if from_bottom:
+            signatures = [signature[::-1] for signature in signatures]
+        
+        affix = _common_prefix(signatures, min_pages)
+        if not affix:
+            break
+        
+        # 바닥글은 뒤집은 서명에서 찾았으므로 다시 뒤집어 줄 끝에 맞춤
+        if from_bottom:
+            affix = affix[::-1].lstrip()
+            pattern = re.compile(r'\s*' + _signature_pattern(affix) + r'\s*$')
+        else:
+            pattern = re.compile(r'^\s*' + _signature_pattern(affix))
+        affixes.append(affix)
+        
+        matched = 0
+        for lines in edge_pages:
+            stripped = pattern.sub('', lines[index], count=1)
+            if stripped == lines[index]:
+                continue
+            matched += 1
+            if stripped.strip():
+                lines[index] = stripped
+            else:
+                lines.pop(index)
+        
+        if matched < min_pages:
+            break
+    
+    return affixes
+
+def _is_page_number(line, page_number):
+    """페이지 위치와 맞는 페이지 번호만 있는 줄인지 확인 (한 단어씩 줄바꿈된 본문의 숫자는 제외)"""
+    match = PAGE_NUMBER_PATTERN.match(line)
+    if not match:
+        return False
+    number = int(next(group for group in match.groups() if group))
+    return abs(number - page_number) <= PAGE_NUMBER_TOLERANCE
+
+def normalize_script_pages(pages):
+    """페이지별 텍스트에서 반복되는 머리글/바닥글과 레이아웃 잡음을 지우고 (정규화된 텍스트, 통계) 반환"""
+    page_lines = [[line for line in CONTROL_CHAR_PATTERN.sub(' ', page).split('\n') if line.strip()]
+                  for page in pages]
+    line_count = sum(len(lines) for lines in page_lines)
+    min_pages = max(MIN_REPEATED_PAGES, int(len(pages) * REPEATED_PAGE_RATIO))
+    
+    # 페이지 통계로 반복되는 머리글/바닥글 제거 (페이지가 적으면 판단하지 않음)
+    headers, footers = [], []
+    if len(pages) >= MIN_REPEATED_PAGES:
+        headers = _strip_edge(page_lines, min_pages, from_bottom=False)
+        footers = _strip_edge(page_lines, min_pages, from_bottom=True)
+    
+    # 가장자리의 페이지 번호, 대사 이어짐 표시, 장면 번호 여백 정리
+    noise_lines = 0
+    for page_number, lines in enumerate(page_lines, 1):
+        kept = []
+        for i, line in enumerate(lines):
+            at_edge = i < EDGE_LINES or i >= len(lines) - EDGE_LINES
+            if (at_edge and _is_page_number(line, page_number)) or CONTINUED_PATTERN.match(line):
+                noise_lines += 1
+                continue
+            kept.append(SCENE_GUTTER_PATTERN.sub(r'\1', line))
+        lines[:] = kept
+    
+    text = f"\n{PAGE_BREAK}\n".join('\n'.join(lines) for lines in page_lines)
+    return text, {
+        "pages": len(pages),
+        "lines": line_count,
+        "headers": headers,
+        "footers": footers,
+        "noise_lines_removed": noise_lines
+    }
+
+@lru_cache(maxsize=8)
+def normalize_script(text):
+    """PDF에서 추출한 스크립트 텍스트 정규화 후 (텍스트, 통계) 반환 (같은 텍스트는 다시 계산하지 않음)"""
+    return normalize_script_pages(text.split(PAGE_BREAK))
+
+def normalize_script_text(text):
+    """PDF에서 추출한 스크립트 텍스트 정규화"""
+    return normalize_script(text)[0]
+
+if __name__ == "__main__":
+    # 정규화 결과 확인: python script_normalizer.py 파일.pdf [파일.pdf ...]
+    from ai_analyzer import clean_script_text, extract_text_from_pdf
+    from llm_client import estimate_tokens
+    
+    for pdf_path in sys.argv[1:]:
+        raw_text = extract_text_from_pdf(pdf_path)
+        normalized_text, stats = normalize_script(raw_text)
+        before = estimate_tokens(clean_script_text(raw_text))
+        after = estimate_tokens(clean_script_text(normalized_text))
+        print(f"{pdf_path}: {stats['pages']}쪽, 잡음 {stats['noise_lines_removed']}줄 제거, 토큰 {before:,} -> {after:,} "
+              f"({before - after:,}개 절약, {(before - after) / max(before, 1) * 100:.1f}%)")
+        for affix in stats["headers"]:
+            print(f"  - 머리글: {affix}")
+        for affix in stats["footers"]:
+            print(f"  - 바닥글: {affix}")
@@ -0,0 +1,215 @@
+import re
+import html
+from scene_extraction import split_scene_texts
+
+# 검색 대상 종류
+SEARCH_SOURCES = {
+    "script": "대본",
+    "dialogue": "대사",
+    "scene": "장면 헤딩",
+    "summary": "AI 요약"
+}
+
+# 대사 패턴: "이름 : 대사" 형태
+DIALOGUE_PATTERN = re.compile(r'^\s*([가-힣a-zA-Z\s]{1,10}?)\s*:\s*(.+)$', re.MULTILINE)
+
+# 시나리오 대사 패턴: 이름(괄호 지시어 포함 가능)만 있는 줄 다음 줄이 대사
+SPEAKER_LINE_PATTERN = re.compile(r'^[ \t]*([가-힣]{2,8})[ \t]*(?:\([^)\n]{0,10}\))?[ \t]*\n[ \t]*(\S[^\n]*)$', re.MULTILINE)
+
+# 스니펫 강조 표시용 구분 문자 (HTML 이스케이프 후 <mark>로 변환)
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_END = "\x03"
+
+# trigram 토크나이저가 검색할 수 있는 최소 글자 수
+MIN_TRIGRAM_LENGTH = 3
+
+def _insert_documents(cursor, movie_id, source, documents):
+    """검색 문서 일괄 추가 (FTS 인덱스는 트리거로 갱신)"""
+    cursor.executemany("""
+        INSERT INTO search_documents (movie_id, source, ref, body)
+        VALUES (?, ?, ?, ?)
+    """, [(movie_id, source, ref, body) for ref, body in documents if body and body.strip()])
+
+def _delete_documents(cursor, movie_id, sources):
+    """영화의 특정 종류 검색 문서 삭제"""
+    placeholders = ", ".join("?" for _ in sources)
+    cursor.execute(f"""
+        DELETE FROM search_documents
+        WHERE movie_id = ? AND source IN ({placeholders})
+    """, (movie_id, *sources))
+
+def extract_dialogue_lines(text):
+    """스크립트에서 (화자, 대사) 목록 추출"""
+    # "이름 : 대사" 형식
+    dialogue_lines = [(m.group(1).strip(), m.group(2).strip())
+                      for m in DIALOGUE_PATTERN.finditer(text)
+                      if len(m.group(1).strip()) >= 2]
+    
+    # 이름 줄 다음에 대사가 오는 시나리오 형식
+    if not dialogue_lines:
+        dialogue_lines = [(m.group(1), m.group(2).strip())
+                          for m in SPEAKER_LINE_PATTERN.finditer(text)]
+    
+    return dialogue_lines
+
+def has_script_documents(conn, movie_id):
+    """영화의 대본 본문이 검색 인덱스에 있는지 확인"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM search_documents WHERE movie_id = ? AND source = 'script' LIMIT 1", (movie_id,))
+    return cursor.fetchone() is not None
+
+def index_movie_text(conn, movie_id, text):
+    """스크립트 본문과 대사를 검색 인덱스에 반영 (커밋은 호출한 쪽에서 수행)"""
+    cursor = conn.cursor()
+    _delete_documents(cursor, movie_id, ["script", "dialogue"])
+    
+    if not text:
+        return 0
+    
+    # 장면 단위 본문
+    scene_documents = [(scene["scene_number"], scene["text"]) for scene in split_scene_texts(text)]
+    _insert_documents(cursor, movie_id, "script", scene_documents)
+    
+    # 대사 한 줄 단위 (화자 이름을 참조값으로 저장)
+    dialogue_documents = extract_dialogue_lines(text)
+    _insert_documents(cursor, movie_id, "dialogue", dialogue_documents)
+    
+    return len(scene_documents) + len(dialogue_documents)
+
+def index_movie_scenes(conn, movie_id):
+    """씬 테이블의 헤딩과 장소를 검색 인덱스에 반영"""
+    cursor = conn.cursor()
+    _delete_documents(cursor, movie_id, ["scene"])
+    
+    cursor.execute("""
+        SELECT scene_number, heading, location
+        FROM scenes
+        WHERE movie_id = ?
+    """, (movie_id,))
+    
+    scene_documents = []
+    for scene_number, heading, location in cursor.fetchall():
+        body = heading or ""
+        if location and location not in body:
+            body = f"{body} {location}".strip()
+        scene_documents.append((scene_number, body))
+    
+    _insert_documents(cursor, movie_id, "scene", scene_documents)
+    return len(scene_documents)
+
+def index_movie_summary(conn, movie_id, summary):
+    """AI 요약을 검색 인덱스에 반영"""
+    cursor = conn.cursor()
+    _delete_documents(cursor, movie_id, ["summary"])
+    _insert_documents(cursor, movie_id, "summary", [("", summary)])
+
+def _build_match_query(terms):
+    """검색어를 FTS5 MATCH 구문으로 변환 (각 단어를 구문 검색, AND 결합)"""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+def _escape_like(term):
+    """LIKE 패턴의 와일드카드(%, _)와 이스케이프 문자를 일반 문자로 취급하도록 변환"""
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _build_where(query, sources):
+    """검색 조건절과 파라미터 생성"""
+    terms = query.split()
+    long_terms = [term for term in terms if len(term) >= MIN_TRIGRAM_LENGTH]
+    short_terms = [term for term in terms if len(term) < MIN_TRIGRAM_LENGTH]
+    
+    # 3글자 이상 단어는 FTS로 찾고, trigram이 찾지 못하는 짧은 단어는 FTS가 찾은 문서 안에서만 LIKE로 거름
+    # (모든 단어가 짧을 때만 전체 문서를 LIKE로 검색)
+    use_fts = bool(long_terms)
+    
+    conditions = []
+    params = []
+    if use_fts:
+        conditions.append("script_search MATCH ?")
+        params.append(_build_match_query(long_terms))
+    conditions.extend("d.body LIKE ? ESCAPE '\\'" for _ in short_terms)
+    params.extend(f"%{_escape_like(term)}%" for term in short_terms)
+    where = " AND ".join(conditions)
+    
+    if sources:
+        placeholders = ", ".join("?" for _ in sources)
+        where += f" AND d.source IN ({placeholders})"
+        params.extend(sources)
+    
+    return use_fts, where, params
+
+def _make_snippet(body, terms, width=80):
+    """LIKE 검색 결과용 스니펫 생성"""
+    lower_body = body.lower()
+    positions = [lower_body.find(term.lower()) for term in terms]
+    positions = [p for p in positions if p >= 0]
+    start = max(min(positions) - width // 2, 0) if positions else 0
+    
+    snippet = body[start:start + width]
+    for term in terms:
+        snippet = re.sub(re.escape(term), lambda m: f"{HIGHLIGHT_START}{m.group(0)}{HIGHLIGHT_END}",
+                         snippet, flags=re.IGNORECASE)
+    
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if start + width < len(body) else ""
+    return f"{prefix}{snippet}{suffix}"
+
+def snippet_to_html(snippet):
+    """강조 구분 문자가 들어간 스니펫을 HTML로 변환"""
+    escaped = html.escape(snippet).replace("\n", " ")
+    return escaped.replace(HIGHLIGHT_START, "<mark>").replace(HIGHLIGHT_END, "</mark>")
+
+def count_search_results(conn, query, sources=None):
+    """검색 결과 수 조회"""
+    if not query or not query.strip():
+        return 0
+    
+    use_fts, where, params = _build_where(query, sources)
+    from_clause = ("script_search JOIN search_documents d ON d.doc_id = script_search.rowid"
+                   if use_fts else "search_documents d")
+    
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT COUNT(*) FROM {from_clause} WHERE {where}", params)
+    return cursor.fetchone()[0]
+
+def search_scripts(conn, query, sources=None, limit=20, offset=0):
+    """검색어로 대본, 대사, 장면, 요약을 검색 (관련도 순)"""
+    if not query or not query.strip():
+        return []
+    
+    use_fts, where, params = _build_where(query, sources)
+    cursor = conn.cursor()
+    
+    if use_fts:
+        cursor.execute(f"""
+            SELECT d.movie_id, m.title, d.source, d.ref,
+                   snippet(script_search, 0, ?, ?, '…', 24) AS snippet,
+                   bm25(script_search) AS rank
+            FROM script_search
+            JOIN search_documents d ON d.doc_id = script_search.rowid
+            JOIN movies m ON m.movie_id = d.movie_id
+            WHERE {where}
+            ORDER BY rank
+            LIMIT ? OFFSET ?
+        """, [HIGHLIGHT_START, HIGHLIGHT_END, *params, limit, offset])
+        rows = cursor.fetchall()
+    else:
+        # 짧은 검색어는 문서 순서대로 반환
+        cursor.execute(f"""
+            SELECT d.movie_id, m.title, d.source, d.ref, d.body, 0 AS rank
+            FROM search_documents d
+            JOIN movies m ON m.movie_id = d.movie_id
+            WHERE {where}
+            ORDER BY d.movie_id, d.doc_id
+            LIMIT ? OFFSET ?
+        """, [*params, limit, offset])
+        terms = query.split()
+        rows = [row[:4] + (_make_snippet(row[4], terms), row[5]) for row in cursor.fetchall()]
+    
+    return [{
+        "movie_id": row[0],
+        "title": row[1],
+        "source": row[2],
+        "ref": row[3],
+        "snippet": row[4],
+        "rank": row[5]
+    } for row in rows]
@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+from db_schema import get_db_connection
+
+# 잠금 임대 시간 (초): 이 시간 안에 갱신하지 않은 실행은 멈춘 것으로 보고 다른 곳에서 이어받음
+SINGLE_FLIGHT_LEASE = float(os.getenv("SINGLE_FLIGHT_LEASE", 120))
+
+# 임대 갱신 간격 (초)
+SINGLE_FLIGHT_HEARTBEAT = SINGLE_FLIGHT_LEASE / 4
+
+# 다른 프로세스의 실행이 끝났는지 다시 확인하는 간격 (초)
+SINGLE_FLIGHT_POLL_INTERVAL = 1.0
+
+# 다른 연결이 쓰는 중일 때 기다리는 최대 시간 (밀리초)
+SINGLE_FLIGHT_BUSY_TIMEOUT = 30000
+
+# 이 프로세스에서 실행 중인 작업 ((내용 해시, 단계) -> 완료 이벤트와 결과)
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+def _connect():
+    """잠금 테이블용 데이터베이스 연결 (여러 프로세스가 동시에 쓰므로 잠금 대기 시간 설정)"""
+    conn = get_db_connection()
+    conn.execute(f"PRAGMA busy_timeout = {SINGLE_FLIGHT_BUSY_TIMEOUT}")
+    return conn
+
+def make_owner_id():
+    """호스트 이름, 프로세스 ID와 임의 값으로 잠금 소유자 ID 생성"""
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+def acquire_lock(content_hash, stage, owner, waited_owner=None):
+    """잠금을 얻으면 None, 다른 곳이 실행 중이면 (상태, 결과, 소유자) 반환 (끝난 결과는 waited_owner를 기다리던 요청에만 반환)"""
+    now = time.time()
+    conn = _connect()
+    try:
+        row = conn.execute("""
+            SELECT state, result, owner FROM analysis_locks
+            WHERE content_hash = ? AND stage = ?
+        """, (content_hash, stage)).fetchone()
+        if row and row[0] == "done" and waited_owner and row[2] == waited_owner:
+            return row
+        
+        # 다른 내용의 끝난 기록은 기다리는 요청이 모두 읽었을 만큼 지나면 정리
+        conn.execute("""
+            DELETE FROM analysis_locks
+            WHERE state != 'running' AND updated_at < ?
+        """, (now - SINGLE_FLIGHT_LEASE,))
+        
+        # 잠금이 없거나, 끝났거나, 실패했거나, 임대가 만료된 경우 이어받음
+        acquired = conn.execute("""
+            INSERT INTO analysis_locks (content_hash, stage, owner, state, lease_until, updated_at)
+            VALUES (?, ?, ?, 'running', ?, ?)
+            ON CONFLICT (content_hash, stage) DO UPDATE
+            SET owner = excluded.owner, state = 'running', lease_until = excluded.lease_until,
+                result = NULL, error = NULL, updated_at = excluded.updated_at
+            WHERE analysis_locks.state != 'running' OR analysis_locks.lease_until < ?
+            RETURNING owner
+        """, (content_hash, stage, owner, now + SINGLE_FLIGHT_LEASE, now, now)).fetchone()
+        conn.commit()
+        
+        if acquired:
+            return None
+        return conn.execute("""
+            SELECT state, result, owner FROM analysis_locks
+            WHERE content_hash = ? AND stage = ?
+        """, (content_hash, stage)).fetchone()
+    finally:
+        conn.close()
+
+def renew_lock(content_hash, stage, owner):
+    """잠금 임대 연장 (다른 곳이 이어받았으면 False)"""
+    conn = _connect()
+    cursor = conn.execute("""
+        UPDATE analysis_locks SET lease_until = ?, updated_at = ?
+        WHERE content_hash = ? AND stage = ? AND owner = ? AND state = 'running'
+    """, (time.time() + SINGLE_FLIGHT_LEASE, time.time(), content_hash, stage, owner))
+    conn.commit()
+    conn.close()
+    return cursor.rowcount > 0
+
+def release_lock(content_hash, stage, owner, result=None, error=None):
+    """실행 결과(또는 오류)를 기록하고 잠금 해제 (다른 곳이 이어받았으면 False)"""
+    conn = _connect()
+    cursor = conn.execute("""
+        UPDATE analysis_locks SET state = ?, result = ?, error = ?, updated_at = ?
+        WHERE content_hash = ? AND stage = ? AND owner = ?
+    """, ("failed" if error else "done", None if error else json.dumps(result, ensure_ascii=False),
+          error, time.time(), content_hash, stage, owner))
+    conn.commit()
+    conn.close()
+    return cursor.rowcount > 0
+
+def _run_with_lease(content_hash, stage, owner, func, args, kwargs):
+    """잠금을 주기적으로 연장하며 실행하고 결과를 기록"""
+    stop = threading.Event()
+    
+    def keep_lease():
+        while not stop.wait(SINGLE_FLIGHT_HEARTBEAT):
+            try:
+                if not renew_lock(content_hash, stage, owner):
+                    return
+            except sqlite3.OperationalError as e:
+                # 다른 연결이 오래 쓰는 중이면 다음 간격에 다시 연장
+                print(f"⚠️ 분석 잠금 연장 실패 ({stage}): {str(e)}")
+    
+    heartbeat = threading.Thread(target=keep_lease, daemon=True)
+    heartbeat.start()
+    try:
+        result = func(*args, **kwargs)
+    except Exception as e:
+        stop.set()
+        heartbeat.join()
+        release_lock(content_hash, stage, owner, error=str(e) or type(e).__name__)
+        raise
+    
+    stop.set()
+    heartbeat.join()
+    release_lock(content_hash, stage, owner, result=result)
+    return result
+
+def _run_across_processes(content_hash, stage, func, args, kwargs):
+    """다른 프로세스와 잠금 행으로 조율해 한 곳에서만 실행 ((결과, 다른 곳의 결과를 재사용했는지) 반환)"""
+    owner = make_owner_id()
+    
+    # 먼저 실행하던 곳이 실패하거나 멈추면 기다리던 곳이 잠금을 이어받아 직접 실행
+    waited_owner = None
+    while True:
+        row = acquire_lock(content_hash, stage, owner, waited_owner)
+        if row is None:
+            return _run_with_lease(content_hash, stage, owner, func, args, kwargs), False
+        
+        state, result, waited_owner = row
+        if state == "done":
+            return json.loads(result), True
+        
+        time.sleep(SINGLE_FLIGHT_POLL_INTERVAL)
+
+def run_single_flight(content_hash, stage, func, *args, **kwargs):
+    """같은 내용과 단계의 실행이 진행 중이면 기다렸다가 그 결과를 사용 ((결과, 재사용 여부) 반환, 이미 끝난 실행은 재사용하지 않음)"""
+    key = (content_hash, stage)
+    with _in_flight_lock:
+        entry = _in_flight.get(key)
+        leader = entry is None
+        if leader:
+            entry = _in_flight[key] = {"done": threading.Event(), "result": None, "error": None}
+    
+    # 같은 프로세스에서 먼저 시작한 실행을 기다림
+    if not leader:
+        entry["done"].wait()
+        if entry["error"]:
+            raise entry["error"]
+        return entry["result"], True
+    
+    try:
+        entry["result"], shared = _run_across_processes(content_hash, stage, func, args, kwargs)
+        return entry["result"], shared
+    except Exception as e:
+        entry["error"] = e
+        raise
+    finally:
+        with _in_flight_lock:
+            del _in_flight[key]
+        entry["done"].set()
@@ -1,13 +1,15 @@
+import os
 import streamlit as st
 import gspread
 import json
 import pandas as pd
-from openai import OpenAI
 from PyPDF2 import PdfReader
 from oauth2client.service_account import ServiceAccountCredentials
+from llm_client import chat
+from scene_scoring import score_scenes
 
-# ✅ GPT API 키 (Streamlit secrets에서 불러오기)
-client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+# ✅ GPT API 키 (Streamlit secrets에서 불러오기, 모델은 단계별 선택표에 따라 결정)
+os.environ.setdefault("OPENAI_API_KEY", st.secrets["OPENAI_API_KEY"])
 
 # ✅ Google Sheets 인증
 if "MOVIEANALYSIS_GSHEET" not in st.secrets:
@@ -35,29 +37,16 @@ JSON 형식으로, 다음 키로 구성해줘: 플롯번호, 요약문.
 시나리오:
 {full_text}
 """
-    response = client.chat.completions.create(
-        model="gpt-4",
+    return chat(
+        stage="plot_split",
         messages=[{"role": "user", "content": prompt}],
         temperature=0.3
     )
-    return response["choices"][0]["message"]["content"]
-
-# ✅ GPT로 각 플롯 분석
-def analyze_single_plot(scene):
-    def ask(subprompt):
-        res = client.chat.completions.create(
-            model="gpt-4",
-            messages=[{"role": "user", "content": subprompt}],
-            temperature=0
-        )
-        return res["choices"][0]["message"]["content"].strip()
-    
-    emotion = ask(f"다음 플롯의 주인공 감정을 0~100 숫자 하나로만 답해줘:\n{scene}")
-    sub_emotion = ask(f"다음 플롯의 인물2 감정을 0~100 숫자 하나로만 답해줘:\n{scene}")
-    tension = ask(f"다음 플롯의 긴박도를 0~100 숫자 하나로만 답해줘:\n{scene}")
-    genre = ask(f"다음 플롯의 장르를 아래 중 하나만 단어로 답해줘:\n[드라마, 로맨스, 코미디, 스릴러, SF/판타지, 공포, 액션, 시대극, 뮤지컬]\n{scene}")
-    
-    return emotion, sub_emotion, tension, genre
+
+# ✅ GPT로 플롯 분석 (모든 플롯의 감정, 긴박도, 장르를 한 번에 요청)
+def analyze_plots(summaries):
+    return [(score["emotion"], score["sub_emotion"], score["tension"], score["genre"]) if score else ("", "", "", "")
+            for score in score_scenes(summaries)]
 
 # ✅ Streamlit UI
 st.title("🎬 GPT 기반 영화 플롯 분석기")
@@ -78,13 +67,13 @@ if uploaded:
         st.error("GPT 응답을 JSON으로 변환하는 데 실패했습니다.")
         st.stop()
 
-    rows = []
-    for p in plots:
-        plot_num = p.get("플롯번호") or p.get("번호") or p.get("plot") or plots.index(p) + 1
-        summary = p.get("요약문") or p.get("내용") or p.get("summary")
-
-        emotion, sub, tension, genre = analyze_single_plot(summary)
+    plot_nums = [p.get("플롯번호") or p.get("번호") or p.get("plot") or plots.index(p) + 1 for p in plots]
+    # 요약이 빠진 플롯은 빈 문자열로 두고 점수 요청과 표시를 그대로 진행
+    summaries = [p.get("요약문") or p.get("내용") or p.get("summary") or "" for p in plots]
+    scores = analyze_plots(summaries)
 
+    rows = []
+    for plot_num, summary, (emotion, sub, tension, genre) in zip(plot_nums, summaries, scores):
         rows.append([
             movie_title,
             plot_num,
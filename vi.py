@@ -1,7 +1,6 @@
 import streamlit as st
 import os
 import time
-import json
 import pandas as pd
 import sqlite3
 from datetime import datetime
@@ -9,7 +8,13 @@ from db_schema import get_db_connection, init_database
 from character_extraction import process_character_data
 from scene_extraction import process_scene_data
 from data_uploader import process_single_file, list_movies, delete_movie_data
-from ai_analyzer import extract_text_from_pdf, process_ai_analysis
+from ai_analyzer import AI_STAGE_LABELS, format_character_analysis
+from llm_client import FALLBACK_MODELS, LLM_FALLBACK_WINDOW, estimate_cost, flush_llm_calls, model_health
+from job_queue import (JOB_POLL_INTERVAL, JOB_STATES, FINISHED_STATES, count_jobs, enqueue_job, get_job,
+                       get_jobs, store_job_file)
+from movie_snapshot import load_movie_snapshot, rebuild_movie_snapshot
+from search_index import SEARCH_SOURCES, count_search_results, search_scripts, snippet_to_html
+from db_maintenance import backup_database, open_backup_file, restore_database
 
 # 페이지 설정
 st.set_page_config(
@@ -116,6 +121,10 @@ if 'current_movie_id' not in st.session_state:
     st.session_state.current_movie_id = None
 if 'sentiment_analysis' not in st.session_state:
     st.session_state.sentiment_analysis = None
+if 'ai_job_id' not in st.session_state:
+    st.session_state.ai_job_id = None
+if 'batch_job_ids' not in st.session_state:
+    st.session_state.batch_job_ids = []
 
 # 데이터베이스 초기화 확인
 def check_and_init_database():
@@ -128,144 +137,18 @@ def check_and_init_database():
 
 # 영화 정보 가져오기
 def get_movie_data(movie_id):
-    """영화 ID로 영화 데이터 조회"""
+    """영화 ID로 영화 데이터 조회 (스냅샷 한 건 조회)"""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # 영화 정보 조회
-    cursor.execute("""
-        SELECT movie_id, title, filename, genre, theme, summary
-        FROM movies
-        WHERE movie_id = ?
-    """, (movie_id,))
-    
-    movie_data = cursor.fetchone()
-    
-    if not movie_data:
-        conn.close()
-        return None
-    
-    movie_dict = {
-        "movie_id": movie_data[0],
-        "title": movie_data[1],
-        "filename": movie_data[2],
-        "genre": movie_data[3],
-        "theme": movie_data[4],
-        "summary": movie_data[5]
-    }
-    
-    # 등장인물 조회
-    cursor.execute("""
-        SELECT character_id, name, count, description
-        FROM characters
-        WHERE movie_id = ?
-        ORDER BY count DESC
-    """, (movie_id,))
-    
-    characters = []
-    for row in cursor.fetchall():
-        characters.append({
-            "character_id": row[0],
-            "name": row[1],
-            "count": row[2],
-            "description": row[3] or ""
-        })
-    
-    # 씬 조회
-    cursor.execute("""
-        SELECT scene_id, scene_number, heading, location, setting, time_of_day
-        FROM scenes
-        WHERE movie_id = ?
-        ORDER BY scene_number
-    """, (movie_id,))
     
-    scenes = []
-    for row in cursor.fetchall():
-        scenes.append({
-            "scene_id": row[0],
-            "scene_number": row[1],
-            "heading": row[2],
-            "location": row[3],
-            "setting": row[4],
-            "time_of_day": row[5]
-        })
-    
-    # 감정 분석 조회
-    cursor.execute("""
-        SELECT sentiment_id, sentiment_score, sentiment_label, sentiment_text
-        FROM sentiment_analysis
-        WHERE movie_id = ?
-        ORDER BY sentiment_id DESC
-        LIMIT 1
-    """, (movie_id,))
-    
-    sentiment_row = cursor.fetchone()
-    sentiment = None
-    if sentiment_row:
-        sentiment = {
-            "sentiment_id": sentiment_row[0],
-            "sentiment_score": sentiment_row[1],
-            "sentiment_label": sentiment_row[2],
-            "details": json.loads(sentiment_row[3]) if sentiment_row[3] else {}
-        }
-    
-    # 줄거리 분석 조회
-    cursor.execute("""
-        SELECT plot_id, plot_element, plot_description, plot_order
-        FROM plot_analysis
-        WHERE movie_id = ?
-        ORDER BY plot_order
-    """, (movie_id,))
-    
-    plot_points = []
-    themes = []
-    
-    for row in cursor.fetchall():
-        if row[1].startswith("plot_point"):
-            plot_points.append({
-                "plot_id": row[0],
-                "description": row[2],
-                "order": row[3]
-            })
-        elif row[1].startswith("theme"):
-            themes.append({
-                "plot_id": row[0],
-                "description": row[2],
-                "order": row[3]
-            })
-    
-    # 관계 조회
-    cursor.execute("""
-        SELECT r.relationship_id, c1.name, c2.name, r.relationship_type
-        FROM relationships r
-        JOIN characters c1 ON r.character1_id = c1.character_id
-        JOIN characters c2 ON r.character2_id = c2.character_id
-        WHERE r.movie_id = ?
-    """, (movie_id,))
+    movie_data = load_movie_snapshot(conn, movie_id)
     
-    relationships = []
-    for row in cursor.fetchall():
-        relationships.append({
-            "relationship_id": row[0],
-            "character1": row[1],
-            "character2": row[2],
-            "relationship_type": row[3]
-        })
+    # 스냅샷이 아직 없으면 생성 후 저장
+    if movie_data is None:
+        movie_data = rebuild_movie_snapshot(conn, movie_id)
+        conn.commit()
     
     conn.close()
-    
-    # 결과 데이터 구성
-    result = {
-        "movie": movie_dict,
-        "characters": characters,
-        "scenes": scenes,
-        "sentiment": sentiment,
-        "plot_points": plot_points,
-        "themes": themes,
-        "relationships": relationships
-    }
-    
-    return result
+    return movie_data
 
 # 데이터베이스 내 영화 목록 가져오기
 def get_movie_list():
@@ -294,40 +177,36 @@ def get_movie_list():
 
 # 데이터베이스 통계 가져오기
 def get_db_stats():
-    """데이터베이스 통계 조회"""
+    """데이터베이스 통계 조회 (트리거로 유지되는 통계 테이블 사용)"""
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    # 영화 수
-    cursor.execute("SELECT COUNT(*) FROM movies")
-    movie_count = cursor.fetchone()[0]
-    
-    # 등장인물 수
-    cursor.execute("SELECT COUNT(*) FROM characters")
-    character_count = cursor.fetchone()[0]
-    
-    # 씬 수
-    cursor.execute("SELECT COUNT(*) FROM scenes")
-    scene_count = cursor.fetchone()[0]
+    # 영화, 등장인물, 씬 수
+    cursor.execute("""
+        SELECT movie_count, character_count, scene_count
+        FROM corpus_stats
+        WHERE stats_id = 1
+    """)
+    movie_count, character_count, scene_count = cursor.fetchone() or (0, 0, 0)
     
     # 최다 등장인물 영화
     cursor.execute("""
-        SELECT m.title, COUNT(c.character_id) as char_count
-        FROM movies m
-        JOIN characters c ON m.movie_id = c.movie_id
-        GROUP BY m.movie_id
-        ORDER BY char_count DESC
+        SELECT m.title, s.character_count
+        FROM movie_stats s
+        JOIN movies m ON m.movie_id = s.movie_id
+        WHERE s.character_count > 0
+        ORDER BY s.character_count DESC
         LIMIT 1
     """)
     most_characters = cursor.fetchone()
     
     # 최다 씬 영화
     cursor.execute("""
-        SELECT m.title, COUNT(s.scene_id) as scene_count
-        FROM movies m
-        JOIN scenes s ON m.movie_id = s.movie_id
-        GROUP BY m.movie_id
-        ORDER BY scene_count DESC
+        SELECT m.title, s.scene_count
+        FROM movie_stats s
+        JOIN movies m ON m.movie_id = s.movie_id
+        WHERE s.scene_count > 0
+        ORDER BY s.scene_count DESC
         LIMIT 1
     """)
     most_scenes = cursor.fetchone()
@@ -347,6 +226,179 @@ def delete_movie(movie_id):
     """영화 데이터를 데이터베이스에서 삭제"""
     return delete_movie_data(get_db_connection(), movie_id=movie_id)
 
+# 작업 상태 문구
+def describe_job(job):
+    """작업 상태를 화면 표시용 문구로 변환"""
+    if job["state"] == "failed":
+        return f"실패 ({job['error']})"
+    if job["state"] == "running" and job["stage"]:
+        return f"실행 중 ({AI_STAGE_LABELS.get(job['stage'], job['stage'])})"
+    if job["state"] == "queued" and job["attempts"]:
+        return f"재시도 대기 ({job['attempts']}/{job['max_attempts']}회 실패: {job['error']})"
+    return JOB_STATES[job["state"]]
+
+# AI 분석 작업 상태 표시
+def watch_ai_job(job_id):
+    """AI 분석 작업 상태를 주기적으로 조회해 표시하고 끝나면 결과를 세션에 반영"""
+    status_text = st.empty()
+    progress_bar = st.progress(0)
+    stage_placeholder = st.empty()
+    summary_placeholder = st.empty()
+    
+    while True:
+        job = get_job(job_id)
+        if job is None or job["state"] in FINISHED_STATES:
+            break
+        
+        if job["state"] == "queued":
+            status_text.markdown(f"<p class='processing-status'>AI 분석 {describe_job(job)}... (워커 실행: python job_queue.py --worker)</p>", unsafe_allow_html=True)
+        else:
+            status_text.markdown("<p class='processing-status'>AI 분석 중... (단계별 결과가 나오는 대로 표시됩니다)</p>", unsafe_allow_html=True)
+        
+        # 단계별 진행 상태와 작성 중인 요약 표시
+        stage_icons = {stage: {"start": "🔄", "done": "✅"}.get(job["progress"].get(stage), "⏳")
+                       for stage in AI_STAGE_LABELS}
+        done_count = sum(1 for icon in stage_icons.values() if icon == "✅")
+        progress_bar.progress(done_count / len(stage_icons))
+        stage_placeholder.markdown(" · ".join(f"{stage_icons[stage]} {label}"
+                                              for stage, label in AI_STAGE_LABELS.items()))
+        if job["partial"]:
+            summary_placeholder.markdown(f"**요약 (작성 중)**\n\n{job['partial']}")
+        
+        time.sleep(JOB_POLL_INTERVAL)
+    
+    # UI 정리
+    status_text.empty()
+    progress_bar.empty()
+    stage_placeholder.empty()
+    summary_placeholder.empty()
+    st.session_state.ai_job_id = None
+    
+    if job is None:
+        st.warning("AI 분석 작업을 찾을 수 없습니다.")
+    elif job["state"] == "done":
+        # 분석 결과 저장
+        result = job["result"]
+        st.session_state.summary = result["summary"]
+        st.session_state.character_analysis = result["character_analysis"]
+        st.session_state.character_tree = result["character_tree"]
+        st.session_state.structured_data = result["structured_data"]
+        st.session_state.sentiment_analysis = result["sentiment"]
+        st.session_state.analysis_complete = True
+        
+        # 페이지 새로고침
+        st.rerun()
+    else:
+        st.markdown(f"<p class='processing-status'>❌ 분석 실패! {job['error']}</p>", unsafe_allow_html=True)
+
+# 일괄 처리 작업 상태 표시
+def watch_batch_jobs(job_ids):
+    """일괄 처리 작업 상태를 주기적으로 조회해 표시하고 모두 끝나면 결과 표와 CSV 내보내기 표시"""
+    status_text = st.empty()
+    progress_bar = st.progress(0)
+    table_placeholder = st.empty()
+    
+    while True:
+        jobs = get_jobs(job_ids)
+        
+        # 기본 분석이 끝난 뒤 이어서 등록된 AI 분석 작업
+        follow_ups = get_jobs([job["result"]["ai_job_id"] for job in jobs.values() if job["result"].get("ai_job_id")])
+        
+        results = []
+        finished_count = 0
+        for job in (jobs[job_id] for job_id in job_ids if job_id in jobs):
+            if job["job_type"] == "basic":
+                basic_job = job
+                ai_job = follow_ups.get(job["result"].get("ai_job_id"))
+                ai_requested = job["payload"].get("run_ai") and job["state"] != "failed"
+                file_path = job["payload"]["file_path"]
+            else:
+                basic_job = None
+                ai_job = job
+                ai_requested = True
+                file_path = job["payload"]["pdf_path"]
+            
+            results.append({
+                "file": os.path.basename(file_path),
+                "basic_analysis": describe_job(basic_job) if basic_job else "건너뜀",
+                "ai_analysis": describe_job(ai_job) if ai_job else ("대기" if ai_requested else "건너뜀")
+            })
+            
+            # 기본 분석과 이어지는 AI 분석이 모두 끝난 파일
+            if job["state"] in FINISHED_STATES and (not ai_requested or (ai_job and ai_job["state"] in FINISHED_STATES)):
+                finished_count += 1
+        
+        total_files = len(results)
+        progress_bar.progress(finished_count / total_files if total_files else 1.0)
+        table_placeholder.dataframe(pd.DataFrame(results), use_container_width=True)
+        
+        if finished_count == total_files:
+            break
+        
+        status_text.markdown(f"<p class='processing-status'>처리 중... ({finished_count}/{total_files}, 워커 실행: python job_queue.py --worker)</p>", unsafe_allow_html=True)
+        time.sleep(JOB_POLL_INTERVAL)
+    
+    # 완료 표시
+    success_count = sum(1 for result in results
+                        if not result["basic_analysis"].startswith("실패") and not result["ai_analysis"].startswith("실패"))
+    status_text.markdown(f"<p class='processing-status'>✅ 처리 완료! {success_count}/{total_files} 파일 성공</p>", unsafe_allow_html=True)
+    
+    # CSV 내보내기
+    csv = pd.DataFrame(results).to_csv(index=False).encode('utf-8-sig')
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    st.download_button(
+        label="CSV로 처리 결과 내보내기",
+        data=csv,
+        file_name=f"batch_process_results_{timestamp}.csv",
+        mime='text/csv',
+        use_container_width=True
+    )
+
+# API 호출 기록 가져오기
+def get_llm_calls(days=None):
+    """최근 API 호출 기록을 영화 제목, 예상 비용과 함께 조회 (days가 없으면 전체)"""
+    since = time.time() - days * 86400 if days else 0
+    # 이 프로세스에서 아직 저장하지 않은 호출 기록도 포함
+    flush_llm_calls()
+    conn = get_db_connection()
+    calls = pd.read_sql_query("""
+        SELECT c.call_id, c.movie_id, COALESCE(m.title, '(영화 없음)') AS title,
+               COALESCE(c.stage, '-') AS stage, c.model, c.planned_tokens, c.prompt_tokens, c.completion_tokens,
+               c.latency, c.retries, c.cache_hit, c.error, c.created_at
+        FROM llm_calls c
+        LEFT JOIN movies m ON m.movie_id = c.movie_id
+        WHERE c.created_at >= ?
+    """, conn, params=(since,))
+    conn.close()
+    
+    calls["cost"] = [estimate_cost(model, prompt_tokens, completion_tokens)
+                     for model, prompt_tokens, completion_tokens
+                     in zip(calls["model"], calls["prompt_tokens"], calls["completion_tokens"])]
+    return calls
+
+# API 호출 기록 집계
+def summarize_llm_calls(calls, by):
+    """API 호출 기록을 그룹별 호출 수, 지연 시간(p50/p95, 캐시 적중 제외), 토큰, 비용으로 집계"""
+    summary = calls.groupby(by).agg(
+        호출=("call_id", "count"),
+        캐시적중=("cache_hit", "sum"),
+        재시도=("retries", "sum"),
+        오류=("error", "count"),
+        계획입력토큰=("planned_tokens", "sum"),
+        입력토큰=("prompt_tokens", "sum"),
+        출력토큰=("completion_tokens", "sum"),
+        비용=("cost", "sum")
+    )
+    
+    # 지연 시간 분포는 실제로 API를 호출한 경우만 계산
+    latency = calls[calls["cache_hit"] == 0].groupby(by)["latency"]
+    summary["p50(초)"] = latency.quantile(0.5)
+    summary["p95(초)"] = latency.quantile(0.95)
+    summary["총 대기(초)"] = latency.sum()
+    
+    summary.index.name = None
+    return summary.sort_values("비용", ascending=False).round({"비용": 4, "p50(초)": 2, "p95(초)": 2, "총 대기(초)": 1})
+
 # Mermaid 다이어그램 생성
 def generate_relationship_diagram(relationships, characters):
     """등장인물 관계를 Mermaid 다이어그램으로 생성"""
@@ -392,6 +444,8 @@ with st.sidebar:
         "대시보드",
         "스크립트 업로드 및 분석",
         "영화 목록 및 분석 결과",
+        "스크립트 검색",
+        "AI 사용량",
         "데이터베이스 관리"
     ]
     
@@ -411,6 +465,11 @@ with st.sidebar:
     with col3:
         st.markdown(f"<div class='stat-box'><div class='stat-value'>{stats['scene_count']}</div><div class='stat-label'>장면</div></div>", unsafe_allow_html=True)
     
+    # 분석 작업 대기열 상태
+    job_counts = count_jobs()
+    if job_counts["queued"] or job_counts["running"]:
+        st.caption(f"⏳ 분석 작업: 대기 {job_counts['queued']}개 · 실행 중 {job_counts['running']}개")
+    
     st.markdown("---")
     st.markdown("### 📊 분석 항목")
     st.markdown("""
@@ -576,50 +635,14 @@ elif selected_menu == "스크립트 업로드 및 분석":
                 # AI 분석 (요약, 관계, 감정 분석)
                 if st.session_state.current_movie_id:
                     if st.button("AI 분석 시작 (요약, 관계, 감정)", key="ai_analyze_button", use_container_width=True):
-                        # 진행 상태 표시 및 진행 상태바
-                        progress_placeholder = st.empty()
-                        status_text = st.empty()
-                        progress_bar = st.progress(0)
-                        
-                        # PDF 텍스트 추출
-                        status_text.markdown("<p class='processing-status'>PDF에서 텍스트 추출 중...</p>", unsafe_allow_html=True)
-                        
-                        # 임시 파일이 없으면 다시 저장
-                        if not os.path.exists("temp_script.pdf"):
-                            with open("temp_script.pdf", "wb") as f:
-                                f.write(uploaded_file.getvalue())
-                        
-                        # AI 분석 실행
-                        status_text.markdown("<p class='processing-status'>AI 분석 중... (몇 분 소요될 수 있습니다)</p>", unsafe_allow_html=True)
-                        progress_bar.progress(30)
-                        
-                        # AI 분석 실행
-                        result = process_ai_analysis(st.session_state.current_movie_id, pdf_path="temp_script.pdf")
-                        
-                        progress_bar.progress(100)
-                        
-                        # 완료 메시지
-                        if result["success"]:
-                            status_text.markdown("<p class='processing-status'>✅ AI 분석 완료!</p>", unsafe_allow_html=True)
-                            time.sleep(1)
-                            
-                            # 분석 결과 저장
-                            st.session_state.summary = result["summary"]
-                            st.session_state.character_analysis = result["character_analysis"]
-                            st.session_state.character_tree = result["character_tree"]
-                            st.session_state.structured_data = result["structured_data"]
-                            st.session_state.sentiment_analysis = result["sentiment"]
-                            st.session_state.analysis_complete = True
-                            
-                            # UI 정리
-                            status_text.empty()
-                            progress_bar.empty()
-                            progress_placeholder.empty()
-                            
-                            # 페이지 새로고침
-                            st.rerun()
-                        else:
-                            status_text.markdown(f"<p class='processing-status'>❌ 분석 실패! {result['message']}</p>", unsafe_allow_html=True)
+                        # 업로드 파일을 워커가 읽을 수 있는 위치에 저장하고 작업 등록
+                        movie_id = st.session_state.current_movie_id
+                        pdf_path = store_job_file(f"{movie_id}_{uploaded_file.name}", uploaded_file.getvalue())
+                        st.session_state.ai_job_id = enqueue_job("ai", movie_id, {"pdf_path": pdf_path})
+                    
+                    # AI 분석은 워커 프로세스에서 실행되므로 작업 상태만 조회해 표시 (새로고침해도 이어서 표시)
+                    if st.session_state.ai_job_id:
+                        watch_ai_job(st.session_state.ai_job_id)
                 else:
                     st.warning("먼저 기본 분석을 완료해야 AI 분석을 시작할 수 있습니다.")
     
@@ -668,102 +691,31 @@ elif selected_menu == "스크립트 업로드 및 분석":
                     if not run_basic and not run_ai:
                         st.error("최소한 하나의 분석 옵션을 선택해야 합니다.")
                     else:
-                        # 진행 상태 표시
-                        progress_placeholder = st.empty()
-                        status_text = st.empty()
-                        progress_bar = st.progress(0)
-                        
-                        total_files = len(selected_files)
-                        processed_count = 0
-                        success_count = 0
-                        
-                        # 결과 저장용 리스트
-                        results = []
-                        
-                        # 데이터베이스 연결
+                        # 파일마다 작업을 등록하고 워커가 처리 (AI 분석은 기본 분석이 끝나면 이어서 등록됨)
+                        job_ids = []
                         conn = get_db_connection()
+                        cursor = conn.cursor()
                         
-                        for i, file in enumerate(selected_files):
-                            # 진행 상태 업데이트
+                        for file in selected_files:
                             file_path = os.path.join(folder_path, file)
-                            status_text.markdown(f"<p class='processing-status'>처리 중: {file} ({i+1}/{total_files})</p>", unsafe_allow_html=True)
-                            progress_bar.progress((i) / total_files)
-                            
-                            try:
-                                # 기본 분석 실행
-                                if run_basic:
-                                    result = process_single_file(conn, file_path)
-                                    if not result:
-                                        results.append({
-                                            "file": file,
-                                            "basic_analysis": "실패",
-                                            "ai_analysis": "건너뜀"
-                                        })
-                                        continue
-                                
-                                # 영화 ID 가져오기
-                                cursor = conn.cursor()
-                                cursor.execute("SELECT movie_id FROM movies WHERE filename = ?", (file,))
-                                movie = cursor.fetchone()
-                                
-                                if not movie:
-                                    results.append({
-                                        "file": file,
-                                        "basic_analysis": "성공" if run_basic else "건너뜀",
-                                        "ai_analysis": "실패 (영화 ID 찾을 수 없음)"
-                                    })
-                                    continue
-                                
-                                movie_id = movie[0]
-                                
-                                # AI 분석 실행
-                                ai_result = "건너뜀"
-                                if run_ai:
-                                    ai_result_data = process_ai_analysis(movie_id, pdf_path=file_path)
-                                    ai_result = "성공" if ai_result_data["success"] else f"실패 ({ai_result_data['message']})"
-                                
-                                # 결과 저장
-                                results.append({
-                                    "file": file,
-                                    "basic_analysis": "성공" if run_basic else "건너뜀",
-                                    "ai_analysis": ai_result
-                                })
-                                
-                                success_count += 1
-                                
-                            except Exception as e:
-                                # 오류 발생 시
-                                results.append({
-                                    "file": file,
-                                    "basic_analysis": "오류",
-                                    "ai_analysis": "오류",
-                                    "error": str(e)
-                                })
+                            if run_basic:
+                                job_ids.append(enqueue_job("basic", payload={"file_path": file_path, "run_ai": run_ai}))
+                                continue
                             
-                            processed_count += 1
+                            # AI 분석만 하는 경우 기존 영화 ID로 바로 등록
+                            cursor.execute("SELECT movie_id FROM movies WHERE filename = ?", (file,))
+                            movie = cursor.fetchone()
+                            if movie:
+                                job_ids.append(enqueue_job("ai", movie[0], {"pdf_path": file_path}))
+                            else:
+                                st.warning(f"'{file}' 파일은 기본 분석 기록이 없어 AI 분석을 건너뜁니다.")
                         
-                        # 연결 닫기
                         conn.close()
-                        
-                        # 완료 표시
-                        progress_bar.progress(1.0)
-                        status_text.markdown(f"<p class='processing-status'>✅ 처리 완료! {success_count}/{total_files} 파일 성공</p>", unsafe_allow_html=True)
-                        
-                        # 결과 표시
-                        st.markdown("### 처리 결과")
-                        result_df = pd.DataFrame(results)
-                        st.dataframe(result_df, use_container_width=True)
-                        
-                        # CSV 내보내기
-                        csv = result_df.to_csv(index=False).encode('utf-8-sig')
-                        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                        st.download_button(
-                            label="CSV로 처리 결과 내보내기",
-                            data=csv,
-                            file_name=f"batch_process_results_{timestamp}.csv",
-                            mime='text/csv',
-                            use_container_width=True
-                        )
+                        st.session_state.batch_job_ids = job_ids
+                
+                # 등록된 일괄 처리 작업 상태 표시 (새로고침해도 이어서 표시)
+                if st.session_state.batch_job_ids:
+                    watch_batch_jobs(st.session_state.batch_job_ids)
             else:
                 st.warning(f"'{folder_path}' 폴더에 PDF 파일이 없습니다.")
         else:
@@ -861,7 +813,7 @@ elif selected_menu == "스크립트 업로드 및 분석":
         with tab2:
             # 등장인물 분석
             if st.session_state.character_analysis:
-                st.markdown(st.session_state.character_analysis)
+                st.markdown(format_character_analysis(st.session_state.character_analysis))
             else:
                 st.info("등장인물 분석 정보가 없습니다.")
         
@@ -1133,6 +1085,110 @@ elif selected_menu == "영화 목록 및 분석 결과":
                 else:
                     st.error("영화 데이터 삭제 중 오류가 발생했습니다.")
 
+# 스크립트 검색
+elif selected_menu == "스크립트 검색":
+    st.header("🔍 스크립트 검색")
+    
+    col1, col2 = st.columns([2, 1])
+    
+    with col1:
+        search_query = st.text_input("검색어 입력 (대사, 장소, 요약 내용 등)")
+    
+    with col2:
+        selected_sources = st.multiselect(
+            "검색 대상",
+            list(SEARCH_SOURCES.keys()),
+            default=list(SEARCH_SOURCES.keys()),
+            format_func=lambda source: SEARCH_SOURCES[source]
+        )
+    
+    if search_query.strip():
+        page_size = 20
+        
+        conn = get_db_connection()
+        start_time = time.time()
+        total_results = count_search_results(conn, search_query, selected_sources)
+        
+        if total_results == 0:
+            conn.close()
+            st.info("검색 결과가 없습니다.")
+        else:
+            # 페이지 선택
+            total_pages = (total_results + page_size - 1) // page_size
+            page = st.number_input(f"페이지 (총 {total_pages}페이지)", min_value=1, max_value=total_pages, value=1)
+            
+            search_results = search_scripts(conn, search_query, selected_sources,
+                                            limit=page_size, offset=(page - 1) * page_size)
+            elapsed_ms = (time.time() - start_time) * 1000
+            conn.close()
+            
+            st.caption(f"검색 결과 {total_results:,}건 ({elapsed_ms:.1f}ms)")
+            
+            # 검색 결과 표시
+            for item in search_results:
+                source_label = SEARCH_SOURCES.get(item['source'], item['source'])
+                ref_label = ""
+                if item['source'] in ("script", "scene") and item['ref']:
+                    ref_label = f" · 씬 {item['ref']}"
+                elif item['source'] == "dialogue" and item['ref']:
+                    ref_label = f" · {item['ref']}"
+                
+                st.markdown(f"**{item['title']}** <span style='color:#757575'>[{source_label}{ref_label}]</span>", unsafe_allow_html=True)
+                st.markdown(f"<div class='info-text'>{snippet_to_html(item['snippet'])}</div>", unsafe_allow_html=True)
+
+# AI 사용량
+elif selected_menu == "AI 사용량":
+    st.header("💰 AI 사용량")
+    
+    periods = {"최근 1일": 1, "최근 7일": 7, "최근 30일": 30, "전체": None}
+    period = st.selectbox("기간", list(periods.keys()), index=1)
+    calls = get_llm_calls(periods[period])
+    
+    if calls.empty:
+        st.info("기록된 API 호출이 없습니다.")
+    else:
+        api_calls = calls[calls["cache_hit"] == 0]
+        
+        # 요약 지표
+        col1, col2, col3, col4, col5 = st.columns(5)
+        with col1:
+            st.metric("호출 수", f"{len(calls):,}")
+        with col2:
+            st.metric("캐시 적중률", f"{calls['cache_hit'].mean() * 100:.1f}%")
+        with col3:
+            st.metric("토큰", f"{int(calls['prompt_tokens'].sum() + calls['completion_tokens'].sum()):,}")
+        with col4:
+            st.metric("예상 비용", f"${calls['cost'].sum():.4f}")
+        with col5:
+            st.metric("p95 지연", f"{api_calls['latency'].quantile(0.95):.2f}초" if not api_calls.empty else "-")
+        
+        # 단계별 집계
+        st.subheader("단계별")
+        stage_summary = summarize_llm_calls(calls, "stage")
+        st.dataframe(stage_summary, use_container_width=True)
+        st.bar_chart(stage_summary["비용"])
+        
+        # 모델별 집계와 현재 대체 모델 전환 여부 (최근 기록 기준)
+        st.subheader("모델별")
+        model_summary = summarize_llm_calls(calls, "model")
+        model_summary["상태"] = [
+            f"→ {FALLBACK_MODELS[model]} 전환 중" if model in FALLBACK_MODELS and model_health(model)["degraded"] else "정상"
+            for model in model_summary.index
+        ]
+        st.dataframe(model_summary, use_container_width=True)
+        st.caption(f"상태는 최근 {LLM_FALLBACK_WINDOW / 60:.0f}분 동안의 지연 시간과 오류 비율로 판단합니다.")
+        
+        # 영화별 집계
+        st.subheader("영화별")
+        st.dataframe(summarize_llm_calls(calls, "title"), use_container_width=True)
+        
+        # 최근 오류
+        errors = calls[calls["error"].notna()].sort_values("created_at", ascending=False).head(20)
+        if not errors.empty:
+            st.subheader("최근 오류")
+            errors = errors.assign(시각=pd.to_datetime(errors["created_at"], unit="s"))
+            st.dataframe(errors[["시각", "title", "stage", "model", "retries", "error"]], use_container_width=True)
+
 # 데이터베이스 관리
 elif selected_menu == "데이터베이스 관리":
     st.header("🗄️ 데이터베이스 관리")
@@ -1246,35 +1302,43 @@ elif selected_menu == "데이터베이스 관리":
         with col1:
             st.markdown("### 데이터베이스 백업")
             
+            compress_backup = st.checkbox("gzip으로 압축", value=True)
+            
             if st.button("📦 백업 파일 생성", use_container_width=True):
                 # 현재 시간 기반 파일명
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
                 backup_filename = f"scripts_backup_{timestamp}.db"
+                if compress_backup:
+                    backup_filename += ".gz"
                 
                 try:
-                    # 데이터베이스 파일 복사
-                    import shutil
-                    shutil.copy2("scripts.db", backup_filename)
+                    # SQLite 백업 API로 일관된 백업 생성 (페이지 단위 진행 상황 표시)
+                    backup_progress = st.progress(0)
+                    backup_size = backup_database(
+                        backup_filename,
+                        compress=compress_backup,
+                        progress=lambda copied, total: backup_progress.progress(copied / total)
+                    )
+                    backup_progress.empty()
                     
-                    # 다운로드 버튼 제공
-                    with open(backup_filename, "rb") as f:
-                        st.download_button(
-                            label="📥 백업 파일 다운로드",
-                            data=f.read(),
-                            file_name=backup_filename,
-                            mime="application/octet-stream",
-                            key="download_backup",
-                            use_container_width=True
-                        )
+                    # 다운로드 버튼 제공 (클릭 시 파일을 읽음)
+                    st.download_button(
+                        label="📥 백업 파일 다운로드",
+                        data=open_backup_file(backup_filename),
+                        file_name=backup_filename,
+                        mime="application/gzip" if compress_backup else "application/octet-stream",
+                        key="download_backup",
+                        use_container_width=True
+                    )
                     
-                    st.success(f"데이터베이스 백업이 생성되었습니다: {backup_filename}")
+                    st.success(f"데이터베이스 백업이 생성되었습니다: {backup_filename} ({backup_size / 1024 / 1024:.1f}MB)")
                 except Exception as e:
                     st.error(f"백업 생성 중 오류 발생: {str(e)}")
         
         with col2:
             st.markdown("### 데이터베이스 복원")
             
-            uploaded_db = st.file_uploader("백업 파일 업로드 (.db)", type=['db'])
+            uploaded_db = st.file_uploader("백업 파일 업로드 (.db, .gz)", type=['db', 'gz'])
             
             if uploaded_db is not None:
                 if st.button("🔄 데이터베이스 복원", use_container_width=True):
@@ -1283,15 +1347,14 @@ elif selected_menu == "데이터베이스 관리":
                         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
                         current_backup = f"scripts_before_restore_{timestamp}.db"
                         
-                        import shutil
                         if os.path.exists("scripts.db"):
-                            shutil.copy2("scripts.db", current_backup)
+                            backup_database(current_backup)
                         
-                        # 업로드된 파일로 교체
-                        with open("scripts.db", "wb") as f:
-                            f.write(uploaded_db.getvalue())
+                        # 임시 파일에서 검증 후 교체
+                        with st.spinner("백업 파일 검증 및 복원 중..."):
+                            restored_version = restore_database(uploaded_db)
                         
-                        st.success("데이터베이스가 성공적으로 복원되었습니다.")
+                        st.success(f"데이터베이스가 성공적으로 복원되었습니다. (스키마 버전 {restored_version})")
                         st.info("변경사항을 확인하려면 페이지를 새로고침하세요.")
                     except Exception as e:
                         st.error(f"데이터베이스 복원 중 오류 발생: {str(e)}")
@@ -1309,8 +1372,7 @@ elif selected_menu == "데이터베이스 관리":
                     # 기존 파일 백업
                     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
                     if os.path.exists("scripts.db"):
-                        import shutil
-                        shutil.copy2("scripts.db", f"scripts_backup_before_init_{timestamp}.db")
+                        backup_database(f"scripts_backup_before_init_{timestamp}.db")
                         os.remove("scripts.db")
                     
                     # 새 데이터베이스 초기화